@@ -1,6 +1,13 @@
 # auth.py
 from flask import Blueprint, request, jsonify, session
+import hmac
+import math
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
 import bcrypt
 
 from database import get_db_cursor  # usa o contextmanager do teu database.py
@@ -13,11 +20,155 @@ auth_bp = Blueprint("auth", __name__)
 ADMIN_USER = os.getenv("ADMIN_USER", "Adminis")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "s3cr3ty")  # texto puro mesmo
 
+# -----------------------------------------------------
+# BCRYPT: custo e pool limitado de verificação
+# -----------------------------------------------------
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_FILA = int(os.getenv("AUTH_FILA", "16"))          # verificações esperando além das em curso
+AUTH_TIMEOUT = float(os.getenv("AUTH_TIMEOUT", "10"))  # segundos
+
+# -----------------------------------------------------
+# LIMITE DE TENTATIVAS (falhas, janela deslizante, por processo)
+# -----------------------------------------------------
+LOGIN_MAX_FALHAS_USUARIO = int(os.getenv("LOGIN_MAX_FALHAS_USUARIO", "5"))
+LOGIN_JANELA_USUARIO = int(os.getenv("LOGIN_JANELA_USUARIO", "900"))
+LOGIN_MAX_FALHAS_IP = int(os.getenv("LOGIN_MAX_FALHAS_IP", "30"))
+LOGIN_JANELA_IP = int(os.getenv("LOGIN_JANELA_IP", "300"))
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_vagas = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_FILA)
+
+
+class AutenticacaoOcupada(Exception):
+    """Pool de verificação de senha cheio: melhor recusar do que enfileirar sem limite"""
+
+
+def _no_pool(fn, *args):
+    """
+    Roda fn (bcrypt) no pool limitado. A thread da requisição só espera o
+    resultado; se já houver verificações demais em curso/na fila, recusa na hora.
+    """
+    if not _bcrypt_vagas.acquire(blocking=False):
+        raise AutenticacaoOcupada()
+    try:
+        futuro = _bcrypt_pool.submit(fn, *args)
+    except Exception:
+        _bcrypt_vagas.release()
+        raise
+    # a vaga só volta quando o trabalho termina de fato (mesmo após timeout)
+    futuro.add_done_callback(lambda _: _bcrypt_vagas.release())
+    try:
+        return futuro.result(timeout=AUTH_TIMEOUT)
+    except FuturesTimeout:
+        raise AutenticacaoOcupada()
+
+
+class LimiteTentativas:
+    """
+    Conta falhas por chave numa janela deslizante; acima do máximo, bloqueia.
+    Guarda no máximo MAX_CHAVES chaves: passando disso, esquece as que falharam
+    há mais tempo (chaves aleatórias de um ataque não fazem o dict crescer).
+    """
+
+    MAX_CHAVES = 10000
+
+    def __init__(self, maximo, janela):
+        self.maximo = maximo
+        self.janela = janela
+        self._falhas = OrderedDict()  # chave -> deque de instantes (monotonic); última falha no fim
+        self._lock = threading.Lock()
+
+    def _podar(self, fila, agora):
+        while fila and fila[0] <= agora - self.janela:
+            fila.popleft()
+
+    def bloqueado_por(self, chave):
+        """Segundos até a chave voltar a poder tentar (0 = liberada)"""
+        agora = time.monotonic()
+        with self._lock:
+            fila = self._falhas.get(chave)
+            if not fila:
+                return 0
+            self._podar(fila, agora)
+            if not fila:
+                del self._falhas[chave]
+                return 0
+            if len(fila) < self.maximo:
+                return 0
+            return max(1, math.ceil(fila[0] + self.janela - agora))
+
+    def registrar_falha(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            fila = self._falhas.setdefault(chave, deque())
+            self._falhas.move_to_end(chave)
+            fila.append(agora)
+            self._podar(fila, agora)
+            while len(fila) > self.maximo:
+                fila.popleft()
+            while len(self._falhas) > self.MAX_CHAVES:
+                self._falhas.popitem(last=False)
+
+    def limpar(self, chave):
+        with self._lock:
+            self._falhas.pop(chave, None)
+
+
+_limite_usuario = LimiteTentativas(LOGIN_MAX_FALHAS_USUARIO, LOGIN_JANELA_USUARIO)
+_limite_ip = LimiteTentativas(LOGIN_MAX_FALHAS_IP, LOGIN_JANELA_IP)
+
 
 def _is_bcrypt_hash(value: str) -> bool:
     return isinstance(value, str) and value.startswith("$2")
 
 
+def _precisa_rehash(password_db: str) -> bool:
+    """Senha em texto puro (legado) ou bcrypt com custo diferente do configurado"""
+    if not _is_bcrypt_hash(password_db):
+        return True
+    try:
+        return int(password_db.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+def _hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def _rehash(user_id, password: str, password_db: str):
+    """Regrava a senha com o custo atual; falhar aqui não impede o login"""
+    try:
+        novo = _no_pool(_hash_password, password)
+        with get_db_cursor(commit=True) as cursor:
+            # só troca se ninguém mudou a senha no meio tempo
+            cursor.execute(
+                "UPDATE usuarios SET senha = %s WHERE id = %s AND senha = %s",
+                (novo, user_id, password_db)
+            )
+    except Exception as e:
+        print(f"⚠️ Não foi possível atualizar o hash da senha do usuário {user_id}: {e}")
+
+
+def _muitas_tentativas(segundos):
+    resp = jsonify({"status": "error",
+                    "message": "Muitas tentativas de login. Tente novamente mais tarde."})
+    resp.headers["Retry-After"] = str(segundos)
+    return resp, 429
+
+
+def _chave_usuario(username, ip):
+    # por (usuário, IP): errar a senha de um voluntário de outra máquina não o bloqueia
+    return (username.lower(), ip)
+
+
+def _falha(username, ip, mensagem):
+    _limite_usuario.registrar_falha(_chave_usuario(username, ip))
+    _limite_ip.registrar_falha(ip)
+    return jsonify({"status": "error", "message": mensagem}), 401
+
+
 def _check_password(password_input: str, password_db: str) -> bool:
     """
     - Se senha_db for bcrypt ($2b$...), valida com bcrypt
@@ -32,7 +183,7 @@ def _check_password(password_input: str, password_db: str) -> bool:
                 password_input.encode("utf-8"),
                 password_db.encode("utf-8")
             )
-        return password_input == password_db
+        return hmac.compare_digest(password_input.encode("utf-8"), password_db.encode("utf-8"))
     except Exception:
         return False
 
@@ -47,17 +198,26 @@ def login():
     if not username or not password:
         return jsonify({"status": "error", "message": "Informe usuário e senha."}), 400
 
+    # bloqueio checado ANTES do bcrypt: força bruta não chega a gastar CPU
+    ip = request.remote_addr or "?"
+    espera = max(_limite_usuario.bloqueado_por(_chave_usuario(username, ip)),
+                 _limite_ip.bloqueado_por(ip))
+    if espera:
+        return _muitas_tentativas(espera)
+
     # -----------------------------------------------------
     # 1) Tenta autenticar pelo BANCO (usuarios)
-    #    Aceita login por nome OU email
+    #    Aceita login por nome OU email (cada ramo usa o seu índice)
     # -----------------------------------------------------
     try:
         with get_db_cursor() as cursor:
             cursor.execute(
                 """
-                SELECT id, nome, email, senha, tipo_usuario, ativo
-                FROM usuarios
-                WHERE nome = %s OR email = %s
+                (SELECT id, nome, email, senha, tipo_usuario, ativo
+                 FROM usuarios WHERE nome = %s LIMIT 1)
+                UNION ALL
+                (SELECT id, nome, email, senha, tipo_usuario, ativo
+                 FROM usuarios WHERE email = %s LIMIT 1)
                 LIMIT 1
                 """,
                 (username, username)
@@ -66,11 +226,22 @@ def login():
 
         if user:
             if int(user.get("ativo") or 0) != 1:
-                return jsonify({"status": "error", "message": "Usuário inativo."}), 401
+                return _falha(username, ip, "Usuário inativo.")
 
             senha_db = user.get("senha") or ""
-            if not _check_password(password, senha_db):
-                return jsonify({"status": "error", "message": "Senha inválida."}), 401
+            try:
+                ok = _no_pool(_check_password, password, senha_db)
+            except AutenticacaoOcupada:
+                resp = jsonify({"status": "error",
+                                "message": "Muitos logins ao mesmo tempo. Tente novamente em instantes."})
+                resp.headers["Retry-After"] = "2"
+                return resp, 503
+            if not ok:
+                return _falha(username, ip, "Senha inválida.")
+
+            _limite_usuario.limpar(_chave_usuario(username, ip))
+            if _precisa_rehash(senha_db):
+                _rehash(user["id"], password, senha_db)
 
             # ✅ sessão para liberar /app e rotas protegidas
             session["logado"] = True
@@ -92,10 +263,12 @@ def login():
     # 2) Fallback ADMIN (ambiente) — emergência
     # -----------------------------------------------------
     if username != ADMIN_USER:
-        return jsonify({"status": "error", "message": "Usuário inválido."}), 401
+        return _falha(username, ip, "Usuário inválido.")
+
+    if not hmac.compare_digest(password.encode("utf-8"), ADMIN_PASSWORD.encode("utf-8")):
+        return _falha(username, ip, "Senha incorreta.")
 
-    if password != ADMIN_PASSWORD:
-        return jsonify({"status": "error", "message": "Senha incorreta."}), 401
+    _limite_usuario.limpar(_chave_usuario(username, ip))
 
     session["logado"] = True
     session["user_id"] = 1
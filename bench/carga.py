@@ -0,0 +1,252 @@
+# bench/carga.py
+"""
+Teste de carga do app Flask real (routes.app) contra a base semeada por bench.seed.
+
+    python -m bench.carga --clientes 20 --duracao 60
+    python -m bench.carga --clientes 20 --duracao 60 --salvar          # grava baseline do commit atual
+    python -m bench.carga --clientes 20 --duracao 60 --comparar        # compara com o último baseline
+
+Cada cliente é uma thread com sessão própria (login em /api/login) fazendo uma
+mistura ponderada de leituras e escritas. Relata p50/p95/p99, vazão e consultas
+por requisição (lidas do header Server-Timing). Sai com código 1 se --comparar
+encontrar regressão acima da tolerância.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+from bench.seed import SENHA_BENCH, USUARIO_BENCH
+
+BASELINES = Path(__file__).resolve().parent / "baselines"
+
+def _get(url):
+    return lambda c, rng, estado: c.get(url(rng, estado) if callable(url) else url)
+
+
+def _buscar(rng, estado):
+    return f"/buscar-familias?q={rng.choice(['maria', 'jose silva', 'joao', 'ana', '123', 'santos'])}"
+
+
+def _entregas(rng, estado):
+    if rng.random() < 0.3:
+        return f"/listar-entregas?familia={rng.randint(estado['id_min'], estado['id_max'])}"
+    return "/listar-entregas"
+
+
+def _cadastrar(c, rng, estado):
+    n = next(estado["seq"])
+    return c.post("/cadastrar-familia", json={
+        "responsavelNome": f"Bench {n}",
+        "responsavelCPF": f"9{os.getpid() % 1000:03d}{n:07d}",
+        "responsavelNascimento": "1980-05-10",
+        "responsavelGenero": "feminino",
+        "responsavelEndereco": "Rua do Benchmark, 1, Centro",
+        "numeroPessoas": rng.randint(1, 6),
+    })
+
+
+def _entrega(c, rng, estado):
+    return c.post("/registrar-entrega", json={
+        "familiaEntrega": rng.randint(estado["id_min"], estado["id_max"]),
+        "dataEntrega": date.today().isoformat(),
+        "quantidadeCestas": 1,
+        "responsavelEntrega": "bench",
+        "forcar": True,  # mede o registro, não a recusa de família já atendida no mês
+    })
+
+
+def _entrada(c, rng, estado):
+    return c.post("/registrar-entrada-estoque", json={
+        "quantidade": rng.randint(10, 100), "fornecedor": "Benchmark", "observacoes": None,
+    })
+
+
+# (peso, nome, função(cliente, rng, estado) -> response)
+MISTURA = [
+    (25, "GET /dashboard-data", _get("/dashboard-data")),
+    (20, "GET /buscar-familias?q", _get(_buscar)),
+    (10, "GET /buscar-familias", _get("/buscar-familias")),
+    (15, "GET /listar-entregas", _get(_entregas)),
+    (10, "GET /movimentacoes-estoque", _get("/movimentacoes-estoque")),
+    (5, "GET /saldo-estoque", _get("/saldo-estoque")),
+    (8, "POST /registrar-entrega", _entrega),
+    (4, "POST /cadastrar-familia", _cadastrar),
+    (3, "POST /registrar-entrada-estoque", _entrada),
+]
+
+_CONSULTAS_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) consultas"')
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[k]
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "desconhecido"
+
+
+def rodar(app, clientes, duracao, aquecimento, semente):
+    import database
+
+    with database.get_db_cursor() as cursor:
+        cursor.execute("SELECT MIN(id) AS a, MAX(id) AS b FROM familias_cestas")
+        faixa = cursor.fetchone()
+    estado = {"id_min": faixa["a"] or 1, "id_max": faixa["b"] or 1,
+              "seq": itertools.count(int(time.time()) % 100_000 * 10)}
+
+    pesos = [p for p, _, _ in MISTURA]
+    amostras = defaultdict(list)   # nome -> [(latência, consultas, status)]
+    lock = threading.Lock()
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+
+    def cliente(n):
+        rng = random.Random(semente + n)
+        c = app.test_client()
+        r = c.post("/api/login", json={"username": USUARIO_BENCH, "password": SENHA_BENCH})
+        if r.status_code != 200:
+            raise SystemExit(f"Login do benchmark falhou ({r.status_code}). Rodou bench.seed?")
+
+        while True:
+            agora = time.perf_counter()
+            if agora >= fim:
+                return
+            _, nome, acao = rng.choices(MISTURA, weights=pesos)[0]
+            t0 = time.perf_counter()
+            resp = acao(c, rng, estado)
+            resp.get_data()  # consome respostas em streaming
+            latencia = time.perf_counter() - t0
+            if t0 < inicio_medicao:
+                continue
+            m = _CONSULTAS_RE.search(resp.headers.get("Server-Timing", ""))
+            with lock:
+                amostras[nome].append((latencia, int(m.group(1)) if m else None, resp.status_code))
+
+    threads = [threading.Thread(target=cliente, args=(i,), daemon=True) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    resultado = {"commit": _commit_atual(), "clientes": clientes, "duracao": duracao,
+                 "endpoints": {}}
+    total = 0
+    for nome, lista in sorted(amostras.items()):
+        lat = [x[0] * 1000 for x in lista]
+        consultas = [x[1] for x in lista if x[1] is not None]
+        erros = sum(1 for x in lista if x[2] >= 500)
+        total += len(lista)
+        resultado["endpoints"][nome] = {
+            "n": len(lista),
+            "rps": len(lista) / duracao,
+            "p50_ms": _percentil(lat, 50),
+            "p95_ms": _percentil(lat, 95),
+            "p99_ms": _percentil(lat, 99),
+            "consultas_por_req": sum(consultas) / len(consultas) if consultas else None,
+            "erros_5xx": erros,
+        }
+    resultado["rps_total"] = total / duracao
+    return resultado
+
+
+def imprimir(resultado, base=None):
+    print(f"\nCommit {resultado['commit']} — {resultado['clientes']} clientes, "
+          f"{resultado['duracao']}s, {resultado['rps_total']:.1f} req/s")
+    print(f"{'endpoint':34} {'n':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'cons/req':>8} {'5xx':>4}")
+    for nome, e in resultado["endpoints"].items():
+        cons = f"{e['consultas_por_req']:.1f}" if e["consultas_por_req"] is not None else "-"
+        linha = (f"{nome:34} {e['n']:>6} {e['rps']:>7.1f} {e['p50_ms']:>7.1f}ms "
+                 f"{e['p95_ms']:>7.1f}ms {e['p99_ms']:>7.1f}ms {cons:>8} {e['erros_5xx']:>4}")
+        if base and nome in base["endpoints"]:
+            anterior = base["endpoints"][nome]["p95_ms"]
+            if anterior:
+                linha += f"  p95 {(e['p95_ms'] / anterior - 1) * 100:+.0f}%"
+        print(linha)
+
+
+def comparar(resultado, base, tolerancia):
+    regressoes = []
+    for nome, e in resultado["endpoints"].items():
+        anterior = base["endpoints"].get(nome)
+        if not anterior or not anterior["p95_ms"]:
+            continue
+        if e["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {anterior['p95_ms']:.1f}ms -> {e['p95_ms']:.1f}ms")
+        if (e["consultas_por_req"] or 0) > (anterior["consultas_por_req"] or 0) + 0.5:
+            regressoes.append(f"{nome}: consultas/req {anterior['consultas_por_req']:.1f} "
+                              f"-> {e['consultas_por_req']:.1f}")
+    return regressoes
+
+
+def ultimo_baseline(exceto=None):
+    arquivos = sorted(BASELINES.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    arquivos = [a for a in arquivos if a.stem != exceto]
+    return json.loads(arquivos[-1].read_text()) if arquivos else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga do app")
+    parser.add_argument("--clientes", type=int, default=10)
+    parser.add_argument("--duracao", type=float, default=30, help="Segundos de medição")
+    parser.add_argument("--aquecimento", type=float, default=5)
+    parser.add_argument("--semente", type=int, default=7)
+    parser.add_argument("--salvar", action="store_true", help="Grava bench/baselines/<commit>.json")
+    parser.add_argument("--comparar", nargs="?", const="ultimo", metavar="COMMIT",
+                        help="Compara com o baseline do commit (padrão: o mais recente)")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Aumento de p95 aceito antes de acusar regressão (padrão: 20%%)")
+    args = parser.parse_args(argv)
+
+    from routes import create_app
+
+    resultado = rodar(create_app(), args.clientes, args.duracao, args.aquecimento, args.semente)
+
+    base = None
+    if args.comparar:
+        if args.comparar == "ultimo":
+            base = ultimo_baseline(exceto=resultado["commit"])
+        else:
+            caminho = BASELINES / f"{args.comparar}.json"
+            base = json.loads(caminho.read_text()) if caminho.exists() else None
+        if base is None:
+            print("⚠️  Nenhum baseline para comparar.")
+
+    imprimir(resultado, base)
+
+    if args.salvar:
+        BASELINES.mkdir(exist_ok=True)
+        destino = BASELINES / f"{resultado['commit']}.json"
+        destino.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+        print(f"\nBaseline salvo em {destino}")
+
+    if base:
+        regressoes = comparar(resultado, base, args.tolerancia)
+        if regressoes:
+            print(f"\n❌ Regressões em relação a {base['commit']}:")
+            for r in regressoes:
+                print(f"  - {r}")
+            return 1
+        print(f"\n✅ Sem regressões em relação a {base['commit']}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# bench/seed.py
+"""
+Popula um MySQL/MariaDB LOCAL com volumes realistas para o benchmark.
+
+    python -m bench.seed --familias 100000 --entregas 1000000
+
+Usa as variáveis DB_* de sempre. Recusa rodar se a base já tiver famílias,
+a não ser com --limpar (que APAGA os dados das tabelas do sistema).
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import bcrypt
+
+import database
+import migrador
+
+NOMES = ["Maria", "José", "Ana", "João", "Antônio", "Francisca", "Carlos", "Paulo",
+         "Adriana", "Juliana", "Márcia", "Luiz", "Fernanda", "Patrícia", "Aline",
+         "Sebastião", "Raimunda", "Marcos", "Sandra", "Cláudia", "Gabriel", "Letícia"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves",
+              "Pereira", "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho",
+              "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa", "da Conceição"]
+BAIRROS = ["Centro", "Jardim das Flores", "Vila Nova", "São José", "Morro da Cruz", "Santa Rita"]
+INSUMOS = [("Arroz 5kg", "pct"), ("Feijão 1kg", "pct"), ("Açúcar 2kg", "pct"), ("Óleo 900ml", "un"),
+           ("Café 500g", "pct"), ("Macarrão 500g", "pct"), ("Farinha de mandioca 1kg", "pct"),
+           ("Leite em pó 400g", "un"), ("Sal 1kg", "pct"), ("Sardinha em lata", "un"),
+           ("Extrato de tomate", "un"), ("Biscoito 400g", "pct")]
+KITS = ["Cesta padrão", "Cesta família grande", "Cesta infantil", "Cesta emergencial"]
+
+USUARIO_BENCH = "bench"
+SENHA_BENCH = "bench123"
+
+TABELAS = ["estatisticas_entregas_dia", "estatisticas_entregas_mes", "insumo_movimentos", "insumo_estoque", "movimento_cestas", "familia_membros",
+           "estoque_cestas", "cesta_kit_itens", "cesta_kits", "cesta_insumos", "familias_cestas"]
+
+
+def _lotes(total, tamanho):
+    feito = 0
+    while feito < total:
+        n = min(tamanho, total - feito)
+        yield feito, n
+        feito += n
+
+
+def _progresso(rotulo, feito, total, inicio):
+    taxa = feito / max(time.time() - inicio, 1e-6)
+    print(f"\r  {rotulo}: {feito}/{total} ({taxa:,.0f}/s)", end="", flush=True)
+
+
+def limpar():
+    with database.get_db_cursor(commit=True) as cursor:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for tabela in TABELAS:
+            cursor.execute(f"TRUNCATE TABLE {tabela}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def criar_usuario():
+    """auth.login consulta a tabela usuarios, que não é criada pelas migrações"""
+    senha = bcrypt.hashpw(SENHA_BENCH.encode("utf-8"), bcrypt.gensalt(rounds=10)).decode("utf-8")
+    with database.get_db_cursor(commit=True) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id INT PRIMARY KEY AUTO_INCREMENT,
+                nome VARCHAR(255) NOT NULL,
+                email VARCHAR(255) NULL,
+                senha VARCHAR(255) NOT NULL,
+                tipo_usuario VARCHAR(50) NOT NULL DEFAULT 'voluntario',
+                ativo TINYINT(1) NOT NULL DEFAULT 1
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        cursor.execute("DELETE FROM usuarios WHERE nome = %s", [USUARIO_BENCH])
+        cursor.execute(
+            "INSERT INTO usuarios (nome, email, senha, tipo_usuario, ativo) VALUES (%s, %s, %s, %s, 1)",
+            [USUARIO_BENCH, "bench@example.org", senha, "administrador"]
+        )
+
+
+def semear_catalogo(rng):
+    with database.get_db_cursor(commit=True) as cursor:
+        cursor.executemany("INSERT INTO cesta_insumos (nome, unidade) VALUES (%s, %s)", INSUMOS)
+        cursor.executemany("INSERT INTO cesta_kits (nome, descricao) VALUES (%s, %s)",
+                           [(k, f"Kit {k.lower()}") for k in KITS])
+        cursor.execute("SELECT id FROM cesta_insumos")
+        insumos = [r["id"] for r in cursor.fetchall()]
+        cursor.execute("SELECT id FROM cesta_kits")
+        kits = [r["id"] for r in cursor.fetchall()]
+        itens = [(k, i, rng.choice([1, 1, 2, 3]))
+                 for k in kits for i in rng.sample(insumos, rng.randint(6, len(insumos)))]
+        cursor.executemany(
+            "INSERT INTO cesta_kit_itens (kit_id, insumo_id, quantidade) VALUES (%s, %s, %s)", itens
+        )
+        cursor.executemany(
+            "INSERT INTO insumo_estoque (insumo_id, saldo) VALUES (%s, %s)",
+            [(i, rng.randint(500, 5000)) for i in insumos]
+        )
+
+
+def semear_familias(rng, total, lote, anos):
+    sql = """
+    INSERT INTO familias_cestas (
+        numero_pessoas, numero_filhos, responsavel_nome, responsavel_cpf,
+        responsavel_nascimento, responsavel_genero, endereco, telefone, data_cadastro
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    agora = datetime.now()
+    inicio = time.time()
+    for feito, n in _lotes(total, lote):
+        linhas = []
+        for k in range(feito, feito + n):
+            pessoas = rng.randint(1, 9)
+            linhas.append((
+                pessoas,
+                rng.randint(0, max(0, pessoas - 1)),
+                f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+                f"{10_000_000_000 + k * 7919 % 89_999_999_999:011d}",
+                date(1950, 1, 1) + timedelta(days=rng.randint(0, 20000)),
+                rng.choice(["masculino", "feminino"]),
+                f"Rua {rng.choice(SOBRENOMES)}, {rng.randint(1, 2000)}, {rng.choice(BAIRROS)}",
+                f"48 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+                agora - timedelta(seconds=rng.randint(0, anos * 365 * 86400)),
+            ))
+        with database.get_db_cursor(commit=True) as cursor:
+            cursor.executemany(sql, linhas)
+        _progresso("famílias", feito + n, total, inicio)
+    print()
+
+
+def semear_movimentos(rng, total_entregas, lote, anos):
+    hoje = date.today()
+    dias = anos * 365
+
+    with database.get_db_cursor() as cursor:
+        cursor.execute("SELECT MIN(id) AS a, MAX(id) AS b FROM familias_cestas")
+        faixa = cursor.fetchone()
+    id_min, id_max = faixa["a"], faixa["b"]
+
+    # entradas de estoque: uma por semana, cobrindo todas as saídas
+    semanas = max(1, dias // 7)
+    por_semana = total_entregas * 2 // semanas + 1
+    with database.get_db_cursor(commit=True) as cursor:
+        cursor.executemany(
+            "INSERT INTO estoque_cestas (data_entrada, quantidade_entrada, fornecedor, observacoes) "
+            "VALUES (%s, %s, %s, %s)",
+            [(hoje - timedelta(days=7 * s), por_semana,
+              rng.choice(["Banco de Alimentos", "Doação paroquial", "Mesa Brasil"]), None)
+             for s in range(semanas)]
+        )
+
+    sql = """
+    INSERT INTO movimento_cestas (
+        id_familia, data_entrega, quantidade_cestas, observacoes_entrega, id_usuario_registro
+    ) VALUES (%s, %s, %s, %s, 1)
+    """
+    inicio = time.time()
+    for feito, n in _lotes(total_entregas, lote):
+        linhas = [(
+            rng.randint(id_min, id_max),
+            hoje - timedelta(days=rng.randint(0, dias)),
+            rng.choice([1, 1, 1, 2]),
+            f"Entregue por: {rng.choice(NOMES)}",
+        ) for _ in range(n)]
+        with database.get_db_cursor(commit=True) as cursor:
+            cursor.executemany(sql, linhas)
+        _progresso("entregas", feito + n, total_entregas, inicio)
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Semeia a base local do benchmark")
+    parser.add_argument("--familias", type=int, default=100_000)
+    parser.add_argument("--entregas", type=int, default=1_000_000)
+    parser.add_argument("--anos", type=int, default=3, help="Período coberto pelo histórico")
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--limpar", action="store_true", help="Apaga os dados antes de semear")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.semente)
+    migrador.migrar()
+
+    with database.get_db_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS c FROM familias_cestas")
+        existentes = cursor.fetchone()["c"]
+    if existentes and not args.limpar:
+        print(f"A base já tem {existentes} famílias. Use --limpar para recomeçar.")
+        return 1
+    if args.limpar:
+        limpar()
+
+    inicio = time.time()
+    criar_usuario()
+    semear_catalogo(rng)
+    semear_familias(rng, args.familias, args.lote, args.anos)
+    semear_movimentos(rng, args.entregas, args.lote * 2, args.anos)
+    manutencao_pos_seed()
+    print(f"✅ Base semeada em {time.time() - inicio:.0f}s "
+          f"(usuário '{USUARIO_BENCH}' / senha '{SENHA_BENCH}')")
+    return 0
+
+
+def manutencao_pos_seed():
+    """Recalcula as tabelas derivadas, já que o seed grava direto nas tabelas base"""
+    database.reconciliar_saldo_estoque(corrigir=True)
+    database.reconstruir_estatisticas()
+    database.recalcular_resumo_entregas()
+    with database.get_db_cursor(commit=True) as cursor:
+        cursor.execute("ANALYZE TABLE familias_cestas, movimento_cestas, estoque_cestas")
+        cursor.fetchall()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
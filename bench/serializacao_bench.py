@@ -0,0 +1,147 @@
+# bench/serializacao_bench.py
+"""
+Micro-benchmark da serialização das listagens (formato de /listar-entregas):
+
+- antes:  linha em dict (DictCursor) -> segundo dict com strftime e parsing do
+          "Entregue por:" -> json da stdlib com as opções padrão do Flask
+- depois: linha em tupla já formatada pelo SQL -> linhas_para_dicts ->
+          serializacao.dumps_bytes (orjson se instalado)
+
+    python -m bench.serializacao_bench --linhas 10000
+    python -m bench.serializacao_bench --linhas 10000 --banco   # também lê do MySQL (DB_*)
+
+Relata tempo de CPU (melhor de --repeticoes) e pico de memória alocada
+(tracemalloc) por rodada. Sem --banco não precisa de banco.
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import serializacao
+from serializacao import linhas_para_dicts
+
+CAMPOS_DICT = ("id", "data_entrega", "quantidade_cestas", "observacoes_entrega", "familia_id")
+COLUNAS = ("data_entrega", "familia_nome", "responsavel", "quantidade", "responsavel_entrega")
+
+
+def gerar_linhas(n, semente=1):
+    """(linhas_crus, linhas_formatadas): o que o MySQL devolveria em cada versão da consulta"""
+    rng = random.Random(semente)
+    hoje = date.today()
+    crus, formatadas = [], []
+    for i in range(n):
+        dia = hoje - timedelta(days=rng.randint(0, 900))
+        familia = rng.randint(1, 100_000)
+        quantidade = rng.choice([1, 1, 1, 2])
+        nome = f"Voluntário {rng.randint(1, 300)}"
+        crus.append((n - i, dia, quantidade, f"Entregue por: {nome}", familia))
+        formatadas.append((dia.strftime("%d/%m/%Y"), f"Família {familia}", nome, quantidade, nome,
+                           dia, n - i))
+    return crus, formatadas
+
+
+def antes(linhas_crus):
+    # o dict que o DictCursor monta para cada linha
+    return _antes_de_dicts([dict(zip(CAMPOS_DICT, r)) for r in linhas_crus])
+
+
+def _antes_de_dicts(rows):
+    entregas = []
+    for row in rows:
+        responsavel = "—"
+        obs = row.get("observacoes_entrega") or ""
+        if "Entregue por:" in obs:
+            responsavel = obs.replace("Entregue por:", "").strip()
+        entregas.append({
+            "data_entrega": row["data_entrega"].strftime("%d/%m/%Y"),
+            "familia_nome": f"Família {row['familia_id']}",
+            "responsavel": responsavel,
+            "quantidade": row["quantidade_cestas"],
+            "responsavel_entrega": responsavel
+        })
+    # provedor padrão do Flask: sort_keys=True, ensure_ascii=True
+    return json.dumps({"items": entregas, "next_cursor": None}, sort_keys=True).encode("utf-8")
+
+
+def depois(linhas_formatadas):
+    itens = linhas_para_dicts(COLUNAS, linhas_formatadas)
+    return serializacao.dumps_bytes({"items": itens, "next_cursor": None})
+
+
+def medir(funcao, dados, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.process_time()
+        corpo = funcao(dados)
+        melhor = min(melhor, time.process_time() - inicio)
+
+    gc.collect()
+    tracemalloc.start()
+    funcao(dados)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return melhor, pico, len(corpo)
+
+
+def ler_do_banco(n, tuplas):
+    """Lê n entregas com o SELECT de cada versão (dicts antes, tuplas depois)"""
+    import database
+
+    if tuplas:
+        sql = f"""
+        SELECT DATE_FORMAT(m.data_entrega, '%%d/%%m/%%Y'), CONCAT('Família ', m.id_familia),
+               {database._SQL_RESPONSAVEL_ENTREGA}, m.quantidade_cestas,
+               {database._SQL_RESPONSAVEL_ENTREGA}, m.data_entrega, m.id
+        FROM movimento_cestas m ORDER BY m.data_entrega DESC, m.id DESC LIMIT %s
+        """
+    else:
+        sql = """
+        SELECT m.id, m.data_entrega, m.quantidade_cestas, m.observacoes_entrega,
+               m.id_familia AS familia_id
+        FROM movimento_cestas m ORDER BY m.data_entrega DESC, m.id DESC LIMIT %s
+        """
+    with database.get_db_cursor(tuplas=tuplas) as cursor:
+        cursor.execute(sql, [n])
+        return cursor.fetchall()
+
+
+def imprimir(rotulo, resultado, n, base=None):
+    cpu, pico, tamanho = resultado
+    linha = (f"{rotulo:32} {cpu * 1000:9.1f} ms  {cpu / n * 1e6:6.2f} µs/linha  "
+             f"pico {pico / 1024 / 1024:7.2f} MB  corpo {tamanho / 1024:8.0f} KB")
+    if base:
+        linha += f"  ({base[0] / cpu:.1f}x CPU, {(pico / base[1] - 1) * 100:+.0f}% memória)"
+    print(linha)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da serialização das listagens")
+    parser.add_argument("--linhas", type=int, default=10_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--banco", action="store_true",
+                        help="Mede também a leitura do MySQL (DictCursor x tuplas)")
+    args = parser.parse_args(argv)
+
+    print(f"{args.linhas} linhas, encoder: {'orjson' if serializacao.orjson else 'json (stdlib)'}")
+    crus, formatadas = gerar_linhas(args.linhas)
+    base = medir(antes, crus, args.repeticoes)
+    imprimir("antes (dict + strftime + json)", base, args.linhas)
+    imprimir("depois (tupla + dumps_bytes)", medir(depois, formatadas, args.repeticoes),
+             args.linhas, base)
+
+    if args.banco:
+        base = medir(lambda n: _antes_de_dicts(ler_do_banco(n, False)), args.linhas,
+                     args.repeticoes)
+        imprimir("banco: antes", base, args.linhas)
+        imprimir("banco: depois", medir(lambda n: depois(ler_do_banco(n, True)), args.linhas,
+                                        args.repeticoes), args.linhas, base)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
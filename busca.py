@@ -0,0 +1,194 @@
+# busca.py
+"""
+Índice de busca de famílias em memória (trigramas), por processo.
+
+- Nome, CPF e telefone, sem acento e sem diferenciar maiúsculas ("Joao" acha "João")
+- Ranking: prefixo exato > palavra começando com o termo > semelhança de trigramas
+  (tolera erro de digitação: "Joao Silv" acha "João da Silva")
+- Montado na subida (create_app, antes do fork; em desenvolvimento, na primeira
+  busca) e atualizado de forma incremental: cada sincronização só lê as famílias
+  com familias_cestas.atualizado_em a partir da última marca vista (menos
+  BUSCA_SYNC_MARGEM, para transações que confirmam atrasadas). Novas, renomeadas
+  ou com CPF/telefone novos são reindexadas e as desativadas saem do índice,
+  mesmo quando a alteração veio de outro worker
+- A leitura do banco acontece fora do lock do índice: buscas não esperam a
+  sincronização de outro thread, só a troca das linhas já lidas
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import timedelta
+
+from database import formatar_cpf, iter_familias_alteradas, iter_familias_para_indice, marca_familias
+
+BUSCA_SYNC_INTERVALO = float(os.getenv("BUSCA_SYNC_INTERVALO", "5"))
+BUSCA_SYNC_MARGEM = float(os.getenv("BUSCA_SYNC_MARGEM", "30"))  # segundos relidos a cada vez
+SIMILARIDADE_MINIMA = 0.5
+
+
+def dobrar(texto):
+    """minúsculas, sem acentos e só com letras/dígitos separados por espaço"""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", texto).strip()
+
+
+def trigramas(palavra, completa=True):
+    """Trigramas com espaço à esquerda; sem o da direita quando é um prefixo digitado"""
+    p = "  " + palavra + (" " if completa else "")
+    return {p[i:i + 3] for i in range(len(p) - 2)}
+
+
+def _trigramas_consulta(termo, completa):
+    # dígitos (CPF/telefone) também casam no meio: "3333" acha "4833334444"
+    # (os trigramas internos já estão no índice; só não exige o início da palavra)
+    if termo.isdigit() and len(termo) >= 3:
+        return {termo[i:i + 3] for i in range(len(termo) - 2)}
+    return trigramas(termo, completa)
+
+
+class IndiceFamilias:
+
+    def __init__(self, carregar=iter_familias_para_indice, alteradas=iter_familias_alteradas,
+                 marca=marca_familias, intervalo=BUSCA_SYNC_INTERVALO, margem=BUSCA_SYNC_MARGEM):
+        self._carregar = carregar
+        self._alteradas = alteradas
+        self._marca_atual = marca
+        self.intervalo = intervalo
+        self.margem = timedelta(seconds=margem)
+        self._lock = threading.RLock()          # protege _docs/_postings (buscas e escrita)
+        self._sincronizando = threading.Lock()  # leitura do banco em andamento
+        self._docs = {}                    # id -> (nome, cpf, telefone, nome_dobrado, palavras)
+        self._postings = defaultdict(set)  # trigrama -> {ids}
+        self._montado = False
+        self.marca = None                  # maior atualizado_em já lido
+        self._sincronizado_em = 0.0
+
+    # ---------- manutenção ----------
+    def adicionar(self, familia_id, nome, cpf, telefone):
+        nome_dobrado = dobrar(nome)
+        digitos = " ".join(d for d in (re.sub(r"\D", "", cpf or ""),
+                                       re.sub(r"\D", "", telefone or "")) if d)
+        with self._lock:
+            self.remover(familia_id)
+            palavras = tuple((nome_dobrado + " " + digitos).split())
+            self._docs[familia_id] = (nome, cpf, telefone, nome_dobrado, palavras)
+            for palavra in palavras:
+                for t in trigramas(palavra):
+                    self._postings[t].add(familia_id)
+
+    def remover(self, familia_id):
+        with self._lock:
+            doc = self._docs.pop(familia_id, None)
+            if not doc:
+                return
+            for palavra in doc[4]:
+                for t in trigramas(palavra):
+                    ids = self._postings.get(t)
+                    if ids:
+                        ids.discard(familia_id)
+                        if not ids:
+                            del self._postings[t]
+
+    def marcar_desatualizado(self):
+        """Força a próxima busca a sincronizar (chamar depois de gravar famílias)"""
+        self._sincronizado_em = 0.0
+
+    def sincronizar(self, forcar=False):
+        if not forcar and time.monotonic() - self._sincronizado_em < self.intervalo:
+            return
+        # um thread por vez vai ao banco, e fora do _lock: enquanto isso as buscas
+        # seguem no índice atual. Só espera quem ainda não tem índice (ou força)
+        if not self._sincronizando.acquire(blocking=forcar or not self._montado):
+            return
+        try:
+            if not forcar and time.monotonic() - self._sincronizado_em < self.intervalo:
+                return
+            if not self._montado:
+                # marca lida antes da carga: o que mudar durante ela é relido na próxima
+                marca = self._marca_atual()
+                for familia_id, nome, cpf, telefone in self._carregar():
+                    self.adicionar(familia_id, nome, cpf, telefone)
+                with self._lock:
+                    self.marca = marca
+                    self._montado = True
+                self._sincronizado_em = time.monotonic()
+                logging.info(f"🔎 Índice de famílias: {len(self._docs)} famílias")
+                return
+
+            desde = self.marca - self.margem if self.marca else None
+            linhas = list(self._alteradas(desde))
+            with self._lock:
+                for familia_id, nome, cpf, telefone, ativo, atualizado_em in linhas:
+                    if ativo:
+                        self.adicionar(familia_id, nome, cpf, telefone)
+                    else:
+                        self.remover(familia_id)
+                    self.marca = max(self.marca or atualizado_em, atualizado_em)
+            self._sincronizado_em = time.monotonic()
+            if linhas:
+                logging.debug(f"🔎 Índice de famílias: {len(linhas)} relidas (total {len(self._docs)})")
+        finally:
+            self._sincronizando.release()
+
+    # ---------- consulta ----------
+    def buscar(self, consulta, limite=20):
+        """Ids das famílias em ordem de relevância"""
+        self.sincronizar()
+        termos = dobrar(consulta).split()
+        if not termos:
+            return []
+
+        alvo = set()
+        for i, termo in enumerate(termos):
+            alvo |= _trigramas_consulta(termo, completa=i < len(termos) - 1)
+
+        # quem tem pelo menos `minimo` trigramas em comum aparece obrigatoriamente em
+        # alguma das (len(alvo) - minimo + 1) listas mais curtas: só elas geram candidatos
+        minimo = max(1, math.ceil(SIMILARIDADE_MINIMA * len(alvo)))
+        frase = " ".join(termos)
+        with self._lock:
+            listas = sorted((self._postings.get(t, ()) for t in alvo), key=len)
+            # se já há resultados suficientes contendo todos os trigramas, eles vencem
+            # qualquer casamento parcial: nem olha o resto (prefixos curtos e comuns)
+            candidatos = set(listas[0]).intersection(*listas[1:])
+            if len(candidatos) < limite:
+                candidatos = set().union(*listas[:len(alvo) - minimo + 1])
+
+            resultado = []
+            for familia_id in candidatos:
+                comuns = sum(1 for ids in listas if familia_id in ids)
+                if comuns < minimo:
+                    continue
+                _, _, _, nome, palavras = self._docs[familia_id]
+                pontos = comuns / len(alvo)
+                if nome.startswith(frase):
+                    pontos += 2
+                pontos += sum(0.5 for termo in termos
+                              if any(p.startswith(termo) for p in palavras)) / len(termos)
+                resultado.append((pontos, familia_id))
+
+        resultado.sort(key=lambda x: (-x[0], -x[1]))
+        return [familia_id for _, familia_id in resultado[:limite]]
+
+    def sugestoes(self, consulta, limite=10):
+        """
+        Para o type-ahead: id, nome, CPF e telefone direto da memória, sem ir ao
+        banco (só famílias ativas: as desativadas saem do índice na sincronização)
+        """
+        ids = self.buscar(consulta, limite)
+        with self._lock:
+            return [{
+                "id": i,
+                "responsavel_nome": self._docs[i][0] or "Nome não registrado",
+                "cpf": formatar_cpf(self._docs[i][1]),
+                "telefone": self._docs[i][2] or "—",
+            } for i in ids if i in self._docs]
+
+
+indice_familias = IndiceFamilias()
@@ -0,0 +1,51 @@
+# cache.py
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Cache em memória (por processo) com expiração por tempo.
+
+    - get(chave, carregar): devolve o valor em cache ou chama carregar() uma vez,
+      mesmo com várias threads pedindo a mesma chave ao mesmo tempo
+    - invalidar(chave): descarta a chave (ou tudo, sem argumento); chamado pelos
+      caminhos de escrita logo depois do commit
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._dados = {}  # chave -> (valor, expira_em, geracao)
+        self._lock = threading.Lock()
+        self._carregando = threading.Lock()
+        self._geracao = 0
+
+    def get(self, chave, carregar):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item and item[1] > time.monotonic():
+                return item[0]
+
+        with self._carregando:
+            # outra thread pode ter carregado enquanto esperávamos
+            with self._lock:
+                item = self._dados.get(chave)
+                if item and item[1] > time.monotonic():
+                    return item[0]
+                geracao = self._geracao
+
+            valor = carregar()
+
+            with self._lock:
+                # se houve invalidação durante o carregamento, não guarda valor velho
+                if geracao == self._geracao:
+                    self._dados[chave] = (valor, time.monotonic() + self.ttl, geracao)
+            return valor
+
+    def invalidar(self, chave=None):
+        with self._lock:
+            self._geracao += 1
+            if chave is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(chave, None)
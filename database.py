@@ -1,8 +1,22 @@
 # database.py
 import os
 import pymysql
+import contextvars
+import itertools
 import logging
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+import base64
+import hashlib
+import json
+import re
+
+from cache import TTLCache
+from serializacao import linhas_para_dicts
+import metricas
 
 logging.basicConfig(level=logging.INFO)
 
@@ -27,245 +41,1379 @@ def get_db_connection():
         logging.error(f"Erro ao conectar ao MySQL: {e}")
         raise
 
+# =========================
+# POOL DE CONEXÕES
+# =========================
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN", "1")),
+    "max_size": int(os.getenv("DB_POOL_MAX", "10")),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    "max_age": float(os.getenv("DB_POOL_RECYCLE", "3600")),
+    "ping_interval": float(os.getenv("DB_POOL_PING_INTERVAL", "30")),
+}
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão livre dentro do timeout de checkout"""
+
+
+class BancoIndisponivel(Exception):
+    """A escrita não chegou ao MySQL por falta de banco (conexão, pool, lock wait): vale reenviar"""
+
+
+class ConnectionPool:
+    """
+    Pool limitado de conexões PyMySQL.
+
+    - Mantém até max_size conexões abertas (min_size abertas de cara)
+    - Conexões ociosas há mais de ping_interval passam por ping antes de voltar ao uso
+    - Conexões mais velhas que max_age são descartadas e recriadas
+    - checkout espera no máximo `timeout` segundos por uma conexão livre
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 max_age=3600.0, ping_interval=30.0):
+        if max_size < 1:
+            raise ValueError("max_size deve ser >= 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._livres = deque()  # (conn, criada_em, devolvida_em)
+        self._abertas = 0
+        self._criadas_em = {}
+        self.stats = {"checkouts": 0, "waits": 0, "created": 0, "discarded": 0}
+
+        for _ in range(self.min_size):
+            conn = self._nova_conexao()
+            self._livres.append((conn, self._criadas_em[id(conn)], time.monotonic()))
+
+    def _nova_conexao(self):
+        conn = self._connect()
+        self._abertas += 1
+        self._criadas_em[id(conn)] = time.monotonic()
+        self.stats["created"] += 1
+        return conn
+
+    def _esquecer(self, conn):
+        """Tira a conexão da contagem (com o lock); quem chama fecha"""
+        self._criadas_em.pop(id(conn), None)
+        self._abertas -= 1
+        self.stats["discarded"] += 1
+
+    @staticmethod
+    def _fechar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _descartar(self, conn):
+        self._esquecer(conn)
+        self._fechar(conn)
+
+    def _valida(self, conn, criada_em, devolvida_em):
+        """Chamada fora do lock: o ping é I/O de rede"""
+        agora = time.monotonic()
+        if self.max_age and agora - criada_em > self.max_age:
+            return False
+        if agora - devolvida_em > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        esperou = False
+        with self._cond:
+            self.stats["checkouts"] += 1
+        while True:
+            candidata = None
+            with self._cond:
+                while True:
+                    if self._livres:
+                        # sai da fila (conta como em uso) antes de soltar o lock
+                        candidata = self._livres.pop()
+                        break
+
+                    if self._abertas < self.max_size:
+                        # reserva a vaga antes de sair do lock para conectar
+                        self._abertas += 1
+                        break
+
+                    if not esperou:
+                        esperou = True
+                        self.stats["waits"] += 1
+                    restante = deadline - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotado(
+                            f"Nenhuma conexão livre em {self.timeout}s (max_size={self.max_size})"
+                        )
+                    self._cond.wait(restante)
+
+            if candidata is None:
+                break
+            conn = candidata[0]
+            # ping fora do lock: os outros checkouts e checkins não esperam a rede
+            if self._valida(*candidata):
+                return conn
+            with self._cond:
+                self._esquecer(conn)
+                self._cond.notify()  # abriu vaga para quem espera
+            self._fechar(conn)
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._criadas_em[id(conn)] = time.monotonic()
+            self.stats["created"] += 1
+        return conn
+
+    def checkin(self, conn, descartar=False):
+        with self._cond:
+            descartar = descartar or id(conn) not in self._criadas_em
+            if descartar:
+                self._esquecer(conn)
+            else:
+                self._livres.append((conn, self._criadas_em[id(conn)], time.monotonic()))
+            self._cond.notify()
+        if descartar:
+            self._fechar(conn)
+
+    def fechar(self):
+        with self._cond:
+            while self._livres:
+                conn, _, _ = self._livres.pop()
+                self._descartar(conn)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                **self.stats,
+                "open": self._abertas,
+                "idle": len(self._livres),
+                "in_use": self._abertas - len(self._livres),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Cria o pool na primeira utilização (depois do fork, em servidores multi-processo)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(get_db_connection, **POOL_CONFIG)
+    return _pool
+
+def fechar_pool():
+    """Fecha as conexões ociosas e descarta o pool atual"""
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+            _pool = None
+        if _replicas is not None:
+            _replicas.fechar()
+            _replicas = None
+
+def get_pool_stats():
+    """Contadores do pool (checkouts, waits, created, discarded) + ocupação atual"""
+    stats = get_pool().snapshot()
+    if REPLICA_CONFIG["hosts"]:
+        stats["replicas"] = get_replicas().snapshot()
+    return stats
+
+# =========================
+# RÉPLICAS DE LEITURA
+# =========================
+# DB_REPLICA_HOSTS="replica1:3306,replica2": mesmo usuário/senha/base do primário
+# (ou DB_REPLICA_USER / DB_REPLICA_PASSWORD). Sem a variável, tudo vai ao primário.
+# get_db_cursor(leitura=True) usa uma réplica saudável, se houver; escritas,
+# leituras dentro de transações de escrita e sessões que escreveram há pouco
+# (ler as próprias escritas) ficam no primário.
+REPLICA_CONFIG = {
+    "hosts": [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()],
+    "lag_max": float(os.getenv("DB_REPLICA_LAG_MAX", "5")),             # segundos
+    "intervalo": float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5")),    # segundos
+    "connect_timeout": int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2")),
+}
+# réplica aceita tem atraso < lag_max na última checagem, feita há < intervalo:
+# passada essa janela depois de uma escrita, qualquer réplica já a tem
+LER_ESCRITAS_JANELA = float(os.getenv(
+    "DB_LER_ESCRITAS_JANELA", str(REPLICA_CONFIG["lag_max"] + REPLICA_CONFIG["intervalo"])
+))
+
+# erros de conexão (não de consulta): tiram a réplica de uso até a próxima checagem boa
+_ERROS_CONEXAO = {2002, 2003, 2006, 2013, 2055}
+# para as escritas: banco fora do ar ou sobrecarregado (too many connections,
+# lock wait timeout, deadlock); a transação não foi gravada e pode ser refeita
+_ERROS_INDISPONIVEL = _ERROS_CONEXAO | {1040, 1205, 1213}
+
+def _banco_indisponivel(e):
+    if isinstance(e, (PoolEsgotado, pymysql.InterfaceError)):
+        return True
+    return isinstance(e, pymysql.OperationalError) and bool(e.args) and e.args[0] in _ERROS_INDISPONIVEL
+
+_ultima_escrita = contextvars.ContextVar("db_ultima_escrita", default=0.0)
+
+def marcar_ultima_escrita(momento):
+    """Início da requisição: quando a sessão escreveu pela última vez (epoch, ou None)"""
+    _ultima_escrita.set(float(momento or 0.0))
+
+def ultima_escrita():
+    """Momento (epoch) da última escrita desta sessão/requisição; 0.0 se nenhuma"""
+    return _ultima_escrita.get()
+
+
+class Replica:
+    """Uma réplica: pool próprio e o resultado da última checagem de saúde"""
+
+    def __init__(self, endereco):
+        host, _, porta = endereco.partition(":")
+        self.nome = f"{host}:{porta or DB_CONFIG['port']}"
+        self._config = {
+            **DB_CONFIG,
+            "host": host,
+            "port": int(porta or DB_CONFIG["port"]),
+            "user": os.getenv("DB_REPLICA_USER", DB_CONFIG["user"]),
+            "password": os.getenv("DB_REPLICA_PASSWORD", DB_CONFIG["password"]),
+            "connect_timeout": REPLICA_CONFIG["connect_timeout"],
+        }
+        self.pool = ConnectionPool(self._conectar, **{**POOL_CONFIG, "min_size": 0})
+        # só recebe leituras depois da primeira checagem boa
+        self.saudavel = False
+        self.lag = None
+        self.motivo = "ainda não verificada"
+
+    def _conectar(self):
+        conn = pymysql.connect(**self._config)
+        with conn.cursor() as cursor:
+            # rede de segurança: nada escreve numa réplica por engano
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        return conn
+
+    def ejetar(self, motivo):
+        if self.saudavel:
+            logging.warning(f"⚠️  Réplica {self.nome} fora de uso: {motivo}")
+        self.saudavel = False
+        self.motivo = motivo
+
+    def verificar(self):
+        try:
+            conn = self.pool.checkout()
+        except Exception as e:
+            self.ejetar(f"sem conexão ({e})")
+            return
+        descartar = False
+        try:
+            with conn.cursor() as cursor:
+                lag = _atraso_replicacao(cursor)
+            conn.rollback()
+        except Exception as e:
+            descartar = True
+            self.ejetar(f"checagem falhou ({e})")
+            return
+        finally:
+            self.pool.checkin(conn, descartar=descartar)
+
+        self.lag = lag
+        if lag is None:
+            self.ejetar("replicação parada ou host não é réplica")
+        elif lag >= REPLICA_CONFIG["lag_max"]:
+            self.ejetar(f"atraso de {lag}s (máximo {REPLICA_CONFIG['lag_max']:g}s)")
+        else:
+            if not self.saudavel:
+                logging.info(f"✅ Réplica {self.nome} em uso (atraso {lag}s)")
+            self.saudavel = True
+            self.motivo = None
+
+    def snapshot(self):
+        return {"nome": self.nome, "saudavel": self.saudavel, "lag": self.lag,
+                "motivo": self.motivo, **self.pool.snapshot()}
+
+
+def _atraso_replicacao(cursor):
+    """Seconds_Behind_Source da réplica; None se a replicação não estiver rodando"""
+    try:
+        cursor.execute("SHOW REPLICA STATUS")
+    except pymysql.err.ProgrammingError:
+        cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22 / MariaDB < 10.5.1
+    row = cursor.fetchone()
+    if not row:
+        return None
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return None if lag is None else int(lag)
+
+
+class Replicas:
+    """
+    Conjunto de réplicas com uma thread que checa todas a cada `intervalo`
+    segundos. escolher() alterna entre as saudáveis; None se nenhuma estiver.
+    """
+
+    def __init__(self, enderecos, intervalo):
+        self.replicas = [Replica(e) for e in enderecos]
+        self.intervalo = intervalo
+        self._vez = itertools.count()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._monitorar, name="replicas", daemon=True)
+        self._thread.start()
+
+    def _monitorar(self):
+        while not self._parar.is_set():
+            for replica in self.replicas:
+                replica.verificar()
+            self._parar.wait(self.intervalo)
+
+    def escolher(self):
+        saudaveis = [r for r in self.replicas if r.saudavel]
+        if not saudaveis:
+            return None
+        return saudaveis[next(self._vez) % len(saudaveis)]
+
+    def fechar(self):
+        self._parar.set()
+        for replica in self.replicas:
+            replica.pool.fechar()
+
+    def snapshot(self):
+        return [r.snapshot() for r in self.replicas]
+
+
+_replicas = None
+
+def get_replicas():
+    """Criado (e a thread de checagem iniciada) na primeira leitura, depois do fork"""
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = Replicas(REPLICA_CONFIG["hosts"], REPLICA_CONFIG["intervalo"])
+    return _replicas
+
+def _replica_para_leitura():
+    if not REPLICA_CONFIG["hosts"]:
+        return None
+    if time.time() - _ultima_escrita.get() < LER_ESCRITAS_JANELA:
+        return None
+    return get_replicas().escolher()
+
+class _CursorInstrumentado:
+    """Cursor PyMySQL que registra tempo de cada consulta e linhas lidas em metricas.py"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, args=None):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            metricas.registrar_consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, args):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            metricas.registrar_consulta(query, time.perf_counter() - inicio)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            metricas.registrar_linhas(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size)
+        metricas.registrar_linhas(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        metricas.registrar_linhas(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            metricas.registrar_linhas(1)
+            yield row
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+STREAMING_NET_WRITE_TIMEOUT = int(os.getenv("STREAMING_NET_WRITE_TIMEOUT", "600"))
+
 @contextmanager
-def get_db_cursor(commit=False):
-    """Context manager para conexão e cursor ao banco de dados"""
-    conn = get_db_connection()
+def get_db_cursor(commit=False, streaming=False, tuplas=False, leitura=False):
+    """
+    Context manager para conexão (do pool) e cursor ao banco de dados.
+    streaming=True usa cursor do lado do servidor (SSDictCursor): as linhas vêm
+    do MySQL conforme são lidas, sem carregar o resultado inteiro na memória.
+    tuplas=True devolve linhas em tupla, sem montar um dict por linha (listagens
+    grandes; os nomes das colunas ficam em cursor.description).
+    leitura=True pode ir a uma réplica (ver RÉPLICAS DE LEITURA); só para
+    consultas que toleram alguns segundos de atraso.
+    """
+    if leitura and commit:
+        raise ValueError("leitura=True não combina com commit=True")
+    replica = _replica_para_leitura() if leitura else None
+    pool = replica.pool if replica else get_pool()
+    inicio = time.perf_counter()
+    try:
+        conn = pool.checkout()
+    except Exception as e:
+        if replica is None:
+            raise
+        replica.ejetar(f"checkout falhou ({e})")
+        replica, pool = None, get_pool()
+        conn = pool.checkout()
+    metricas.registrar_checkout(time.perf_counter() - inicio)
     cursor = None
+    descartar = False
     try:
-        cursor = conn.cursor()
-        yield cursor
+        if streaming:
+            cursor = conn.cursor(pymysql.cursors.SSCursor if tuplas else pymysql.cursors.SSDictCursor)
+            # o cliente HTTP lento segura a leitura; não deixa o MySQL desistir de enviar
+            cursor.execute("SET SESSION net_write_timeout = %s", [STREAMING_NET_WRITE_TIMEOUT])
+        else:
+            cursor = conn.cursor(pymysql.cursors.Cursor) if tuplas else conn.cursor()
+        yield _CursorInstrumentado(cursor)
         if commit:
             conn.commit()
-    except Exception as e:
+            _ultima_escrita.set(time.time())
+        else:
+            # encerra a transação de leitura para não devolver um snapshot aberto ao pool
+            conn.rollback()
+    except BaseException as e:
+        # BaseException inclui GeneratorExit (cliente desconectou no meio de um stream):
+        # a transação precisa ser encerrada antes de a conexão voltar ao pool
         try:
             conn.rollback()
         except Exception:
-            pass
-        logging.error(f"Erro na operação de banco de dados: {e}")
+            descartar = True
+        if isinstance(e, (pymysql.OperationalError, pymysql.InterfaceError)):
+            descartar = True
+            if replica and (isinstance(e, pymysql.InterfaceError)
+                            or (e.args and e.args[0] in _ERROS_CONEXAO)):
+                replica.ejetar(str(e))
+        if streaming:
+            # resultado lido pela metade: fechar o cursor leria todo o resto do
+            # servidor; mais barato descartar a conexão
+            descartar = True
+        if isinstance(e, Exception):
+            logging.error(f"Erro na operação de banco de dados: {e}")
         raise
     finally:
-        if cursor:
-            cursor.close()
-        conn.close()
-
-# =========================
-# INIT DB
-# =========================
-def init_db():
-    """Cria as tabelas do sistema de cestas básicas, se não existirem"""
-
-    create_familias = """
-    CREATE TABLE IF NOT EXISTS familias_cestas (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        numero_pessoas INT NOT NULL DEFAULT 1,
-        numero_filhos INT NOT NULL DEFAULT 0,
-        renda_mensal_familia DECIMAL(10,2) NULL,
-        beneficios_sociais TEXT NULL,
-        condicao_moradia ENUM('própria', 'alugada', 'cedida', 'invasão') NULL,
-        tipo_moradia ENUM('casa', 'apartamento', 'barraco', 'outro') NULL,
-        observacoes TEXT NULL,
-        necessidades_especificas TEXT NULL,
-        data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        ativo BOOLEAN DEFAULT TRUE,
-        INDEX idx_data_cadastro (data_cadastro)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    create_membros = """
-    CREATE TABLE IF NOT EXISTS familia_membros (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        id_familia INT NOT NULL,
-        nome_completo VARCHAR(255) NOT NULL,
-        idade INT NULL,
-        escolaridade VARCHAR(100) NULL,
-        estuda BOOLEAN DEFAULT FALSE,
-        parentesco ENUM('cônjuge', 'filho', 'pai', 'mãe', 'avo', 'outro') NULL,
-        FOREIGN KEY (id_familia) REFERENCES familias_cestas(id),
-        INDEX idx_familia (id_familia)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    create_movimento = """
-    CREATE TABLE IF NOT EXISTS movimento_cestas (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        id_familia INT NOT NULL,
-        id_membro_entregue INT NULL,
-        id_visitante_entregue INT NULL,
-        data_entrega DATE NOT NULL,
-        quantidade_cestas INT DEFAULT 1,
-        observacoes_entrega TEXT NULL,
-        id_usuario_registro INT NOT NULL,
-        data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (id_familia) REFERENCES familias_cestas(id),
-        INDEX idx_familia_data (id_familia, data_entrega)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    create_estoque = """
-    CREATE TABLE IF NOT EXISTS estoque_cestas (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        data_entrada DATE NOT NULL,
-        quantidade_entrada INT NOT NULL,
-        fornecedor VARCHAR(255) NULL,
-        observacoes TEXT NULL,
-        data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    # =========================
-    # INSUMOS / KITS
-    # =========================
-    create_insumos = """
-    CREATE TABLE IF NOT EXISTS cesta_insumos (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        nome VARCHAR(255) NOT NULL,
-        unidade VARCHAR(20) NOT NULL DEFAULT 'un',
-        ativo TINYINT(1) NOT NULL DEFAULT 1,
-        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE KEY uk_insumo_nome (nome)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    create_kits = """
-    CREATE TABLE IF NOT EXISTS cesta_kits (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        nome VARCHAR(255) NOT NULL,
-        descricao VARCHAR(255) NULL,
-        ativo TINYINT(1) NOT NULL DEFAULT 1,
-        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE KEY uk_kit_nome (nome)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-
-    create_kit_itens = """
-    CREATE TABLE IF NOT EXISTS cesta_kit_itens (
-        id INT PRIMARY KEY AUTO_INCREMENT,
-        kit_id INT NOT NULL,
-        insumo_id INT NOT NULL,
-        quantidade DECIMAL(10,2) NOT NULL DEFAULT 1,
-        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE KEY uk_kit_insumo (kit_id, insumo_id),
-        CONSTRAINT fk_kit_itens_kit FOREIGN KEY (kit_id) REFERENCES cesta_kits(id)
-            ON DELETE CASCADE,
-        CONSTRAINT fk_kit_itens_insumo FOREIGN KEY (insumo_id) REFERENCES cesta_insumos(id)
-            ON DELETE RESTRICT
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        if cursor and not (streaming and descartar):
+            try:
+                cursor.close()
+            except Exception:
+                descartar = True
+        pool.checkin(conn, descartar=descartar)
+
+# =========================
+# BACKFILL (usado pelas migrações, ver migrador.py)
+# =========================
+FAMILIAS_BACKFILL_LOTE = int(os.getenv("FAMILIAS_BACKFILL_LOTE", "500"))
+
+_OBS_LEGADO_RE = re.compile(
+    r"^Responsável: (?P<nome>.*?), CPF: (?P<cpf>.*?), Nascimento: (?P<nascimento>.*?), "
+    r"Gênero: (?P<genero>.*?), Endereço: (?P<endereco>.*), Telefone:\s*(?P<telefone>.*)$",
+    re.DOTALL,
+)
+
+def _parse_observacoes_legado(observacoes):
+    """
+    Lê o formato antigo gravado em observacoes. O endereço pode conter vírgulas,
+    por isso o casamento é feito pelos rótulos e não por split(", ").
     """
+    m = _OBS_LEGADO_RE.match((observacoes or "").strip())
+    if not m:
+        return None
+    return {k: (v.strip() if v and v.strip() not in ("None", "") else None)
+            for k, v in m.groupdict().items()}
 
-    try:
+def backfill_familias_estruturadas(max_lotes=None, tamanho_lote=None):
+    """
+    Copia os dados do formato antigo (observacoes) para as colunas estruturadas,
+    em lotes pequenos, cada um na sua transação. Pode ser chamada várias vezes:
+    continua de onde parou (linhas com responsavel_nome IS NULL). Roda pela
+    migração 0002 (migrations/).
+    CPFs repetidos ficam NULL no registro mais novo (o índice é UNIQUE).
+    """
+    tamanho_lote = tamanho_lote or FAMILIAS_BACKFILL_LOTE
+    ultimo_id = 0
+    lotes = 0
+    total = 0
+    while max_lotes is None or lotes < max_lotes:
         with get_db_cursor(commit=True) as cursor:
-            cursor.execute(create_familias)
-            cursor.execute(create_membros)
-            cursor.execute(create_movimento)
-            cursor.execute(create_estoque)
-            cursor.execute(create_insumos)
-            cursor.execute(create_kits)
-            cursor.execute(create_kit_itens)
-
-        logging.info("✅ Tabelas verificadas/criadas com sucesso.")
-    except Exception as e:
-        logging.error(f"❌ Erro ao inicializar tabelas: {e}")
-        raise
+            cursor.execute("""
+                SELECT id, observacoes FROM familias_cestas
+                WHERE responsavel_nome IS NULL AND id > %s
+                ORDER BY id LIMIT %s
+            """, [ultimo_id, tamanho_lote])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            parsed = []
+            for row in rows:
+                dados = _parse_observacoes_legado(row["observacoes"]) or {}
+                parsed.append((row["id"], dados, _somente_digitos(dados.get("cpf"))))
+
+            cpfs = [cpf for _, _, cpf in parsed if cpf]
+            existentes = set()
+            if cpfs:
+                marcadores = ", ".join(["%s"] * len(cpfs))
+                cursor.execute(
+                    f"SELECT responsavel_cpf FROM familias_cestas WHERE responsavel_cpf IN ({marcadores})",
+                    cpfs
+                )
+                existentes = {r["responsavel_cpf"] for r in cursor.fetchall()}
+
+            params = []
+            for familia_id, dados, cpf in parsed:
+                if cpf in existentes:
+                    logging.warning(f"CPF repetido na família {familia_id}; mantido só em observacoes")
+                    cpf = None
+                elif cpf:
+                    existentes.add(cpf)
+                params.append([
+                    dados.get("nome") or "",
+                    cpf,
+                    _data_iso_ou_none(dados.get("nascimento")),
+                    dados.get("genero"),
+                    dados.get("endereco"),
+                    dados.get("telefone"),
+                    familia_id,
+                ])
+
+            cursor.executemany("""
+                UPDATE familias_cestas
+                SET responsavel_nome = %s, responsavel_cpf = %s, responsavel_nascimento = %s,
+                    responsavel_genero = %s, endereco = %s, telefone = %s
+                WHERE id = %s
+            """, params)
+
+            ultimo_id = rows[-1]["id"]
+            lotes += 1
+            total += len(rows)
+
+    if total:
+        logging.info(f"✅ Backfill de famílias: {total} registro(s) em {lotes} lote(s).")
+    return total
+
+# =========================
+# HELPERS DE FORMATAÇÃO
+# =========================
+def _somente_digitos(valor):
+    digitos = re.sub(r"\D", "", str(valor or ""))
+    return digitos or None
+
+def normalizar_cpf(valor):
+    """CPF só com dígitos (como fica gravado em responsavel_cpf), ou None"""
+    return _somente_digitos(valor)
+
+def formatar_cpf(cpf):
+    if cpf and len(cpf) == 11:
+        return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+    return cpf or "—"
+
+def _data_iso_ou_none(valor):
+    try:
+        return datetime.strptime(str(valor), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+# =========================
+# PAGINAÇÃO (KEYSET)
+# =========================
+PAGINA_PADRAO = int(os.getenv("PAGINA_PADRAO", "50"))
+PAGINA_MAXIMA = int(os.getenv("PAGINA_MAXIMA", "500"))
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginação malformado"""
+
+
+def _encode_cursor(*valores):
+    """Cursor opaco (base64 de JSON) com os valores da chave de ordenação da última linha"""
+    bruto = json.dumps([str(v) if isinstance(v, (date, datetime)) else v for v in valores])
+    return base64.urlsafe_b64encode(bruto.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor, tamanho):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(bruto.decode("utf-8"))
+    except Exception:
+        raise CursorInvalido(cursor)
+    if (not isinstance(valores, list) or len(valores) != tamanho
+            or not all(isinstance(v, (str, int)) for v in valores)):
+        raise CursorInvalido(cursor)
+    return valores
+
+def _limite_pagina(limit):
+    if limit is None:
+        return PAGINA_PADRAO
+    return max(1, min(int(limit), PAGINA_MAXIMA))
+
+def _like_prefixo(texto):
+    """Padrão LIKE 'texto%' (usa índice), escapando curingas digitados pelo usuário"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
 
 # =========================
 # FAMÍLIAS / ENTREGAS
 # =========================
+class CPFDuplicado(Exception):
+    """Já existe família cadastrada com o CPF informado"""
+
+
+CAMPOS_OBRIGATORIOS_FAMILIA = [
+    'responsavelNome',
+    'responsavelCPF',
+    'responsavelNascimento',
+    'responsavelGenero',
+    'responsavelEndereco',
+    'numeroPessoas'
+]
+
+# valores do ENUM familia_membros.parentesco
+PARENTESCOS = ('cônjuge', 'filho', 'pai', 'mãe', 'avo', 'outro')
+MEMBROS_MAXIMO = int(os.getenv("MEMBROS_MAXIMO", "30"))
+
+def validar_familia(data):
+    """Mensagem de erro do primeiro campo obrigatório ausente (ou CPF/membro inválido), ou None"""
+    for field in CAMPOS_OBRIGATORIOS_FAMILIA:
+        if not data.get(field):
+            return f"Campo obrigatório: {field}"
+    if _somente_digitos(data.get("responsavelCPF")) is None:
+        return "CPF inválido"  # "N/A", "-": gravaria NULL como se não tivesse CPF
+    return _validar_membros(data.get("membros"))
+
+def _validar_membros(membros):
+    """membros: [{"nome", "idade", "escolaridade", "estuda", "parentesco"}], opcional"""
+    if membros in (None, ""):
+        return None
+    if not isinstance(membros, list):
+        return "membros deve ser uma lista"
+    if len(membros) > MEMBROS_MAXIMO:
+        return f"Máximo de {MEMBROS_MAXIMO} membros por família"
+    for n, membro in enumerate(membros, start=1):
+        if not isinstance(membro, dict) or not str(membro.get("nome") or "").strip():
+            return f"Membro {n}: nome obrigatório"
+        idade = membro.get("idade")
+        if idade not in (None, ""):
+            try:
+                if not 0 <= int(idade) <= 130:
+                    raise ValueError(idade)
+            except (TypeError, ValueError):
+                return f"Membro {n}: idade inválida"
+        if membro.get("parentesco") not in (None, "", *PARENTESCOS):
+            return f"Membro {n}: parentesco inválido (use {', '.join(PARENTESCOS)})"
+    return None
+
+_SQL_INSERIR_FAMILIA = """
+INSERT INTO familias_cestas (
+    numero_pessoas, numero_filhos, renda_mensal_familia,
+    beneficios_sociais, condicao_moradia, tipo_moradia,
+    observacoes, necessidades_especificas,
+    responsavel_nome, responsavel_cpf, responsavel_nascimento,
+    responsavel_genero, endereco, telefone
+) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+def _familia_params(data):
+    return [
+        data.get("numeroPessoas"),
+        data.get("numeroFilhos") or 0,
+        None, None, None, None,
+        None,
+        None,
+        (data.get("responsavelNome") or "").strip(),
+        _somente_digitos(data.get("responsavelCPF")),
+        _data_iso_ou_none(data.get("responsavelNascimento")),
+        data.get("responsavelGenero"),
+        data.get("responsavelEndereco"),
+        (data.get("telefone") or "").strip() or None,
+    ]
+
+_SQL_INSERIR_MEMBRO = """
+INSERT INTO familia_membros (id_familia, nome_completo, idade, escolaridade, estuda, parentesco)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+def _membros_params(familia_id, membros):
+    return [[
+        familia_id,
+        str(m.get("nome")).strip(),
+        int(m["idade"]) if m.get("idade") not in (None, "") else None,
+        (m.get("escolaridade") or "").strip() or None,
+        bool(m.get("estuda")),
+        m.get("parentesco") or None,
+    ] for m in membros or []]
+
+def _is_duplicate_key(e):
+    return isinstance(e, pymysql.IntegrityError) and bool(e.args) and e.args[0] == 1062
+
 def salvar_familia(data):
-    sql = """
-    INSERT INTO familias_cestas (
-        numero_pessoas, numero_filhos, renda_mensal_familia,
-        beneficios_sociais, condicao_moradia, tipo_moradia,
-        observacoes, necessidades_especificas
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """
+    """Família e membros ("membros", ver _validar_membros) na mesma transação"""
     try:
         with get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, [
-                data.get("numeroPessoas"),
-                data.get("numeroFilhos", 0),
-                None, None, None, None,
-                f"Responsável: {data.get('responsavelNome')}, "
-                f"CPF: {data.get('responsavelCPF')}, "
-                f"Nascimento: {data.get('responsavelNascimento')}, "
-                f"Gênero: {data.get('responsavelGenero')}, "
-                f"Endereço: {data.get('responsavelEndereco')}, "
-                f"Telefone: {data.get('telefone', '')}",
-                None
-            ])
-            return cursor.lastrowid
+            cursor.execute(_SQL_INSERIR_FAMILIA, _familia_params(data))
+            familia_id = cursor.lastrowid
+            membros = _membros_params(familia_id, data.get("membros"))
+            if membros:
+                # executemany do PyMySQL junta tudo num INSERT de várias linhas
+                cursor.executemany(_SQL_INSERIR_MEMBRO, membros)
+        invalidar_dashboard()
+        return familia_id
+    except pymysql.IntegrityError as e:
+        if _is_duplicate_key(e):
+            raise CPFDuplicado(data.get("responsavelCPF")) from e
+        logging.error(f"Erro ao salvar família: {e}")
+        return None
     except Exception as e:
         logging.error(f"Erro ao salvar família: {e}")
         return None
 
-def listar_familias(query=None):
-    sql = """
-    SELECT f.id, f.numero_pessoas, f.numero_filhos, f.observacoes, f.data_cadastro, f.ativo
+def inserir_familias_lote(registros):
+    """
+    Insere um lote de famílias já validadas numa única transação.
+
+    registros: lista de (linha, data). CPFs já cadastrados são pulados.
+    Os "membros" de cada família entram na mesma transação.
+    Retorna [(linha, status, erro)] com status 'inserida', 'duplicada' ou 'erro'.
+    """
+    if not registros:
+        return []
+
+    resultados = {}
+    cpfs = [_somente_digitos(d.get("responsavelCPF")) for _, d in registros]
+    with get_db_cursor(commit=True) as cursor:
+        marcadores = ", ".join(["%s"] * len(cpfs))
+        cursor.execute(
+            f"SELECT responsavel_cpf FROM familias_cestas WHERE responsavel_cpf IN ({marcadores})",
+            cpfs
+        )
+        existentes = {r["responsavel_cpf"] for r in cursor.fetchall()}
+
+        novos = []
+        for (linha, data), cpf in zip(registros, cpfs):
+            if cpf and cpf in existentes:
+                resultados[linha] = ("duplicada", "CPF já cadastrado")
+            else:
+                existentes.add(cpf)
+                novos.append((linha, data))
+
+        # ids das famílias novas com membros, pelo lastrowid de cada INSERT (não
+        # pelo CPF, que pode faltar); as demais vão num executemany só
+        ids = {}
+        cursor.execute("SAVEPOINT lote_familias")
+        try:
+            sem_membros = [d for _, d in novos if not d.get("membros")]
+            if sem_membros:
+                cursor.executemany(_SQL_INSERIR_FAMILIA, [_familia_params(d) for d in sem_membros])
+            for linha, data in novos:
+                if data.get("membros"):
+                    cursor.execute(_SQL_INSERIR_FAMILIA, _familia_params(data))
+                    ids[linha] = cursor.lastrowid
+            for linha, _ in novos:
+                resultados[linha] = ("inserida", None)
+        except pymysql.IntegrityError:
+            # outro cadastro entrou no meio: desfaz o lote (executemany pode ter
+            # mandado mais de um INSERT) e refaz linha a linha para isolar as duplicadas
+            cursor.execute("ROLLBACK TO SAVEPOINT lote_familias")
+            ids = {}
+            for linha, data in novos:
+                try:
+                    cursor.execute(_SQL_INSERIR_FAMILIA, _familia_params(data))
+                    ids[linha] = cursor.lastrowid
+                    resultados[linha] = ("inserida", None)
+                except pymysql.IntegrityError as e:
+                    if _is_duplicate_key(e):
+                        resultados[linha] = ("duplicada", "CPF já cadastrado")
+                    else:
+                        resultados[linha] = ("erro", str(e))
+
+        membros = [params for linha, data in novos if data.get("membros") and linha in ids
+                   for params in _membros_params(ids[linha], data["membros"])]
+        if membros:
+            cursor.executemany(_SQL_INSERIR_MEMBRO, membros)
+
+    invalidar_dashboard()
+    return [(linha, *resultados[linha]) for linha, _ in registros]
+
+# resumo da família já formatado pelo MySQL, na ordem de COLUNAS_FAMILIA_RESUMO;
+# depois delas: legado (backfill pendente), observacoes e data_cadastro (paginação)
+COLUNAS_FAMILIA_RESUMO = ("id", "responsavel_nome", "cpf", "telefone", "numero_pessoas",
+                          "numero_filhos", "ultimaEntrega", "totalCestas")
+
+_COLUNAS_SQL_FAMILIA_RESUMO = """f.id,
+           COALESCE(NULLIF(f.responsavel_nome, ''), 'Nome não registrado'),
+           CASE WHEN CHAR_LENGTH(f.responsavel_cpf) = 11
+                THEN CONCAT(LEFT(f.responsavel_cpf, 3), '.', SUBSTRING(f.responsavel_cpf, 4, 3), '.',
+                            SUBSTRING(f.responsavel_cpf, 7, 3), '-', RIGHT(f.responsavel_cpf, 2))
+                ELSE COALESCE(NULLIF(f.responsavel_cpf, ''), '—') END,
+           COALESCE(NULLIF(f.telefone, ''), '—'),
+           f.numero_pessoas, f.numero_filhos,
+           COALESCE(DATE_FORMAT(f.ultima_entrega, '%%d/%%m/%%Y'), '—'),
+           f.total_cestas,
+           f.responsavel_nome IS NULL, f.observacoes, f.data_cadastro"""
+
+_SQL_FAMILIA_RESUMO = f"""
+    SELECT {_COLUNAS_SQL_FAMILIA_RESUMO}
     FROM familias_cestas f
-    WHERE f.ativo = TRUE
+"""
+
+def _familias_resumo(rows):
+    """Linhas (tupla) de _SQL_FAMILIA_RESUMO -> dicts da API"""
+    n = len(COLUNAS_FAMILIA_RESUMO)
+    itens = []
+    for row in rows:
+        item = dict(zip(COLUNAS_FAMILIA_RESUMO, row))
+        if row[n]:
+            # backfill ainda não passou por esta linha: dados no formato antigo
+            legado = _parse_observacoes_legado(row[n + 1]) or {}
+            item["responsavel_nome"] = legado.get("nome") or "Nome não registrado"
+            item["cpf"] = formatar_cpf(_somente_digitos(legado.get("cpf")))
+            item["telefone"] = legado.get("telefone") or "—"
+        itens.append(item)
+    return itens
+
+def listar_familias(query=None, limit=None, after=None):
     """
+    Página de famílias ativas, da mais recente para a mais antiga, ordenada por
+    (data_cadastro, id). Retorna {"items": [...], "next_cursor": str | None}.
+    """
+    limit = _limite_pagina(limit)
+    sql = _SQL_FAMILIA_RESUMO + " WHERE f.ativo = TRUE"
     params = []
     if query:
-        sql += " AND f.observacoes LIKE %s"
-        params.append(f"%{query}%")
-    sql += " ORDER BY f.data_cadastro DESC"
+        digitos = _somente_digitos(query)
+        if digitos and not re.search(r"[^\d\s.\-/]", query):
+            # CPF (ou id) digitado: busca por prefixo no índice único de CPF
+            sql += " AND (f.responsavel_cpf LIKE %s OR f.id = %s)"
+            params.extend([_like_prefixo(digitos), int(digitos)])
+        else:
+            sql += " AND f.responsavel_nome LIKE %s"
+            params.append(_like_prefixo(query))
+    if after:
+        data_cadastro, familia_id = _decode_cursor(after, 2)
+        sql += " AND (f.data_cadastro < %s OR (f.data_cadastro = %s AND f.id < %s))"
+        params.extend([data_cadastro, data_cadastro, familia_id])
+    sql += " ORDER BY f.data_cadastro DESC, f.id DESC LIMIT %s"
+    params.append(limit + 1)
 
     try:
-        with get_db_cursor() as cursor:
+        with get_db_cursor(tuplas=True, leitura=True) as cursor:
             cursor.execute(sql, params)
-            familias = []
-            for row in cursor.fetchall():
-                nome = "Nome não registrado"
-                cpf = "—"
-                telefone = "—"
-
-                if row.get("observacoes"):
-                    for part in row["observacoes"].split(", "):
-                        if part.startswith("Responsável:"):
-                            nome = part.replace("Responsável: ", "").strip()
-                        elif part.startswith("CPF:"):
-                            cpf = part.replace("CPF: ", "").strip()
-                        elif part.startswith("Telefone:"):
-                            telefone = part.replace("Telefone: ", "").strip()
-
-                familias.append({
-                    "id": row["id"],
-                    "responsavel_nome": nome,
-                    "cpf": cpf,
-                    "telefone": telefone,
-                    "numero_pessoas": row["numero_pessoas"],
-                    "numero_filhos": row["numero_filhos"],
-                    "ultimaEntrega": "—",
-                })
-            return familias
+            rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][-1], rows[-1][0])
+
+        return {"items": _familias_resumo(rows), "next_cursor": next_cursor}
     except Exception as e:
         logging.error(f"Erro ao listar famílias: {e}")
+        return {"items": [], "next_cursor": None}
+
+def _dados_responsavel(row):
+    """(nome, cpf, telefone) da linha, lendo observacoes se o backfill ainda não passou por ela"""
+    if row["responsavel_nome"] is None:
+        legado = _parse_observacoes_legado(row["observacoes"]) or {}
+        return legado.get("nome"), _somente_digitos(legado.get("cpf")), legado.get("telefone")
+    return row["responsavel_nome"], row["responsavel_cpf"], row["telefone"]
+
+def listar_familias_por_ids(ids):
+    """Famílias ativas com os ids informados, na ordem de `ids` (ex.: ranking da busca)"""
+    if not ids:
+        return []
+    marcadores = ", ".join(["%s"] * len(ids))
+    sql = _SQL_FAMILIA_RESUMO + f" WHERE f.ativo = TRUE AND f.id IN ({marcadores})"
+    try:
+        with get_db_cursor(tuplas=True, leitura=True) as cursor:
+            cursor.execute(sql, list(ids))
+            por_id = {item["id"]: item for item in _familias_resumo(cursor.fetchall())}
+        return [por_id[i] for i in ids if i in por_id]
+    except Exception as e:
+        logging.error(f"Erro ao listar famílias por id: {e}")
         return []
 
-def salvar_entrega(data):
-    sql = """
-    INSERT INTO movimento_cestas (
-        id_familia, data_entrega, quantidade_cestas,
-        observacoes_entrega, id_usuario_registro
-    ) VALUES (%s, %s, %s, %s, %s)
+# detalhe: o resumo (com as 3 colunas de controle) seguido destas
+COLUNAS_FAMILIA_DETALHE = ("nascimento", "genero", "endereco", "ativo", "dataCadastro")
+
+_SQL_FAMILIA_DETALHE = f"""
+    SELECT {_COLUNAS_SQL_FAMILIA_RESUMO},
+           DATE_FORMAT(f.responsavel_nascimento, '%%Y-%%m-%%d'), f.responsavel_genero,
+           f.endereco, f.ativo, DATE_FORMAT(f.data_cadastro, '%%d/%%m/%%Y')
+    FROM familias_cestas f
+"""
+
+COLUNAS_MEMBRO = ("id", "nome", "idade", "escolaridade", "estuda", "parentesco")
+
+def detalhar_familias(ids):
+    """
+    Famílias (ativas ou não) com os membros, na ordem de `ids`: duas consultas
+    (famílias e membros, cada uma com IN), qualquer que seja o número de ids.
+    """
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if not ids:
+        return []
+    marcadores = ", ".join(["%s"] * len(ids))
+    n = len(COLUNAS_FAMILIA_RESUMO)
+    with get_db_cursor(tuplas=True, leitura=True) as cursor:
+        cursor.execute(_SQL_FAMILIA_DETALHE + f" WHERE f.id IN ({marcadores})", ids)
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        cursor.execute(f"""
+            SELECT id_familia, id, nome_completo, idade, escolaridade, estuda, parentesco
+            FROM familia_membros
+            WHERE id_familia IN ({marcadores})
+            ORDER BY id_familia, id
+        """, ids)
+        membros = {}
+        for row in cursor.fetchall():
+            membro = dict(zip(COLUNAS_MEMBRO, row[1:]))
+            membro["estuda"] = bool(membro["estuda"])
+            membros.setdefault(row[0], []).append(membro)
+
+    por_id = {}
+    for row, item in zip(rows, _familias_resumo(rows)):
+        item.update(zip(COLUNAS_FAMILIA_DETALHE, row[n + 3:]))
+        item["ativo"] = bool(item["ativo"])
+        if row[n]:
+            legado = _parse_observacoes_legado(row[n + 1]) or {}
+            item["nascimento"] = legado.get("nascimento")
+            item["genero"] = legado.get("genero")
+            item["endereco"] = legado.get("endereco")
+        item["membros"] = membros.get(item["id"], [])
+        por_id[item["id"]] = item
+    return [por_id[i] for i in ids if i in por_id]
+
+def iter_familias_para_indice(apos_id=0, tamanho_lote=5000):
+    """
+    Gera (id, nome, cpf, telefone) das famílias ativas com id > apos_id, em
+    páginas pela chave primária. Usado para montar/atualizar o índice de busca.
+    """
+    while True:
+        with get_db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, responsavel_nome, responsavel_cpf, telefone, observacoes
+                FROM familias_cestas
+                WHERE ativo = TRUE AND id > %s
+                ORDER BY id LIMIT %s
+            """, [apos_id, tamanho_lote])
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield (row["id"], *_dados_responsavel(row))
+        apos_id = rows[-1]["id"]
+        if len(rows) < tamanho_lote:
+            return
+
+def marca_familias():
+    """Maior familias_cestas.atualizado_em (None sem famílias): marca d'água do índice de busca"""
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT MAX(atualizado_em) AS marca FROM familias_cestas")
+        return cursor.fetchone()["marca"]
+
+def iter_familias_alteradas(desde, tamanho_lote=5000):
+    """
+    Gera (id, nome, cpf, telefone, ativo, atualizado_em) das famílias criadas ou
+    alteradas a partir de `desde` (None: todas), inclusive as desativadas, em
+    páginas por (atualizado_em, id). Usado para atualizar o índice de busca.
     """
+    desde, apos_id = desde or datetime(1970, 1, 1), 0
+    while True:
+        with get_db_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, responsavel_nome, responsavel_cpf, telefone, observacoes, ativo,
+                       atualizado_em
+                FROM familias_cestas
+                WHERE atualizado_em > %s OR (atualizado_em = %s AND id > %s)
+                ORDER BY atualizado_em, id LIMIT %s
+            """, [desde, desde, apos_id, tamanho_lote])
+            rows = cursor.fetchall()
+        for row in rows:
+            yield (row["id"], *_dados_responsavel(row), bool(row["ativo"]), row["atualizado_em"])
+        if len(rows) < tamanho_lote:
+            return
+        desde, apos_id = rows[-1]["atualizado_em"], rows[-1]["id"]
+
+# =========================
+# RESUMO DE ENTREGAS POR FAMÍLIA / ELEGIBILIDADE
+# =========================
+# familias_cestas.ultima_entrega / total_cestas são mantidas na transação de
+# cada entrega; este SET recalcula do histórico (migração 0005, seed)
+SQL_RESUMO_ENTREGAS = """
+    ultima_entrega = (SELECT MAX(m.data_entrega) FROM movimento_cestas m
+                      WHERE m.id_familia = familias_cestas.id),
+    total_cestas = (SELECT COALESCE(SUM(m.quantidade_cestas), 0) FROM movimento_cestas m
+                    WHERE m.id_familia = familias_cestas.id)
+"""
+
+class EntregaDuplicada(Exception):
+    """A família já recebeu cesta no mesmo mês (reenviar com "forcar" para registrar assim mesmo)"""
+
+    def __init__(self, mensagem, ultima_entrega=None):
+        super().__init__(mensagem)
+        self.ultima_entrega = ultima_entrega
+
+def recalcular_resumo_entregas(tamanho_lote=None):
+    """Recalcula ultima_entrega/total_cestas de todas as famílias, em lotes por faixa de id"""
+    tamanho_lote = tamanho_lote or FAMILIAS_BACKFILL_LOTE
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT MIN(id) AS a, MAX(id) AS b FROM familias_cestas")
+        faixa = cursor.fetchone()
+    if faixa["a"] is None:
+        return 0
+    total = 0
+    for de in range(faixa["a"], faixa["b"] + 1, tamanho_lote):
+        with get_db_cursor(commit=True) as cursor:
+            total += cursor.execute(
+                f"UPDATE familias_cestas SET {SQL_RESUMO_ENTREGAS} WHERE id BETWEEN %s AND %s",
+                [de, de + tamanho_lote - 1]
+            )
+    return total
+
+def _familias_travadas(cursor, familia_ids):
+    """{id: ultima_entrega} das famílias, com as linhas travadas até o fim da transação"""
+    marcadores = ", ".join(["%s"] * len(familia_ids))
+    cursor.execute(f"""
+        SELECT id, ultima_entrega FROM familias_cestas
+        WHERE id IN ({marcadores}) ORDER BY id FOR UPDATE
+    """, sorted(familia_ids))
+    return {r["id"]: r["ultima_entrega"] for r in cursor.fetchall()}
+
+def _meses_com_entrega(cursor, ultimas, entregas):
+    """
+    {(familia_id, primeiro dia do mês)} já com entrega, para os pares de
+    `entregas` [(familia_id, data)]. Quem tem ultima_entrega anterior ao mês
+    pedido nem vai ao histórico; os demais (entrega retroativa) usam
+    idx_familia_data numa consulta só.
+    """
+    duvidas = [(f, d) for f, d in entregas
+               if ultimas.get(f) and ultimas[f] >= _inicio_mes(d)]
+    if not duvidas:
+        return set()
+    familias = sorted({f for f, _ in duvidas})
+    marcadores = ", ".join(["%s"] * len(familias))
+    cursor.execute(f"""
+        SELECT DISTINCT id_familia, data_entrega FROM movimento_cestas
+        WHERE id_familia IN ({marcadores}) AND data_entrega >= %s AND data_entrega < %s
+    """, familias + [_inicio_mes(min(d for _, d in duvidas)),
+                     _proximo_mes(max(d for _, d in duvidas))])
+    return {(r["id_familia"], _inicio_mes(r["data_entrega"])) for r in cursor.fetchall()}
+
+def _atualizar_resumo_familias(cursor, entregas):
+    """Soma as entregas [(familia_id, data, quantidade)] em ultima_entrega/total_cestas"""
+    por_familia = {}
+    for familia_id, dia, quantidade in entregas:
+        ultima, total = por_familia.get(familia_id, (dia, 0))
+        por_familia[familia_id] = (max(ultima, dia), total + quantidade)
+    # atualizado_em = atualizado_em: a entrega não muda nada do que o índice de busca
+    # guarda, então não renova a marca d'água (sem isso, o ON UPDATE renovaria)
+    cursor.executemany("""
+        UPDATE familias_cestas
+        SET total_cestas = total_cestas + %s,
+            ultima_entrega = GREATEST(COALESCE(ultima_entrega, %s), %s),
+            atualizado_em = atualizado_em
+        WHERE id = %s
+    """, [(total, ultima, ultima, familia_id)
+          for familia_id, (ultima, total) in sorted(por_familia.items())])
+
+CAMPOS_OBRIGATORIOS_ENTREGA = ['familiaEntrega', 'dataEntrega', 'quantidadeCestas', 'responsavelEntrega']
+
+class EntregaInvalida(ValueError):
+    """Entrega recusada pelos dados ou pelo estoque: não adianta reenviar igual"""
+
+
+def validar_entrega(data):
+    """Mensagem de erro do primeiro campo obrigatório ausente, ou None"""
+    for field in CAMPOS_OBRIGATORIOS_ENTREGA:
+        if not data.get(field):
+            return f"Campo obrigatório: {field}"
+    return None
+
+def _entrega_validada(item):
+    """
+    Checagens sem banco comuns a salvar_entrega e salvar_entregas_lote.
+    Retorna (familia_id, quantidade, kit_id, data_entrega) ou levanta EntregaInvalida.
+    """
+    if not isinstance(item, dict):
+        raise EntregaInvalida("Entrega inválida")
+    erro = validar_entrega(item)
+    if erro:
+        raise EntregaInvalida(erro)
+    data_entrega = _data_iso_ou_none(item.get("dataEntrega"))
+    if data_entrega is None:
+        raise EntregaInvalida("Data de entrega inválida")
+    try:
+        quantidade = int(item.get("quantidadeCestas"))
+        familia_id = int(item.get("familiaEntrega"))
+        kit_id = _kit_da_entrega(item)
+    except (TypeError, ValueError):
+        raise EntregaInvalida("Quantidade, família ou kit inválido") from None
+    if quantidade <= 0:
+        raise EntregaInvalida("Quantidade deve ser > 0")
+    return familia_id, quantidade, kit_id, data_entrega
+
+_SQL_INSERIR_ENTREGA = """
+INSERT INTO movimento_cestas (
+    id_familia, data_entrega, quantidade_cestas,
+    observacoes_entrega, id_usuario_registro, kit_id, chave_idempotencia
+) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# =========================
+# CHAVES DE IDEMPOTÊNCIA
+# =========================
+# movimento_cestas e estoque_cestas guardam a chave de quem enviou (cabeçalho
+# Idempotency-Key, campo "chave" do lote, diário local): reenviar a mesma
+# escrita depois de um timeout ou queda não grava de novo
+CHAVE_IDEMPOTENCIA_MAX = 64
+
+def chave_idempotencia(valor):
+    """Normaliza a chave enviada pelo cliente (None se vazia); longas viram o sha256"""
+    if valor in (None, ""):
+        return None
+    valor = str(valor).strip()
+    if len(valor) > CHAVE_IDEMPOTENCIA_MAX:
+        return hashlib.sha256(valor.encode("utf-8")).hexdigest()
+    return valor or None
+
+def _chaves_registradas(cursor, tabela, chaves):
+    """Quais das chaves já estão gravadas em `tabela` (uk_*_chave)"""
+    chaves = sorted(set(chaves))
+    if not chaves:
+        return set()
+    marcadores = ", ".join(["%s"] * len(chaves))
+    cursor.execute(
+        f"SELECT chave_idempotencia FROM {tabela} WHERE chave_idempotencia IN ({marcadores})", chaves
+    )
+    return {r["chave_idempotencia"] for r in cursor.fetchall()}
+
+def _kit_da_entrega(data):
+    """kitEntrega é opcional; levanta ValueError se vier preenchido e não for um id"""
+    kit = data.get("kitEntrega")
+    if kit in (None, ""):
+        return None
+    return int(kit)
+
+def _entrega_params(data, quantidade, kit_id=None, chave=None):
+    return [
+        data.get("familiaEntrega"),
+        data.get("dataEntrega"),
+        quantidade,
+        f"Entregue por: {data.get('responsavelEntrega')}",
+        1,
+        kit_id,
+        chave
+    ]
+
+# a entrega avulsa sempre pôde deixar o saldo negativo (cestas doadas na hora,
+# entrada lançada depois); com 1, recusa como o lote faz
+ENTREGA_EXIGIR_ESTOQUE = os.getenv("ENTREGA_EXIGIR_ESTOQUE", "0") == "1"
+
+def salvar_entrega(data, chave=None):
+    """
+    Registra a entrega e baixa o saldo de cestas. Com "kitEntrega", baixa também
+    a composição do kit do estoque de insumos, na mesma transação; levanta
+    KitIndisponivel se o kit não tiver composição ou faltar algum insumo.
+    Levanta EntregaDuplicada se a família já recebeu cesta no mês da entrega,
+    a não ser com "forcar", e EntregaInvalida com as mesmas regras de dados do
+    lote (e de estoque, com ENTREGA_EXIGIR_ESTOQUE). Com `chave` já gravada,
+    não faz nada (reenvio).
+    Levanta BancoIndisponivel se o MySQL não respondeu (ver diario.py).
+    """
+    familia_id, quantidade, kit_id, data_entrega = _entrega_validada(data)
     try:
         with get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, [
-                data.get("familiaEntrega"),
-                data.get("dataEntrega"),
-                data.get("quantidadeCestas", 1),
-                f"Entregue por: {data.get('responsavelEntrega')}",
-                1
-            ])
+            # mesma ordem de locks do lote: saldo de cestas, família, insumos, estatísticas.
+            # O lock do saldo também serializa as entregas: dois reenvios não passam juntos daqui
+            cursor.execute("SELECT saldo FROM estoque_saldo WHERE id = 1 FOR UPDATE")
+            row = cursor.fetchone()
+            if chave and _chaves_registradas(cursor, "movimento_cestas", [chave]):
+                return True
+            if ENTREGA_EXIGIR_ESTOQUE and quantidade > (int(row["saldo"]) if row else 0):
+                raise EntregaInvalida("Estoque insuficiente")
+            _ajustar_saldo(cursor, -quantidade)
+            ultimas = _familias_travadas(cursor, [familia_id])
+            if familia_id not in ultimas:
+                raise EntregaInvalida("Família não encontrada")
+            if not data.get("forcar") and _meses_com_entrega(cursor, ultimas, [(familia_id, data_entrega)]):
+                raise EntregaDuplicada(
+                    f"A família já recebeu cesta em {data_entrega:%m/%Y}.", ultimas[familia_id]
+                )
+            if kit_id:
+                composicao = _composicao_travada(cursor, [kit_id])
+                _verificar_kit(composicao, _saldos_insumos(composicao), kit_id, quantidade)
+            _registrar_estatisticas(cursor, [(familia_id, data_entrega, quantidade)])
+            cursor.execute(_SQL_INSERIR_ENTREGA, _entrega_params(data, quantidade, kit_id, chave))
+            if kit_id:
+                _baixar_insumos(cursor, kit_id, quantidade, movimento_id=cursor.lastrowid)
+            _atualizar_resumo_familias(cursor, [(familia_id, data_entrega, quantidade)])
+        invalidar_dashboard()
         return True
+    except (KitIndisponivel, EntregaDuplicada, EntregaInvalida):
+        raise
     except Exception as e:
         logging.error(f"Erro ao salvar entrega: {e}")
+        if _banco_indisponivel(e):
+            raise BancoIndisponivel(str(e)) from e
         return False
 
-def listar_entregas(filtro_data_inicio=None, filtro_data_fim=None, familia_id=None):
-    sql = """
-    SELECT m.data_entrega, m.quantidade_cestas, m.observacoes_entrega, f.id as familia_id
+LOTE_ENTREGAS_MAXIMO = int(os.getenv("LOTE_ENTREGAS_MAXIMO", "500"))
+
+def salvar_entregas_lote(itens, levantar_indisponivel=False):
+    """
+    Registra várias entregas numa única transação (dias de distribuição).
+
+    O saldo é lido uma vez, com a linha travada, e as entregas são aceitas na
+    ordem enviada enquanto houver estoque. Uma família só recebe uma entrega
+    por mês (contando o histórico e o próprio lote), a não ser com "forcar"
+    no item. Retorna uma lista com um resultado
+    por item, na mesma ordem: {"indice", "id", "status", "erro"}, onde status é
+    "ok", "rejeitada" (dados/estoque; não adianta reenviar) ou "falha" (erro do
+    banco; pode ser reenviada). "id" ecoa o identificador opcional do cliente.
+    Item com "chave" (idempotência) já gravada volta "ok" sem gravar de novo.
+    Com levantar_indisponivel, banco fora levanta BancoIndisponivel e "falha"
+    fica só para os demais erros da transação (a drenagem do diário separa os dois).
+    """
+    resultados = [{"indice": i, "id": (item or {}).get("id"), "status": "ok", "erro": None}
+                  for i, item in enumerate(itens)]
+
+    def rejeitar(i, erro, status="rejeitada"):
+        resultados[i]["status"] = status
+        resultados[i]["erro"] = erro
+
+    validos = []
+    for i, item in enumerate(itens):
+        try:
+            familia_id, quantidade, kit_id, _ = _entrega_validada(item)
+        except EntregaInvalida as e:
+            rejeitar(i, str(e))
+            continue
+        validos.append((i, item, familia_id, quantidade, kit_id))
+
+    if not validos:
+        return resultados
+
+    try:
+        with get_db_cursor(commit=True) as cursor:
+            cursor.execute("SELECT saldo FROM estoque_saldo WHERE id = 1 FOR UPDATE")
+            row = cursor.fetchone()
+            saldo = int(row["saldo"]) if row else 0
+
+            chaves = {i: chave_idempotencia(item.get("chave")) for i, item, *_ in validos}
+            registradas = _chaves_registradas(cursor, "movimento_cestas",
+                                              [c for c in chaves.values() if c])
+
+            ultimas = _familias_travadas(cursor, {familia_id for _, _, familia_id, _, _ in validos})
+            datas = {i: _data_iso_ou_none(item.get("dataEntrega")) for i, item, *_ in validos}
+            atendidas = _meses_com_entrega(cursor, ultimas, [
+                (familia_id, datas[i]) for i, item, familia_id, _, _ in validos
+                if familia_id in ultimas and not item.get("forcar")
+            ])
+
+            kit_ids = sorted({kit_id for *_, kit_id in validos if kit_id})
+            composicao = _composicao_travada(cursor, kit_ids) if kit_ids else {}
+            saldos = _saldos_insumos(composicao)
+
+            aceitos = []
+            total = 0
+            por_kit = {}
+            for i, item, familia_id, quantidade, kit_id in validos:
+                if chaves[i] and chaves[i] in registradas:
+                    continue  # reenvio de entrega já gravada (inclusive repetida no lote)
+                if familia_id not in ultimas:
+                    rejeitar(i, "Família não encontrada")
+                    continue
+                mes = (familia_id, _inicio_mes(datas[i]))
+                if mes in atendidas and not item.get("forcar"):
+                    rejeitar(i, f"A família já recebeu cesta em {datas[i]:%m/%Y}")
+                    continue
+                if total + quantidade > saldo:
+                    rejeitar(i, "Estoque insuficiente")
+                    continue
+                if kit_id:
+                    try:
+                        _verificar_kit(composicao, saldos, kit_id, quantidade)
+                    except KitIndisponivel as e:
+                        rejeitar(i, str(e))
+                        continue
+                    for linha in composicao[kit_id]:
+                        saldos[linha["insumo_id"]] -= linha["quantidade"] * quantidade
+                    por_kit[kit_id] = por_kit.get(kit_id, 0) + quantidade
+                total += quantidade
+                atendidas.add(mes)
+                if chaves[i]:
+                    registradas.add(chaves[i])
+                aceitos.append((i, item, familia_id, quantidade, kit_id))
+
+            if aceitos:
+                por_entrega = [(familia_id, datas[i], quantidade)
+                               for i, _, familia_id, quantidade, _ in aceitos]
+                _registrar_estatisticas(cursor, por_entrega)
+                cursor.executemany(
+                    _SQL_INSERIR_ENTREGA,
+                    [_entrega_params(item, quantidade, kit_id, chaves[i])
+                     for i, item, _, quantidade, kit_id in aceitos]
+                )
+                _ajustar_saldo(cursor, -total)
+                _atualizar_resumo_familias(cursor, por_entrega)
+                # uma baixa por kit com o total do lote (não uma por entrega)
+                for kit_id, quantidade in por_kit.items():
+                    _baixar_insumos(cursor, kit_id, quantidade, observacoes="Lote de entregas")
+    except Exception as e:
+        if levantar_indisponivel and _banco_indisponivel(e):
+            raise BancoIndisponivel(str(e)) from e
+        logging.error(f"Erro ao salvar lote de entregas: {e}")
+        for i, *_ in validos:
+            rejeitar(i, "Erro ao registrar entrega", status="falha")
+        return resultados
+
+    invalidar_dashboard()
+    return resultados
+
+# colunas da listagem de entregas, na ordem do SELECT (depois: data_entrega e id, da paginação)
+COLUNAS_ENTREGA = ("data_entrega", "familia_nome", "responsavel", "quantidade", "responsavel_entrega")
+
+_SQL_RESPONSAVEL_ENTREGA = """IF(LOCATE('Entregue por:', m.observacoes_entrega) > 0,
+       TRIM(REPLACE(m.observacoes_entrega, 'Entregue por:', '')), '—')"""
+
+def listar_entregas(filtro_data_inicio=None, filtro_data_fim=None, familia_id=None,
+                    limit=None, after=None):
+    """
+    Página de entregas ordenada por (data_entrega, id), mais recentes primeiro.
+    Retorna {"items": [...], "next_cursor": str | None}.
+    """
+    limit = _limite_pagina(limit)
+    sql = f"""
+    SELECT DATE_FORMAT(m.data_entrega, '%%d/%%m/%%Y'), CONCAT('Família ', f.id),
+           {_SQL_RESPONSAVEL_ENTREGA}, m.quantidade_cestas, {_SQL_RESPONSAVEL_ENTREGA},
+           m.data_entrega, m.id
     FROM movimento_cestas m
     JOIN familias_cestas f ON m.id_familia = f.id
     WHERE 1=1
@@ -280,151 +1428,727 @@ def listar_entregas(filtro_data_inicio=None, filtro_data_fim=None, familia_id=No
     if familia_id:
         sql += " AND f.id = %s"
         params.append(familia_id)
-    sql += " ORDER BY m.data_entrega DESC"
+    if after:
+        data_entrega, movimento_id = _decode_cursor(after, 2)
+        sql += " AND (m.data_entrega < %s OR (m.data_entrega = %s AND m.id < %s))"
+        params.extend([data_entrega, data_entrega, movimento_id])
+    sql += " ORDER BY m.data_entrega DESC, m.id DESC LIMIT %s"
+    params.append(limit + 1)
 
     try:
-        with get_db_cursor() as cursor:
+        with get_db_cursor(tuplas=True, leitura=True) as cursor:
             cursor.execute(sql, params)
-            entregas = []
-            for row in cursor.fetchall():
-                responsavel = "—"
-                obs = row.get("observacoes_entrega") or ""
-                if "Entregue por:" in obs:
-                    responsavel = obs.replace("Entregue por:", "").strip()
-
-                entregas.append({
-                    "data_entrega": row["data_entrega"].strftime("%d/%m/%Y"),
-                    "familia_nome": f"Família {row['familia_id']}",
-                    "responsavel": responsavel,
-                    "quantidade": row["quantidade_cestas"],
-                    "responsavel_entrega": responsavel
-                })
-            return entregas
+            rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][-2], rows[-1][-1])
+        return {"items": linhas_para_dicts(COLUNAS_ENTREGA, rows), "next_cursor": next_cursor}
     except Exception as e:
         logging.error(f"Erro ao listar entregas: {e}")
-        return []
+        return {"items": [], "next_cursor": None}
 
-def registrar_entrada_estoque(quantidade, fornecedor, observacoes):
+def registrar_entrada_estoque(quantidade, fornecedor, observacoes, chave=None, data_entrada=None):
+    """
+    data_entrada (padrão: hoje) serve ao diário local, que grava depois.
+    Com `chave` já gravada, não faz nada (reenvio); levanta BancoIndisponivel
+    se o MySQL não respondeu.
+    """
     sql = """
-    INSERT INTO estoque_cestas (data_entrada, quantidade_entrada, fornecedor, observacoes)
-    VALUES (CURDATE(), %s, %s, %s)
+    INSERT INTO estoque_cestas (data_entrada, quantidade_entrada, fornecedor, observacoes,
+                                chave_idempotencia)
+    VALUES (COALESCE(%s, CURDATE()), %s, %s, %s, %s)
     """
     try:
+        quantidade = int(quantidade)
         with get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, [quantidade, fornecedor, observacoes])
+            cursor.execute(sql, [data_entrada, quantidade, fornecedor, observacoes, chave])
+            _ajustar_saldo(cursor, quantidade)
+        invalidar_dashboard()
         return True
     except Exception as e:
+        if chave and _is_duplicate_key(e):
+            return True  # uk_estoque_cestas_chave: a entrada já foi gravada
         logging.error(f"Erro ao registrar entrada no estoque: {e}")
+        if _banco_indisponivel(e):
+            raise BancoIndisponivel(str(e)) from e
         return False
 
-def get_saldo_estoque():
-    """Calcula saldo (entradas - saídas) - compatível com DictCursor"""
-    try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT COALESCE(SUM(quantidade_entrada), 0) AS total FROM estoque_cestas")
-            total_entrada = cursor.fetchone()["total"] or 0
+# =========================
+# ESTOQUE DE INSUMOS (composição dos kits)
+# =========================
+class KitIndisponivel(Exception):
+    """Kit sem composição cadastrada ou com insumo em falta (ver .faltas)"""
 
-            cursor.execute("SELECT COALESCE(SUM(quantidade_cestas), 0) AS total FROM movimento_cestas")
-            total_saida = cursor.fetchone()["total"] or 0
+    def __init__(self, mensagem, faltas=()):
+        super().__init__(mensagem)
+        self.faltas = list(faltas)
 
-            return int(total_entrada) - int(total_saida)
-    except Exception as e:
-        logging.error(f"Erro ao calcular saldo de estoque: {e}")
-        return 0
+def _composicao_travada(cursor, kit_ids):
+    """
+    Composição dos kits com o saldo atual de cada insumo: {kit_id: [linha, ...]}.
+    Trava as linhas de saldo (FOR UPDATE) até o fim da transação, para a
+    verificação e a baixa verem o mesmo estoque.
+    """
+    marcadores = ", ".join(["%s"] * len(kit_ids))
+    cursor.execute(f"""
+        SELECT ii.kit_id, ii.insumo_id, i.nome, ii.quantidade, COALESCE(e.saldo, 0) AS saldo
+        FROM cesta_kit_itens ii
+        JOIN cesta_insumos i ON i.id = ii.insumo_id
+        LEFT JOIN insumo_estoque e ON e.insumo_id = ii.insumo_id
+        WHERE ii.kit_id IN ({marcadores})
+        ORDER BY ii.insumo_id
+        FOR UPDATE
+    """, list(kit_ids))
+    composicao = {}
+    for row in cursor.fetchall():
+        composicao.setdefault(row["kit_id"], []).append(row)
+    return composicao
+
+def _saldos_insumos(composicao):
+    return {linha["insumo_id"]: linha["saldo"] for linhas in composicao.values() for linha in linhas}
 
-def listar_movimentacoes_estoque():
+def _verificar_kit(composicao, saldos, kit_id, quantidade):
+    if kit_id not in composicao:
+        raise KitIndisponivel("Kit sem composição cadastrada")
+    faltas = [{
+        "insumo_id": linha["insumo_id"],
+        "insumo_nome": linha["nome"],
+        "necessario": float(linha["quantidade"] * quantidade),
+        "saldo": float(saldos[linha["insumo_id"]]),
+    } for linha in composicao[kit_id] if saldos[linha["insumo_id"]] < linha["quantidade"] * quantidade]
+    if faltas:
+        raise KitIndisponivel(
+            "Insumos insuficientes: " + ", ".join(f["insumo_nome"] for f in faltas), faltas
+        )
+
+def _baixar_insumos(cursor, kit_id, quantidade, movimento_id=None, observacoes=None):
+    """
+    Baixa `quantidade` kits do estoque de insumos em dois comandos, qualquer que
+    seja o tamanho da composição: UPDATE ... JOIN nos saldos e INSERT ... SELECT
+    nos movimentos. Deve rodar na transação da entrega, depois de _verificar_kit.
+    """
+    cursor.execute("""
+        UPDATE insumo_estoque e
+        JOIN cesta_kit_itens ii ON ii.insumo_id = e.insumo_id
+        SET e.saldo = e.saldo - ii.quantidade * %s
+        WHERE ii.kit_id = %s
+    """, [quantidade, kit_id])
+    cursor.execute("""
+        INSERT INTO insumo_movimentos
+            (insumo_id, tipo, quantidade, kit_id, id_movimento_cesta, observacoes)
+        SELECT ii.insumo_id, 'saida', -ii.quantidade * %s, ii.kit_id, %s, %s
+        FROM cesta_kit_itens ii
+        WHERE ii.kit_id = %s
+    """, [quantidade, movimento_id, observacoes, kit_id])
+
+def registrar_entrada_insumo(insumo_id, quantidade, observacoes=None):
     try:
-        with get_db_cursor() as cursor:
+        with get_db_cursor(commit=True) as cursor:
             cursor.execute("""
-                SELECT data_entrada as data, quantidade_entrada as entrada, 0 as saida,
-                       fornecedor as motivo, 'Estoque' as responsavel
-                FROM estoque_cestas
-                ORDER BY data_entrada DESC
-            """)
-            entradas = cursor.fetchall()
-
+                INSERT INTO insumo_movimentos (insumo_id, tipo, quantidade, observacoes)
+                VALUES (%s, 'entrada', %s, %s)
+            """, [insumo_id, quantidade, observacoes])
             cursor.execute("""
-                SELECT data_entrega as data, 0 as entrada, quantidade_cestas as saida,
-                       'Entrega a família' as motivo, 'Sistema' as responsavel
-                FROM movimento_cestas
-                ORDER BY data_entrega DESC
-            """)
-            saidas = cursor.fetchall()
-
-            movimentacoes = []
-            for e in entradas:
-                movimentacoes.append({
-                    "data_movimentacao": e["data"],
-                    "quantidade_entrada": e["entrada"],
-                    "quantidade_saida": e["saida"],
-                    "motivo_saida": e["motivo"],
-                    "responsavel": e["responsavel"]
-                })
-
-            for s in saidas:
-                movimentacoes.append({
-                    "data_movimentacao": s["data"],
-                    "quantidade_entrada": s["entrada"],
-                    "quantidade_saida": s["saida"],
-                    "motivo_saida": s["motivo"],
-                    "responsavel": s["responsavel"]
-                })
-
-            movimentacoes.sort(key=lambda x: x["data_movimentacao"], reverse=True)
-            return movimentacoes
+                INSERT INTO insumo_estoque (insumo_id, saldo) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE saldo = saldo + VALUES(saldo)
+            """, [insumo_id, quantidade])
+        return True
+    except Exception as e:
+        logging.error(f"Erro ao registrar entrada de insumo: {e}")
+        return False
+
+def listar_estoque_insumos():
+    sql = """
+    SELECT i.id, i.nome, i.unidade, i.ativo, COALESCE(e.saldo, 0) AS saldo
+    FROM cesta_insumos i
+    LEFT JOIN insumo_estoque e ON e.insumo_id = i.id
+    ORDER BY i.nome
+    """
+    try:
+        with get_db_cursor(leitura=True) as cursor:
+            cursor.execute(sql)
+            return [{**row, "saldo": float(row["saldo"])} for row in cursor.fetchall()]
     except Exception as e:
-        logging.error(f"Erro ao listar movimentações: {e}")
+        logging.error(f"Erro ao listar estoque de insumos: {e}")
         return []
 
-def get_dashboard_data():
+def listar_movimentos_insumo(insumo_id, limit=None, after=None):
+    """Movimentos do insumo, mais recentes primeiro. {"items", "next_cursor"}"""
+    limit = _limite_pagina(limit)
+    sql = """
+    SELECT id, tipo, quantidade, kit_id, id_movimento_cesta, observacoes, data_registro
+    FROM insumo_movimentos
+    WHERE insumo_id = %s
+    """
+    params = [insumo_id]
+    if after:
+        (movimento_id,) = _decode_cursor(after, 1)
+        sql += " AND id < %s"
+        params.append(movimento_id)
+    sql += " ORDER BY id DESC LIMIT %s"
+    params.append(limit + 1)
+
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) AS c FROM familias_cestas WHERE ativo = TRUE")
-            total_familias = cursor.fetchone()["c"]
+        with get_db_cursor(leitura=True) as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]["id"])
+        return {"items": [{
+            **row,
+            "quantidade": float(row["quantidade"]),
+            "data_registro": row["data_registro"].strftime("%d/%m/%Y %H:%M"),
+        } for row in rows], "next_cursor": next_cursor}
+    except Exception as e:
+        logging.error(f"Erro ao listar movimentos do insumo: {e}")
+        return {"items": [], "next_cursor": None}
+
+def kits_disponiveis():
+    """
+    Quantos kits completos dá para montar agora: para cada kit, o menor
+    saldo/quantidade entre os seus insumos. Uma consulta agregada.
+    """
+    sql = """
+    SELECT k.id, k.nome,
+           GREATEST(FLOOR(MIN(COALESCE(e.saldo, 0) / ii.quantidade)), 0) AS disponiveis
+    FROM cesta_kits k
+    JOIN cesta_kit_itens ii ON ii.kit_id = k.id AND ii.quantidade > 0
+    LEFT JOIN insumo_estoque e ON e.insumo_id = ii.insumo_id
+    WHERE k.ativo = 1
+    GROUP BY k.id, k.nome
+    ORDER BY k.nome
+    """
+    try:
+        with get_db_cursor(leitura=True) as cursor:
+            cursor.execute(sql)
+            return [{**row, "disponiveis": int(row["disponiveis"])} for row in cursor.fetchall()]
+    except Exception as e:
+        logging.error(f"Erro ao calcular kits disponíveis: {e}")
+        return []
+
+# =========================
+# ESTATÍSTICAS (rollups por dia e por mês)
+# =========================
+# "familias" e "pessoas" contam cada família uma vez por período (não somam
+# entre períodos: as famílias do ano não são a soma das famílias de cada mês)
+def _inicio_mes(dia):
+    return dia.replace(day=1)
+
+def _proximo_mes(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _registrar_estatisticas(cursor, entregas):
+    """
+    Soma as entregas nos rollups estatisticas_entregas_dia/_mes, na transação
+    delas. Rodar ANTES de inserir em movimento_cestas: a família só conta como
+    atendida no dia/mês se ainda não tinha entrega nesse período.
+    entregas: [(familia_id, data_entrega: date, quantidade)]
+    """
+    familias = sorted({f for f, _, _ in entregas})
+    marcadores = ", ".join(["%s"] * len(familias))
+    inicio = _inicio_mes(min(d for _, d, _ in entregas))
+    fim = _proximo_mes(max(d for _, d, _ in entregas))
+
+    # usa idx_familia_data (id_familia, data_entrega)
+    cursor.execute(f"""
+        SELECT DISTINCT id_familia, data_entrega FROM movimento_cestas
+        WHERE id_familia IN ({marcadores}) AND data_entrega >= %s AND data_entrega < %s
+    """, familias + [inicio, fim])
+    vistos = set()
+    for r in cursor.fetchall():
+        vistos.add(("dia", r["id_familia"], r["data_entrega"]))
+        vistos.add(("mes", r["id_familia"], _inicio_mes(r["data_entrega"])))
+
+    cursor.execute(f"SELECT id, numero_pessoas FROM familias_cestas WHERE id IN ({marcadores})", familias)
+    pessoas = {r["id"]: int(r["numero_pessoas"] or 0) for r in cursor.fetchall()}
+
+    somas = {"dia": {}, "mes": {}}  # período -> [cestas, entregas, familias, pessoas]
+    for familia_id, dia, quantidade in entregas:
+        for tipo, periodo in (("dia", dia), ("mes", _inicio_mes(dia))):
+            soma = somas[tipo].setdefault(periodo, [0, 0, 0, 0])
+            soma[0] += quantidade
+            soma[1] += 1
+            if (tipo, familia_id, periodo) not in vistos:
+                vistos.add((tipo, familia_id, periodo))
+                soma[2] += 1
+                soma[3] += pessoas.get(familia_id, 0)
 
+    for tipo, tabela, coluna in (("dia", "estatisticas_entregas_dia", "dia"),
+                                 ("mes", "estatisticas_entregas_mes", "mes")):
+        cursor.executemany(f"""
+            INSERT INTO {tabela} ({coluna}, cestas, entregas, familias, pessoas)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                cestas = cestas + VALUES(cestas), entregas = entregas + VALUES(entregas),
+                familias = familias + VALUES(familias), pessoas = pessoas + VALUES(pessoas)
+        """, [[periodo, *soma] for periodo, soma in sorted(somas[tipo].items())])
+
+def reconstruir_estatisticas(data_inicio=None, data_fim=None, saida=None):
+    """
+    Recalcula os rollups a partir de movimento_cestas, um mês por transação
+    (DELETE + INSERT ... SELECT do mês), para não travar a tabela inteira.
+    Sem período, cobre todo o histórico. Retorna o número de meses processados.
+    """
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT MIN(data_entrega) AS a, MAX(data_entrega) AS b FROM movimento_cestas")
+        faixa = cursor.fetchone()
+    inicio = _inicio_mes(data_inicio or faixa["a"] or date.today())
+    fim = _inicio_mes(data_fim or faixa["b"] or date.today())
+
+    meses = 0
+    mes = inicio
+    while mes <= fim:
+        proximo = _proximo_mes(mes)
+        with get_db_cursor(commit=True) as cursor:
+            cursor.execute("DELETE FROM estatisticas_entregas_dia WHERE dia >= %s AND dia < %s",
+                           [mes, proximo])
+            cursor.execute("DELETE FROM estatisticas_entregas_mes WHERE mes = %s", [mes])
+            # por (dia, família) primeiro: cada família conta uma vez no dia
+            cursor.execute("""
+                INSERT INTO estatisticas_entregas_dia (dia, cestas, entregas, familias, pessoas)
+                SELECT t.dia, SUM(t.cestas), SUM(t.entregas), COUNT(*), SUM(t.pessoas)
+                FROM (
+                    SELECT m.data_entrega AS dia, m.id_familia, SUM(m.quantidade_cestas) AS cestas,
+                           COUNT(*) AS entregas, MAX(f.numero_pessoas) AS pessoas
+                    FROM movimento_cestas m
+                    JOIN familias_cestas f ON f.id = m.id_familia
+                    WHERE m.data_entrega >= %s AND m.data_entrega < %s
+                    GROUP BY m.data_entrega, m.id_familia
+                ) t
+                GROUP BY t.dia
+            """, [mes, proximo])
             cursor.execute("""
-                SELECT COALESCE(SUM(quantidade_cestas), 0) AS c
-                FROM movimento_cestas
-                WHERE data_entrega >= DATE_FORMAT(CURDATE(), '%Y-%m-01')
-            """)
-            cestas_mes = cursor.fetchone()["c"]
+                INSERT INTO estatisticas_entregas_mes (mes, cestas, entregas, familias, pessoas)
+                SELECT %s, COALESCE(SUM(t.cestas), 0), COALESCE(SUM(t.entregas), 0),
+                       COUNT(*), COALESCE(SUM(t.pessoas), 0)
+                FROM (
+                    SELECT m.id_familia, SUM(m.quantidade_cestas) AS cestas,
+                           COUNT(*) AS entregas, MAX(f.numero_pessoas) AS pessoas
+                    FROM movimento_cestas m
+                    JOIN familias_cestas f ON f.id = m.id_familia
+                    WHERE m.data_entrega >= %s AND m.data_entrega < %s
+                    GROUP BY m.id_familia
+                ) t
+                HAVING COUNT(*) > 0
+            """, [mes, mes, proximo])
+        meses += 1
+        if saida:
+            saida(f"    {mes:%Y-%m} ok")
+        mes = proximo
+
+    invalidar_dashboard()
+    return meses
 
-            cursor.execute("SELECT COALESCE(SUM(numero_pessoas), 0) AS c FROM familias_cestas WHERE ativo = TRUE")
-            total_pessoas = cursor.fetchone()["c"]
+GRANULARIDADES_ESTATISTICAS = ("dia", "mes")
+ESTATISTICAS_MAX_DIAS = int(os.getenv("ESTATISTICAS_MAX_DIAS", "366"))
 
-            cestas_estoque = get_saldo_estoque()
+def estatisticas_entregas(granularidade, inicio, fim):
+    """
+    Série de {periodo, cestas, entregas, familias, pessoas} entre inicio e fim
+    (dates, inclusive), lida só dos rollups: o custo depende do número de
+    períodos, não do número de entregas. Períodos sem entrega vêm zerados.
+    """
+    if granularidade == "mes":
+        tabela, coluna = "estatisticas_entregas_mes", "mes"
+        inicio, fim = _inicio_mes(inicio), _inicio_mes(fim)
+        avancar, formato = _proximo_mes, "%Y-%m"
+    else:
+        tabela, coluna = "estatisticas_entregas_dia", "dia"
+        avancar, formato = (lambda d: d + timedelta(days=1)), "%Y-%m-%d"
+
+    if fim < inicio:
+        raise ValueError("O início do período deve ser anterior ao fim.")
+    if granularidade == "dia" and (fim - inicio).days + 1 > ESTATISTICAS_MAX_DIAS:
+        raise ValueError(f"Período diário limitado a {ESTATISTICAS_MAX_DIAS} dias.")
+
+    with get_db_cursor(leitura=True) as cursor:
+        cursor.execute(f"""
+            SELECT {coluna} AS periodo, cestas, entregas, familias, pessoas
+            FROM {tabela}
+            WHERE {coluna} BETWEEN %s AND %s
+            ORDER BY {coluna}
+        """, [inicio, fim])
+        por_periodo = {r["periodo"]: r for r in cursor.fetchall()}
 
+    serie = []
+    periodo = inicio
+    while periodo <= fim:
+        r = por_periodo.get(periodo) or {}
+        serie.append({
+            "periodo": periodo.strftime(formato),
+            "cestas": int(r.get("cestas") or 0),
+            "entregas": int(r.get("entregas") or 0),
+            "familias": int(r.get("familias") or 0),
+            "pessoas": int(r.get("pessoas") or 0),
+        })
+        periodo = avancar(periodo)
+    return serie
+
+def _ajustar_saldo(cursor, delta):
+    """Aplica delta ao saldo materializado; deve rodar na transação do movimento"""
+    cursor.execute("UPDATE estoque_saldo SET saldo = saldo + %s WHERE id = 1", [delta])
+
+def get_saldo_estoque():
+    """Saldo (entradas - saídas) lido da tabela estoque_saldo (O(1))"""
+    try:
+        with get_db_cursor(leitura=True) as cursor:
+            cursor.execute("SELECT saldo FROM estoque_saldo WHERE id = 1")
+            row = cursor.fetchone()
+            return int(row["saldo"]) if row else 0
+    except Exception as e:
+        logging.error(f"Erro ao calcular saldo de estoque: {e}")
+        return 0
+
+def reconciliar_saldo_estoque(corrigir=False):
+    """
+    Recalcula o saldo do zero (SUM das entradas - SUM das entregas) e compara
+    com o materializado. A linha do saldo fica travada (FOR UPDATE) durante a
+    conta, então entradas/entregas concorrentes esperam e não geram falso desvio.
+    """
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT saldo FROM estoque_saldo WHERE id = 1 FOR UPDATE")
+        row = cursor.fetchone()
+        materializado = int(row["saldo"]) if row else None
+
+        cursor.execute("SELECT COALESCE(SUM(quantidade_entrada), 0) AS total FROM estoque_cestas")
+        total_entrada = int(cursor.fetchone()["total"] or 0)
+        cursor.execute("SELECT COALESCE(SUM(quantidade_cestas), 0) AS total FROM movimento_cestas")
+        total_saida = int(cursor.fetchone()["total"] or 0)
+        calculado = total_entrada - total_saida
+
+        divergencia = None if materializado is None else materializado - calculado
+        corrigido = False
+        if corrigir and divergencia != 0:
             cursor.execute("""
-                SELECT m.data_entrega, m.quantidade_cestas, f.id AS familia_id
-                FROM movimento_cestas m
-                JOIN familias_cestas f ON m.id_familia = f.id
-                ORDER BY m.data_entrega DESC LIMIT 3
-            """)
-            ultimas = cursor.fetchall()
-
-            ultimas_entregas = [{
-                "data": row["data_entrega"].strftime("%d/%m/%Y"),
-                "familia": f"Família {row['familia_id']}",
-                "responsavel": "Beneficiário",
-                "quantidade": row["quantidade_cestas"]
-            } for row in ultimas]
-
-        return {
-            "totalFamilias": total_familias,
-            "cestasMes": cestas_mes,
-            "totalPessoas": total_pessoas,
-            "cestasEstoque": cestas_estoque,
-            "ultimasEntregas": ultimas_entregas
-        }
+                INSERT INTO estoque_saldo (id, saldo) VALUES (1, %s)
+                ON DUPLICATE KEY UPDATE saldo = VALUES(saldo)
+            """, [calculado])
+            corrigido = True
+
+    return {
+        "saldo_materializado": materializado,
+        "saldo_calculado": calculado,
+        "total_entradas": total_entrada,
+        "total_saidas": total_saida,
+        "divergencia": divergencia,
+        "corrigido": corrigido,
+    }
+
+# na ordem do SELECT de iter_movimentacoes_estoque (depois: data, tipo e id, da paginação)
+COLUNAS_MOVIMENTACAO = ("data_movimentacao", "quantidade_entrada", "quantidade_saida",
+                        "motivo_saida", "responsavel")
+
+def iter_movimentacoes_estoque(limit=None, after=None, data_inicio=None, data_fim=None):
+    """
+    Entradas (estoque_cestas) e saídas (movimento_cestas) intercaladas pelo banco
+    num único UNION ALL, ordenado por (data, tipo, id) decrescente, com paginação
+    keyset. Cada ramo já vem limitado pelo índice de data, então o custo não cresce
+    com o tamanho do histórico.
+
+    Valida o cursor na hora (CursorInvalido) e devolve um gerador de eventos:
+    ("item", dict) para cada movimentação e, por último, ("next_cursor", str | None).
+    """
+    limit = _limite_pagina(limit)
+    chave = _decode_cursor(after, 3) if after else None
+
+    def ramo(tipo, col_data, extra_params):
+        conds, params = [], []
+        if data_inicio:
+            conds.append(f"{col_data} >= %s")
+            params.append(data_inicio)
+        if data_fim:
+            conds.append(f"{col_data} <= %s")
+            params.append(data_fim)
+        if chave:
+            c_data, c_tipo, c_id = chave
+            if tipo == c_tipo:
+                conds.append(f"({col_data} < %s OR ({col_data} = %s AND id < %s))")
+                params.extend([c_data, c_data, c_id])
+            elif tipo > c_tipo:
+                # na mesma data este tipo vem antes: já foi entregue nas páginas anteriores
+                conds.append(f"{col_data} < %s")
+                params.append(c_data)
+            else:
+                conds.append(f"{col_data} <= %s")
+                params.append(c_data)
+        where = " AND ".join(conds) or "1=1"
+        return where, params + extra_params
+
+    where_e, params_e = ramo("E", "data_entrada", [limit + 1])
+    where_s, params_s = ramo("S", "data_entrega", [limit + 1])
+
+    sql = f"""
+    SELECT DATE_FORMAT(data, '%%d/%%m/%%Y'), CAST(entrada AS SIGNED), CAST(saida AS SIGNED),
+           motivo, responsavel,
+           data, tipo, id
+    FROM (
+        (SELECT data_entrada AS data, 'E' AS tipo, id, quantidade_entrada AS entrada, 0 AS saida,
+                fornecedor AS motivo, 'Estoque' AS responsavel
+         FROM estoque_cestas
+         WHERE {where_e}
+         ORDER BY data_entrada DESC, id DESC LIMIT %s)
+        UNION ALL
+        (SELECT data_entrega AS data, 'S' AS tipo, id, 0 AS entrada, quantidade_cestas AS saida,
+                'Entrega a família' AS motivo, 'Sistema' AS responsavel
+         FROM movimento_cestas
+         WHERE {where_s}
+         ORDER BY data_entrega DESC, id DESC LIMIT %s)
+    ) t
+    ORDER BY data DESC, tipo DESC, id DESC
+    LIMIT %s
+    """
+    params = params_e + params_s + [limit + 1]
+
+    def gerar():
+        try:
+            with get_db_cursor(tuplas=True, leitura=True) as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Erro ao listar movimentações: {e}")
+            rows = ()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(*rows[-1][-3:])
+
+        for r in rows:
+            yield "item", dict(zip(COLUNAS_MOVIMENTACAO, r))
+        yield "next_cursor", next_cursor
+
+    return gerar()
+
+# =========================
+# EXPORTAÇÃO (streaming, sem paginação)
+# =========================
+def _iter_sem_buffer(sql, params=None):
+    """Linhas da consulta uma a uma, com cursor do lado do servidor (memória constante)"""
+    with get_db_cursor(streaming=True, leitura=True) as cursor:
+        cursor.execute(sql, params)
+        yield from cursor
+
+def _filtro_datas(coluna, data_inicio, data_fim, params):
+    conds = []
+    if data_inicio:
+        conds.append(f"{coluna} >= %s")
+        params.append(data_inicio)
+    if data_fim:
+        conds.append(f"{coluna} <= %s")
+        params.append(data_fim)
+    return " AND ".join(conds) or "1=1"
+
+COLUNAS_EXPORT_ENTREGAS = ["id", "data_entrega", "familia_id", "responsavel_nome", "cpf",
+                           "quantidade_cestas", "kit", "entregue_por", "data_registro"]
+
+def iter_export_entregas(data_inicio=None, data_fim=None):
+    """Todas as entregas do período, em ordem de data (gera listas na ordem das colunas)"""
+    params = []
+    where = _filtro_datas("m.data_entrega", data_inicio, data_fim, params)
+    sql = f"""
+    SELECT m.id, m.data_entrega, m.id_familia, f.responsavel_nome, f.responsavel_cpf,
+           m.quantidade_cestas, k.nome AS kit, m.observacoes_entrega, m.data_registro
+    FROM movimento_cestas m
+    JOIN familias_cestas f ON f.id = m.id_familia
+    LEFT JOIN cesta_kits k ON k.id = m.kit_id
+    WHERE {where}
+    ORDER BY m.data_entrega, m.id
+    """
+    for r in _iter_sem_buffer(sql, params):
+        obs = r["observacoes_entrega"] or ""
+        yield [
+            r["id"], r["data_entrega"], r["id_familia"], r["responsavel_nome"] or "",
+            formatar_cpf(r["responsavel_cpf"]) if r["responsavel_cpf"] else "", r["quantidade_cestas"], r["kit"] or "",
+            obs.replace("Entregue por:", "").strip(), r["data_registro"],
+        ]
+
+# mesmos nomes de coluna da importação (importacao.py): o arquivo exportado pode ser reimportado
+COLUNAS_EXPORT_FAMILIAS = ["id", "responsavelNome", "responsavelCPF", "responsavelNascimento",
+                           "responsavelGenero", "responsavelEndereco", "telefone",
+                           "numeroPessoas", "numeroFilhos", "dataCadastro", "ativo"]
+
+def iter_export_familias():
+    sql = """
+    SELECT id, responsavel_nome, responsavel_cpf, responsavel_nascimento, responsavel_genero,
+           endereco, telefone, numero_pessoas, numero_filhos, data_cadastro, ativo
+    FROM familias_cestas
+    ORDER BY id
+    """
+    for r in _iter_sem_buffer(sql):
+        yield [
+            r["id"], r["responsavel_nome"] or "", formatar_cpf(r["responsavel_cpf"]) if r["responsavel_cpf"] else "",
+            r["responsavel_nascimento"], r["responsavel_genero"] or "", r["endereco"] or "",
+            r["telefone"] or "", r["numero_pessoas"], r["numero_filhos"], r["data_cadastro"],
+            1 if r["ativo"] else 0,
+        ]
+
+COLUNAS_EXPORT_MOVIMENTACOES = ["data", "tipo", "id", "entrada", "saida", "descricao"]
+
+def iter_export_movimentacoes(data_inicio=None, data_fim=None):
+    """Entradas e saídas de cestas do período, intercaladas por data"""
+    params = []
+    where_e = _filtro_datas("data_entrada", data_inicio, data_fim, params)
+    where_s = _filtro_datas("data_entrega", data_inicio, data_fim, params)
+    sql = f"""
+    SELECT data_entrada AS data, 'entrada' AS tipo, id, quantidade_entrada AS entrada,
+           0 AS saida, fornecedor AS descricao
+    FROM estoque_cestas WHERE {where_e}
+    UNION ALL
+    SELECT data_entrega, 'saida', id, 0, quantidade_cestas, CONCAT('Família ', id_familia)
+    FROM movimento_cestas WHERE {where_s}
+    ORDER BY data, tipo, id
+    """
+    for r in _iter_sem_buffer(sql, params):
+        yield [r["data"], r["tipo"], r["id"], int(r["entrada"]), int(r["saida"]), r["descricao"] or ""]
+
+# =========================
+# DASHBOARD
+# =========================
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+_dashboard_cache = TTLCache(DASHBOARD_CACHE_TTL)
+_dashboard_ultimo = {"etag": None, "last_modified": None}
+
+_DASHBOARD_VAZIO = {
+    "totalFamilias": 0,
+    "cestasMes": 0,
+    "totalPessoas": 0,
+    "cestasEstoque": 0,
+    "ultimasEntregas": []
+}
+
+_ouvintes_dashboard = []
+
+def ao_invalidar_dashboard(funcao):
+    """Registra funcao() para ser chamada a cada invalidar_dashboard (eventos.py); deve ser barata"""
+    _ouvintes_dashboard.append(funcao)
+
+def invalidar_dashboard():
+    """Chamado pelos caminhos de escrita depois do commit"""
+    _dashboard_ultimo["invalidado_em"] = time.time()
+    _dashboard_cache.invalidar("dashboard")
+    for funcao in _ouvintes_dashboard:
+        funcao()
+
+def versao_dashboard():
+    """
+    Assinatura barata (só índices) do que o dashboard mostra: muda quando
+    qualquer processo grava família, entrega ou entrada de estoque. Lida no
+    primário, para não perder uma mudança por atraso de réplica.
+    """
+    with get_db_cursor(tuplas=True) as cursor:
+        cursor.execute("""
+            SELECT (SELECT MAX(id) FROM familias_cestas), (SELECT MAX(id) FROM movimento_cestas),
+                   (SELECT MAX(id) FROM estoque_cestas), (SELECT saldo FROM estoque_saldo WHERE id = 1)
+        """)
+        return tuple(cursor.fetchone())
+
+def _calcular_dashboard():
+    # o cache é do processo: logo depois de uma escrita aqui, recalcula no
+    # primário, senão uma réplica atrasada ficaria em cache por todo o TTL
+    recente = time.time() - _dashboard_ultimo.get("invalidado_em", 0.0) < LER_ESCRITAS_JANELA
+    with get_db_cursor(leitura=not recente) as cursor:
+        cursor.execute("""
+            SELECT f.total_familias, f.total_pessoas, m.cestas AS cestas_mes, s.saldo AS cestas_estoque
+            FROM (
+                SELECT COUNT(*) AS total_familias, COALESCE(SUM(numero_pessoas), 0) AS total_pessoas
+                FROM familias_cestas WHERE ativo = TRUE
+            ) f
+            LEFT JOIN estatisticas_entregas_mes m ON m.mes = DATE_FORMAT(CURDATE(), '%Y-%m-01')
+            LEFT JOIN estoque_saldo s ON s.id = 1
+        """)
+        agregado = cursor.fetchone()
+
+        cursor.execute("""
+            SELECT data_entrega, quantidade_cestas, id_familia AS familia_id
+            FROM movimento_cestas
+            ORDER BY data_entrega DESC, id DESC LIMIT 3
+        """)
+        ultimas = cursor.fetchall()
+
+    dados = {
+        "totalFamilias": int(agregado["total_familias"]),
+        "cestasMes": int(agregado["cestas_mes"] or 0),
+        "totalPessoas": int(agregado["total_pessoas"]),
+        "cestasEstoque": int(agregado["cestas_estoque"] or 0),
+        "ultimasEntregas": [{
+            "data": row["data_entrega"].strftime("%d/%m/%Y"),
+            "familia": f"Família {row['familia_id']}",
+            "responsavel": "Beneficiário",
+            "quantidade": row["quantidade_cestas"]
+        } for row in ultimas]
+    }
+
+    etag = hashlib.sha1(json.dumps(dados, sort_keys=True).encode("utf-8")).hexdigest()
+    if etag != _dashboard_ultimo["etag"]:
+        _dashboard_ultimo["etag"] = etag
+        _dashboard_ultimo["last_modified"] = datetime.now(timezone.utc).replace(microsecond=0)
+
+    return {
+        "dados": dados,
+        "etag": etag,
+        "last_modified": _dashboard_ultimo["last_modified"],
+    }
+
+def get_dashboard_snapshot():
+    """
+    Dados do dashboard + ETag/Last-Modified para requisições condicionais.
+    Fica em cache por DASHBOARD_CACHE_TTL segundos (por processo).
+    """
+    try:
+        return _dashboard_cache.get("dashboard", _calcular_dashboard)
     except Exception as e:
         logging.error(f"Erro no dashboard: {e}")
-        return {
-            "totalFamilias": 0,
-            "cestasMes": 0,
-            "totalPessoas": 0,
-            "cestasEstoque": 0,
-            "ultimasEntregas": []
-        }
+        return {"dados": dict(_DASHBOARD_VAZIO), "etag": None, "last_modified": None}
+
+def get_dashboard_data():
+    return get_dashboard_snapshot()["dados"]
+
+# =========================
+# CATÁLOGO (insumos, kits e itens) EM CACHE
+# =========================
+# muda pouco: fica em memória e é descartado pelas funções de escrita abaixo.
+# Em outros processos (vários workers), a mudança aparece em até CATALOGO_CACHE_TTL
+CATALOGO_CACHE_TTL = float(os.getenv("CATALOGO_CACHE_TTL", "300"))
+_catalogo_cache = TTLCache(CATALOGO_CACHE_TTL)
+
+def invalidar_catalogo():
+    _catalogo_cache.invalidar("catalogo")
+
+def _carregar_catalogo():
+    """Catálogo inteiro em 3 consultas: insumos, kits e todos os itens de todos os kits"""
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT id, nome, unidade, ativo FROM cesta_insumos ORDER BY nome")
+        insumos = cursor.fetchall()
+        cursor.execute("SELECT id, nome, descricao, ativo FROM cesta_kits ORDER BY nome")
+        kits = cursor.fetchall()
+        cursor.execute("""
+            SELECT
+                ii.kit_id,
+                i.id AS insumo_id,
+                ii.id AS item_id,
+                i.nome,
+                i.unidade,
+                ii.quantidade
+            FROM cesta_kit_itens ii
+            JOIN cesta_insumos i ON i.id = ii.insumo_id
+            ORDER BY ii.kit_id, i.nome
+        """)
+        itens = {}
+        for r in cursor.fetchall():
+            itens.setdefault(r["kit_id"], []).append({
+                "item_id": r["item_id"],
+                "insumo_id": r["insumo_id"],
+                "insumo_nome": r["nome"],
+                "unidade": r["unidade"],
+                "quantidade": float(r["quantidade"])
+            })
+    return {"insumos": insumos, "kits": kits, "itens": itens}
+
+def _catalogo():
+    return _catalogo_cache.get("catalogo", _carregar_catalogo)
 
 # =========================
 # INSUMOS
@@ -434,17 +2158,17 @@ def criar_insumo(nome, unidade):
     try:
         with get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, [nome.strip(), unidade.strip()])
-            return cursor.lastrowid
+            novo_id = cursor.lastrowid
+            cursor.execute("INSERT INTO insumo_estoque (insumo_id) VALUES (%s)", [novo_id])
+        invalidar_catalogo()
+        return novo_id
     except Exception as e:
         logging.error(f"Erro ao criar insumo: {e}")
         return None
 
 def listar_insumos():
-    sql = "SELECT id, nome, unidade, ativo FROM cesta_insumos ORDER BY nome"
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute(sql)
-            return cursor.fetchall()
+        return [dict(r) for r in _catalogo()["insumos"]]
     except Exception as e:
         logging.error(f"Erro ao listar insumos: {e}")
         return []
@@ -457,21 +2181,32 @@ def criar_kit(nome, descricao=None):
     try:
         with get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, [nome.strip(), (descricao or None)])
-            return cursor.lastrowid
+            novo_id = cursor.lastrowid
+        invalidar_catalogo()
+        return novo_id
     except Exception as e:
         logging.error(f"Erro ao criar kit: {e}")
         return None
 
 def listar_kits():
-    sql = "SELECT id, nome, descricao, ativo FROM cesta_kits ORDER BY nome"
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute(sql)
-            return cursor.fetchall()
+        return [dict(r) for r in _catalogo()["kits"]]
     except Exception as e:
         logging.error(f"Erro ao listar kits: {e}")
         return []
 
+def listar_kits_completos():
+    """Todos os kits, cada um com seus itens (a tela de kits numa requisição só)"""
+    try:
+        catalogo = _catalogo()
+        return [
+            {**k, "itens": [dict(it) for it in catalogo["itens"].get(k["id"], [])]}
+            for k in catalogo["kits"]
+        ]
+    except Exception as e:
+        logging.error(f"Erro ao listar kits completos: {e}")
+        return []
+
 def adicionar_item_kit(kit_id, insumo_id, quantidade):
     sql = """
     INSERT INTO cesta_kit_itens (kit_id, insumo_id, quantidade)
@@ -481,35 +2216,15 @@ def adicionar_item_kit(kit_id, insumo_id, quantidade):
     try:
         with get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, [kit_id, insumo_id, quantidade])
+        invalidar_catalogo()
         return True
     except Exception as e:
         logging.error(f"Erro ao adicionar item no kit: {e}")
         return False
 
 def listar_itens_do_kit(kit_id):
-    sql = """
-    SELECT
-        i.id AS insumo_id,
-        ii.id AS item_id,
-        i.nome,
-        i.unidade,
-        ii.quantidade
-    FROM cesta_kit_itens ii
-    JOIN cesta_insumos i ON i.id = ii.insumo_id
-    WHERE ii.kit_id = %s
-    ORDER BY i.nome
-    """
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute(sql, [kit_id])
-            rows = cursor.fetchall()
-            return [{
-                "item_id": r["item_id"],
-                "insumo_id": r["insumo_id"],
-                "insumo_nome": r["nome"],
-                "unidade": r["unidade"],
-                "quantidade": float(r["quantidade"])
-            } for r in rows]
+        return [dict(it) for it in _catalogo()["itens"].get(kit_id, [])]
     except Exception as e:
         logging.error(f"Erro ao listar itens do kit: {e}")
         return []
@@ -519,6 +2234,7 @@ def remover_item_kit(item_id):
     try:
         with get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, [item_id])
+        invalidar_catalogo()
         return True
     except Exception as e:
         logging.error(f"Erro ao remover item do kit: {e}")
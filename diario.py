@@ -0,0 +1,380 @@
+# diario.py
+"""
+Diário local das escritas (SQLite em WAL, synchronous=FULL): se o MySQL cai
+ou engasga no meio de um dia de distribuição, a entrega ou entrada de estoque
+é gravada aqui, com fsync, e o voluntário recebe 202 em vez de 500. Uma
+thread de drenagem leva o diário ao MySQL em lotes, na ordem de chegada, com
+a chave de idempotência de cada escrita (movimento_cestas/estoque_cestas
+.chave_idempotencia): se o processo cair entre o commit no MySQL e a
+marcação aqui, o reenvio não grava de novo.
+
+DIARIO_MODO:
+- "falha" (padrão): grava direto no MySQL e só usa o diário quando o banco
+  não responde (BancoIndisponivel); as checagens com resposta imediata
+  (409 de família já atendida, kit em falta) continuam valendo
+- "sempre": toda entrega/entrada é confirmada pelo diário (latência de um
+  fsync local) e as checagens rodam na drenagem; o que for recusado fica
+  com status "rejeitada" (ver `python manage.py diario`). Exige DIARIO_ARQUIVO
+  apontando para um disco persistente: com o caminho padrão, não sobe
+- "desligado": sem diário; banco fora responde 503
+
+Entregas no diário ainda não contam no saldo nem no dashboard até a drenagem.
+
+Na drenagem, banco fora deixa a escrita pendente sem limite de tentativas.
+Qualquer outro erro fica com a própria escrita: o lote que falha é refeito
+item a item, payload ilegível é rejeitado na hora e o item que continua
+falhando vira "rejeitada" depois de DIARIO_TENTATIVAS_MAXIMAS tentativas, sem
+travar a fila atrás dele.
+
+    python manage.py diario            # pendentes / rejeitadas
+    python manage.py diario --drenar   # drena agora (com o servidor parado, por exemplo)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import database
+
+try:
+    import fcntl
+except ImportError:  # Windows (waitress, processo único): sem trava entre processos
+    fcntl = None
+
+# o padrão fica no disco do container, que o Render apaga a cada deploy/reinício
+DIARIO_ARQUIVO_PADRAO = str(Path(__file__).resolve().parent / "dados" / "diario.sqlite3")
+DIARIO_ARQUIVO = os.getenv("DIARIO_ARQUIVO", DIARIO_ARQUIVO_PADRAO)
+DIARIO_MODO = os.getenv("DIARIO_MODO", "falha")
+DIARIO_INTERVALO = float(os.getenv("DIARIO_INTERVALO", "2"))      # segundos entre drenagens
+DIARIO_ESPERA_MAXIMA = 60.0                                       # backoff com o banco fora
+DIARIO_LOTE = min(int(os.getenv("DIARIO_LOTE", "200")), database.LOTE_ENTREGAS_MAXIMO)
+DIARIO_RETENCAO_DIAS = float(os.getenv("DIARIO_RETENCAO_DIAS", "7"))  # aplicadas somem depois
+# erro que não é de banco fora (bug, dado que o MySQL recusa): tenta algumas vezes e rejeita
+DIARIO_TENTATIVAS_MAXIMAS = int(os.getenv("DIARIO_TENTATIVAS_MAXIMAS", "5"))
+
+MODOS = ("falha", "sempre", "desligado")
+TIPOS = ("entrega", "entrada_estoque")
+
+_SQL_TABELA = """
+CREATE TABLE IF NOT EXISTS diario (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',   -- pendente | aplicada | rejeitada
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    erro TEXT,
+    processado_em REAL
+)
+"""
+
+
+class Diario:
+    def __init__(self, caminho, modo="falha", intervalo=2.0, lote=200):
+        if modo not in MODOS:
+            raise ValueError(f"DIARIO_MODO inválido: {modo} (use {', '.join(MODOS)})")
+        if modo == "sempre" and caminho == DIARIO_ARQUIVO_PADRAO:
+            # no modo sempre o 202 é a única confirmação: perder o arquivo perde entregas
+            raise ValueError("DIARIO_MODO=sempre exige DIARIO_ARQUIVO num disco persistente")
+        self.caminho = caminho
+        self.modo = modo
+        self.intervalo = intervalo
+        self.lote = lote
+        self._local = threading.local()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ---------- SQLite ----------
+    def _conexao(self):
+        """Uma conexão por thread (e por processo: não herda a do mestre no fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        Path(self.caminho).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")   # commit só volta depois do fsync
+        conn.execute(_SQL_TABELA)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_diario_status ON diario (status, seq)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def registrar(self, tipo, chave, dados):
+        """
+        Grava a escrita no diário (durável quando retorna). A mesma chave duas
+        vezes (cliente reenviando) fica uma vez só.
+        """
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de escrita desconhecido: {tipo}")
+        self._conexao().execute(
+            "INSERT OR IGNORE INTO diario (chave, tipo, dados, criado_em) VALUES (?, ?, ?, ?)",
+            [chave, tipo, json.dumps(dados, ensure_ascii=False, default=str), time.time()]
+        )
+        self.iniciar()
+        self._acordar.set()
+
+    def _marcar(self, marcacoes):
+        """
+        [(seq, status, erro)]; "falha" (banco fora) e "erro" (os demais) mantêm
+        pendente e contam a tentativa
+        """
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for seq, status, erro in marcacoes:
+                if status in ("falha", "erro"):
+                    conn.execute("UPDATE diario SET tentativas = tentativas + 1, erro = ? WHERE seq = ?",
+                                 [erro, seq])
+                else:
+                    conn.execute("""
+                        UPDATE diario SET status = ?, erro = ?, tentativas = tentativas + 1,
+                                          processado_em = ?
+                        WHERE seq = ?
+                    """, [status, erro, agora, seq])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- drenagem ----------
+    def drenar(self):
+        """
+        Uma passada: até `lote` pendentes, na ordem. Para na primeira falha
+        (a ordem importa para o saldo). Retorna (processadas, falhou).
+        """
+        with _TravaArquivo(self.caminho + ".lock") as minha:
+            if not minha:
+                return 0, False  # outro processo está drenando
+            pendentes = self._conexao().execute(
+                "SELECT seq, chave, tipo, dados, tentativas FROM diario WHERE status = 'pendente' "
+                "ORDER BY seq LIMIT ?", [self.lote]
+            ).fetchall()
+            if not pendentes:
+                self._conexao().execute(
+                    "DELETE FROM diario WHERE status = 'aplicada' AND processado_em < ?",
+                    [time.time() - DIARIO_RETENCAO_DIAS * 86400]
+                )
+                return 0, False
+
+            processadas = 0
+            inicio = 0
+            while inicio < len(pendentes):
+                fim = inicio
+                while fim < len(pendentes) and pendentes[fim]["tipo"] == pendentes[inicio]["tipo"]:
+                    fim += 1
+                grupo = pendentes[inicio:fim]
+                aplicar = self._aplicar_entregas if grupo[0]["tipo"] == "entrega" else self._aplicar_entradas
+                try:
+                    marcacoes = aplicar(grupo)
+                except Exception as e:
+                    # erro fora do banco (no próprio diário): conta a tentativa da primeira
+                    logging.error(f"Diário: erro ao aplicar {grupo[0]['chave']}: {e}")
+                    marcacoes = [(grupo[0]["seq"], "erro", str(e) or type(e).__name__)]
+                marcacoes = self._limitar_tentativas(grupo, marcacoes)
+                self._marcar(marcacoes)
+                processadas += sum(1 for _, status, _ in marcacoes if status in ("aplicada", "rejeitada"))
+                if any(status in ("falha", "erro") for _, status, _ in marcacoes):
+                    return processadas, True
+                inicio = fim
+            return processadas, False
+
+    @staticmethod
+    def _limitar_tentativas(grupo, marcacoes):
+        """"erro" na última tentativa vira "rejeitada": a fila anda"""
+        tentativas = {r["seq"]: r["tentativas"] for r in grupo}
+        chaves = {r["seq"]: r["chave"] for r in grupo}
+        limitadas = []
+        for seq, status, erro in marcacoes:
+            if status == "erro" and tentativas[seq] + 1 >= DIARIO_TENTATIVAS_MAXIMAS:
+                logging.error(f"Diário: {chaves[seq]} rejeitada depois de "
+                              f"{tentativas[seq] + 1} tentativas: {erro}")
+                status, erro = "rejeitada", f"{erro} ({tentativas[seq] + 1} tentativas)"
+            limitadas.append((seq, status, erro))
+        return limitadas
+
+    @staticmethod
+    def _dados(r):
+        """Payload da escrita, ou ValueError se não der para aplicar nunca"""
+        try:
+            dados = json.loads(r["dados"])
+        except ValueError as e:
+            raise ValueError(f"Dados ilegíveis: {e}") from e
+        if not isinstance(dados, dict):
+            raise ValueError("Dados ilegíveis: esperado um objeto")
+        return dados
+
+    @classmethod
+    def _aplicar_entregas(cls, grupo):
+        marcacoes = {}
+        itens = []
+        for r in grupo:
+            try:
+                itens.append((r, {**cls._dados(r), "chave": r["chave"]}))
+            except ValueError as e:
+                logging.warning(f"Diário: entrega {r['chave']} recusada: {e}")
+                marcacoes[r["seq"]] = (r["seq"], "rejeitada", str(e))
+
+        resultados = []
+        try:
+            if itens:
+                resultados = database.salvar_entregas_lote([item for _, item in itens],
+                                                           levantar_indisponivel=True)
+            if len(itens) > 1 and any(res["status"] == "falha" for res in resultados):
+                # a transação inteira voltou por causa de algum item: refaz um a um
+                resultados = []
+                for _, item in itens:
+                    resultados += database.salvar_entregas_lote([item], levantar_indisponivel=True)
+        except database.BancoIndisponivel as e:
+            resultados += [{"status": "indisponivel", "erro": str(e)}] * (len(itens) - len(resultados))
+
+        for (r, _), resultado in zip(itens, resultados):
+            # "falha" do lote aqui já não é banco fora (levantar_indisponivel): conta para o limite
+            status = {"ok": "aplicada", "falha": "erro", "indisponivel": "falha"}.get(
+                resultado["status"], resultado["status"])
+            if status == "rejeitada":
+                logging.warning(f"Diário: entrega {r['chave']} recusada: {resultado['erro']}")
+            marcacoes[r["seq"]] = (r["seq"], status, resultado["erro"])
+        return [marcacoes[r["seq"]] for r in grupo if r["seq"] in marcacoes]
+
+    @classmethod
+    def _aplicar_entradas(cls, grupo):
+        marcacoes = []
+        for r in grupo:
+            try:
+                dados = cls._dados(r)
+                ok = database.registrar_entrada_estoque(
+                    dados["quantidade"], dados["fornecedor"], dados.get("observacoes"),
+                    chave=r["chave"], data_entrada=dados.get("dataEntrada")
+                )
+            except database.BancoIndisponivel as e:
+                marcacoes.append((r["seq"], "falha", str(e)))
+                break
+            except (ValueError, KeyError) as e:
+                erro = f"Campo ausente: {e}" if isinstance(e, KeyError) else str(e)
+                logging.warning(f"Diário: entrada de estoque {r['chave']} recusada: {erro}")
+                marcacoes.append((r["seq"], "rejeitada", erro))
+                continue
+            if ok:
+                marcacoes.append((r["seq"], "aplicada", None))
+            else:
+                logging.warning(f"Diário: entrada de estoque {r['chave']} recusada")
+                marcacoes.append((r["seq"], "rejeitada", "Erro ao registrar entrada"))
+        return marcacoes
+
+    def _laco(self):
+        espera = self.intervalo
+        while not self._parar.is_set():
+            try:
+                processadas, falhou = self.drenar()
+            except Exception as e:
+                logging.error(f"Erro ao drenar o diário: {e}")
+                processadas, falhou = 0, True
+            if falhou:
+                espera = min(espera * 2, DIARIO_ESPERA_MAXIMA)
+            else:
+                espera = self.intervalo
+                if processadas:
+                    continue  # pode haver mais de um lote pendente
+            self._acordar.wait(espera)
+            self._acordar.clear()
+
+    def iniciar(self):
+        """Sobe a thread de drenagem neste processo (depois do fork; chamar é barato)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        if self.modo == "desligado" and not os.path.exists(self.caminho):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name="diario-drenagem", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    # ---------- consulta ----------
+    def status(self, ultimas_rejeitadas=20):
+        if not os.path.exists(self.caminho):
+            return {"modo": self.modo, "pendente": 0, "aplicada": 0, "rejeitada": 0,
+                    "pendente_mais_antiga": None, "rejeitadas": []}
+        conn = self._conexao()
+        contagem = {r["status"]: r["n"] for r in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM diario GROUP BY status"
+        )}
+        mais_antiga = conn.execute(
+            "SELECT MIN(criado_em) AS t FROM diario WHERE status = 'pendente'"
+        ).fetchone()["t"]
+        rejeitadas = conn.execute("""
+            SELECT chave, tipo, dados, erro, criado_em FROM diario
+            WHERE status = 'rejeitada' ORDER BY seq DESC LIMIT ?
+        """, [ultimas_rejeitadas]).fetchall()
+        return {
+            "modo": self.modo,
+            "pendente": contagem.get("pendente", 0),
+            "aplicada": contagem.get("aplicada", 0),
+            "rejeitada": contagem.get("rejeitada", 0),
+            "pendente_mais_antiga": time.time() - mais_antiga if mais_antiga else None,
+            "rejeitadas": [{
+                "chave": r["chave"],
+                "tipo": r["tipo"],
+                "dados": _legivel(r["dados"]),
+                "erro": r["erro"],
+                "criado_em": datetime.fromtimestamp(r["criado_em"]).isoformat(timespec="seconds"),
+            } for r in rejeitadas],
+        }
+
+
+def _legivel(dados):
+    """Payload para exibir (o de uma rejeitada pode nem ser JSON)"""
+    try:
+        return json.loads(dados)
+    except ValueError:
+        return dados
+
+
+class _TravaArquivo:
+    """flock não bloqueante: um processo drena por vez (os demais seguem atendendo)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.arquivo = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        Path(self.caminho).parent.mkdir(parents=True, exist_ok=True)
+        self.arquivo = open(self.caminho, "a")
+        try:
+            fcntl.flock(self.arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.arquivo.close()
+            self.arquivo = None
+            return False
+        return True
+
+    def __exit__(self, *exc):
+        if self.arquivo is not None:
+            fcntl.flock(self.arquivo, fcntl.LOCK_UN)
+            self.arquivo.close()
+            self.arquivo = None
+
+
+diario = Diario(DIARIO_ARQUIVO, modo=DIARIO_MODO, intervalo=DIARIO_INTERVALO, lote=DIARIO_LOTE)
@@ -0,0 +1,304 @@
+# estaticos.py
+"""
+Arquivos estáticos (css/, js/, static/imagens/ e as páginas index/login)
+servidos da memória, pensando em quem acessa pelo celular nos pontos de entrega:
+
+- URLs com o hash do conteúdo (/css/style.<hash>.css) e Cache-Control
+  immutable por um ano: numa recarga o navegador nem pergunta ao servidor
+- gzip/brotli calculados uma vez, na carga, com o nível máximo
+- as páginas HTML saem com as URLs dos assets já trocadas pelas versões com
+  hash e com no-cache + ETag (recarga = 304, sem corpo)
+- imagens: a URL original serve sempre o arquivo original. A versão reduzida
+  tem a própria URL (/static/imagens/variantes/<nome>, também com hash), que o
+  HTML usa onde a imagem aparece pequena; nela vai a WebP a quem aceita. Sem
+  variantes geradas (`python manage.py otimizar-imagens`), essa URL serve o original
+
+comprimir_resposta() é o after_request que comprime as respostas dinâmicas (JSON).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # opcional: sem ele, só gzip
+        brotli = None
+
+RAIZ = Path(__file__).resolve().parent
+PASTAS = ("css", "js", "static/imagens")   # prefixo da URL = pasta
+PAGINAS = ("index.html", "login.html")
+VARIANTES = "variantes"                     # subpasta de static/imagens
+
+COMPRESSAO_MINIMA = int(os.getenv("COMPRESSAO_MINIMA", "1024"))  # bytes
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+COMPRIMIVEIS = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+}
+
+_VERSIONADO_RE = re.compile(r"^(?P<base>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[A-Za-z0-9]+)$")
+_REFERENCIA_RE = re.compile(r'(?P<attr>href|src)="(?P<url>/(?:css|js|static/imagens)/[^"?#]+)"')
+
+
+def _mimetype(nome):
+    if nome.endswith(".js"):
+        return "application/javascript"
+    return mimetypes.guess_type(nome)[0] or "application/octet-stream"
+
+
+def _comprimir(conteudo, codificacao, maximo=False):
+    if codificacao == "br":
+        return brotli.compress(conteudo, quality=11 if maximo else 4)
+    return gzip.compress(conteudo, compresslevel=9 if maximo else 6, mtime=0)
+
+
+def _codificacoes_aceitas():
+    """Codificações aceitas pelo cliente, na ordem de preferência do servidor"""
+    aceitas = request.accept_encodings
+    return [c for c in (("br",) if brotli else ()) + ("gzip",) if aceitas[c]]
+
+
+class _Arquivo:
+    __slots__ = ("conteudo", "mimetype", "hash", "comprimidos")
+
+    def __init__(self, conteudo, mimetype, hash_=None):
+        self.conteudo = conteudo
+        self.mimetype = mimetype
+        self.hash = hash_ or hashlib.sha256(conteudo).hexdigest()[:10]
+        self.comprimidos = {}
+        if mimetype in COMPRIMIVEIS and len(conteudo) >= COMPRESSAO_MINIMA:
+            for codificacao in ("br", "gzip") if brotli else ("gzip",):
+                comprimido = _comprimir(conteudo, codificacao, maximo=True)
+                if len(comprimido) < len(conteudo):
+                    self.comprimidos[codificacao] = comprimido
+
+
+class Estaticos:
+    """
+    Carrega tudo na primeira requisição (ou em carregar(), chamado por
+    create_app antes do fork). Com recarregar=True (servidor de
+    desenvolvimento), relê os arquivos quando algum muda no disco.
+    """
+
+    def __init__(self, raiz=RAIZ, recarregar=False):
+        self.raiz = Path(raiz)
+        self.recarregar = recarregar
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._arquivos = {}   # "/css/style.css" -> _Arquivo
+        self._webp = {}       # "/static/imagens/variantes/logo.png" -> _Arquivo (WebP reduzida)
+        self._paginas = {}    # "index.html" -> _Arquivo (HTML reescrito)
+
+    # ---------- carga ----------
+    def _origens(self):
+        for pasta in PASTAS:
+            diretorio = self.raiz / pasta
+            if diretorio.is_dir():
+                for caminho in sorted(diretorio.iterdir()):
+                    if caminho.is_file():
+                        yield f"/{pasta}/{caminho.name}", caminho
+
+    def _assinatura_atual(self):
+        caminhos = [c for _, c in self._origens()] + [self.raiz / p for p in PAGINAS]
+        variantes = self.raiz / "static/imagens" / VARIANTES
+        if variantes.is_dir():
+            caminhos.extend(variantes.iterdir())
+        return tuple((str(c), c.stat().st_mtime_ns) for c in caminhos if c.is_file())
+
+    def carregar(self):
+        arquivos, webp = {}, {}
+        variantes = self.raiz / "static/imagens" / VARIANTES
+        for url, caminho in self._origens():
+            mimetype = _mimetype(caminho.name)
+            arquivos[url] = _Arquivo(caminho.read_bytes(), mimetype)
+            if not mimetype.startswith("image/"):
+                continue
+            url_variante = f"/static/imagens/{VARIANTES}/{caminho.name}"
+            reduzida = variantes / caminho.name
+            alternativa = variantes / f"{caminho.stem}.webp"
+            conteudo = reduzida.read_bytes() if reduzida.is_file() else arquivos[url].conteudo
+            # o hash cobre as duas: regerar qualquer uma muda a URL
+            digest = hashlib.sha256(conteudo)
+            if alternativa.is_file():
+                dados_webp = alternativa.read_bytes()
+                digest.update(dados_webp)
+            hash_ = digest.hexdigest()[:10]
+            arquivos[url_variante] = _Arquivo(conteudo, mimetype, hash_)
+            if alternativa.is_file() and mimetype != "image/webp":
+                webp[url_variante] = _Arquivo(dados_webp, "image/webp", hash_)
+
+        paginas = {}
+        for nome in PAGINAS:
+            caminho = self.raiz / nome
+            if caminho.is_file():
+                html = caminho.read_text(encoding="utf-8")
+                html = _REFERENCIA_RE.sub(
+                    lambda m: f'{m["attr"]}="{_url_versionada(arquivos, m["url"])}"', html
+                )
+                paginas[nome] = _Arquivo(html.encode("utf-8"), "text/html")
+
+        with self._lock:
+            self._arquivos, self._webp, self._paginas = arquivos, webp, paginas
+            self._assinatura = self._assinatura_atual() if self.recarregar else True
+
+    def _garantir_carregado(self):
+        if self._assinatura is None or (
+            self.recarregar and self._assinatura != self._assinatura_atual()
+        ):
+            self.carregar()
+
+    # ---------- consulta ----------
+    def url(self, caminho):
+        """URL com hash do asset ("/css/style.css" -> "/css/style.<hash>.css")"""
+        self._garantir_carregado()
+        return _url_versionada(self._arquivos, caminho)
+
+    def arquivo(self, pasta, nome):
+        """
+        Resposta para /<pasta>/<nome>. Com o hash atual no nome, cache imutável;
+        sem hash (ou com hash de um deploy anterior), revalida por ETag.
+        None se o arquivo não existir.
+        """
+        self._garantir_carregado()
+        m = _VERSIONADO_RE.match(nome)
+        url = f"/{pasta}/{m['base']}{m['ext']}" if m else f"/{pasta}/{nome}"
+        arquivo = self._arquivos.get(url)
+        if arquivo is None:
+            if not m:
+                return None
+            # nome que só parece versionado ("logo.2024010101.png")
+            url, m = f"/{pasta}/{nome}", None
+            arquivo = self._arquivos.get(url)
+            if arquivo is None:
+                return None
+
+        webp = self._webp.get(url)
+        variar_accept = webp is not None
+        # só quem declara image/webp (o */* de navegadores antigos não vale)
+        if webp is not None and "image/webp" in request.headers.get("Accept", ""):
+            arquivo = webp
+        imutavel = m is not None and m["hash"] == arquivo.hash
+        return _responder(arquivo, CACHE_IMUTAVEL if imutavel else "public, no-cache",
+                          variar_accept)
+
+    def pagina(self, nome, privada=False):
+        """index.html / login.html com as URLs versionadas; sempre revalida"""
+        self._garantir_carregado()
+        return _responder(self._paginas[nome], "private, no-cache" if privada else "no-cache")
+
+
+def _url_versionada(arquivos, caminho):
+    arquivo = arquivos.get(caminho)
+    if arquivo is None:
+        return caminho
+    base, ext = os.path.splitext(caminho)
+    return f"{base}.{arquivo.hash}{ext}"
+
+
+def _responder(arquivo, cache_control, variar_accept=False):
+    codificacao = next((c for c in _codificacoes_aceitas() if c in arquivo.comprimidos), None)
+    resposta = Response(arquivo.comprimidos[codificacao] if codificacao else arquivo.conteudo,
+                        mimetype=arquivo.mimetype)
+    if codificacao:
+        resposta.headers["Content-Encoding"] = codificacao
+    if arquivo.comprimidos:
+        resposta.vary.add("Accept-Encoding")
+    if variar_accept:
+        resposta.vary.add("Accept")
+    resposta.headers["Cache-Control"] = cache_control
+    # ETag por representação: a versão gzip e a brotli não são o mesmo corpo
+    resposta.set_etag(f"{arquivo.hash}-{codificacao or 'identity'}")
+    return resposta.make_conditional(request)
+
+
+# =========================
+# COMPRESSÃO DAS RESPOSTAS DINÂMICAS
+# =========================
+def comprimir_resposta(response):
+    """
+    after_request: gzip/brotli para JSON/HTML/CSV acima de COMPRESSAO_MINIMA.
+    Não mexe em respostas em streaming (exportações), arquivos enviados direto
+    do disco nem no que já tem Content-Encoding (assets pré-comprimidos).
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRIMIVEIS):
+        return response
+    response.vary.add("Accept-Encoding")
+    corpo = response.get_data()
+    codificacoes = _codificacoes_aceitas()
+    if len(corpo) < COMPRESSAO_MINIMA or not codificacoes:
+        return response
+
+    response.set_data(_comprimir(corpo, codificacoes[0]))
+    response.headers["Content-Encoding"] = codificacoes[0]
+    # a ETag forte (dashboard) vira fraca: o corpo mudou, o conteúdo não;
+    # If-None-Match compara ETags fracas, então o 304 continua funcionando
+    etag, fraca = response.get_etag()
+    if etag and not fraca:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# =========================
+# VARIANTES DE IMAGEM (manage.py otimizar-imagens)
+# =========================
+def gerar_variantes(lado_maximo=256, raiz=RAIZ, saida=print):
+    """
+    Para cada imagem de static/imagens, grava em static/imagens/variantes/ uma
+    cópia reduzida (maior lado <= lado_maximo, mesmo formato) e uma WebP,
+    cada uma só se ficar menor que o original. Precisa do Pillow.
+    Retorna o número de arquivos gravados.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Instale o Pillow para gerar as variantes: pip install Pillow")
+
+    origem = Path(raiz) / "static/imagens"
+    destino = origem / VARIANTES
+    destino.mkdir(exist_ok=True)
+    gravados = 0
+    for caminho in sorted(origem.iterdir()):
+        if not caminho.is_file() or not _mimetype(caminho.name).startswith("image/"):
+            continue
+        original = caminho.stat().st_size
+        with Image.open(caminho) as imagem:
+            imagem.load()
+            imagem.thumbnail((lado_maximo, lado_maximo))
+            formato = imagem.format or Image.registered_extensions().get(caminho.suffix.lower())
+            opcoes = {"optimize": True}
+            if formato == "JPEG":
+                opcoes.update(quality=82, progressive=True)
+                if imagem.mode not in ("RGB", "L"):
+                    imagem = imagem.convert("RGB")
+            alvos = [(destino / caminho.name, formato, opcoes)]
+            if formato != "WEBP":
+                alvos.append((destino / f"{caminho.stem}.webp", "WEBP", {"quality": 82, "method": 6}))
+            for alvo, fmt, kw in alvos:
+                temporario = alvo.with_suffix(alvo.suffix + ".tmp")
+                imagem.save(temporario, fmt, **kw)
+                tamanho = temporario.stat().st_size
+                if tamanho < original:
+                    temporario.replace(alvo)
+                    gravados += 1
+                    saida(f"  {alvo.relative_to(origem)}: {original // 1024} KB -> {tamanho // 1024} KB")
+                else:
+                    temporario.unlink()
+                    if alvo.exists():
+                        alvo.unlink()
+    return gravados
+
+
+estaticos = Estaticos(recarregar=os.getenv("ESTATICOS_RECARREGAR", "0") == "1")
@@ -0,0 +1,193 @@
+# eventos.py
+"""
+Dashboard e saldo de cestas empurrados por Server-Sent Events (GET /eventos),
+em vez de cada tablet pedir /dashboard-data de tempos em tempos.
+
+Um Difusor por processo: uma thread recalcula o dashboard (uma vez, no cache
+de sempre) quando algo muda e manda a mesma mensagem já serializada a todos
+os clientes conectados. O custo no banco não depende de quantas telas estão
+abertas:
+- escrita neste processo: invalidar_dashboard() acorda a thread na hora
+- escrita em outro worker: a thread confere database.versao_dashboard() a
+  cada EVENTOS_INTERVALO segundos (uma consulta só de índices), e só enquanto
+  houver cliente conectado
+Rajadas de entregas são agrupadas (EVENTOS_AGRUPAR) num recálculo só.
+
+Eventos: "dashboard" (só os campos que mudaram; o primeiro traz tudo) e
+"saldo" ({"cestasEstoque"}, quando o saldo muda). Cada conexão ocupa uma
+thread do worker (gthread) por até EVENTOS_DURACAO_MAXIMA, parada numa
+Condition, sem conexão de banco. gunicorn.conf.py dá a cada worker
+EVENTOS_MAX_CONEXOES threads além das GUNICORN_THREADS: os streams nunca
+tomam as threads de login e entregas. Acima do limite a rota responde 503 e
+a tela volta a buscar /dashboard-data (ETag/304, do mesmo cache) a cada 30 s.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import database
+import serializacao
+
+EVENTOS_INTERVALO = float(os.getenv("EVENTOS_INTERVALO", "2"))          # checagem entre processos
+EVENTOS_AGRUPAR = float(os.getenv("EVENTOS_AGRUPAR", "0.5"))            # segundos
+EVENTOS_HEARTBEAT = float(os.getenv("EVENTOS_HEARTBEAT", "15"))         # comentário keep-alive
+EVENTOS_DURACAO_MAXIMA = float(os.getenv("EVENTOS_DURACAO_MAXIMA", "600"))  # depois o cliente reconecta
+# streams por processo; cada um tem a sua thread extra no gthread (gunicorn.conf.py)
+EVENTOS_MAX_CONEXOES = int(os.getenv("EVENTOS_MAX_CONEXOES", "32"))
+EVENTOS_FILA = 16                                                       # mensagens por cliente
+
+RECONEXAO_MS = 5000
+
+
+class LimiteDeConexoes(Exception):
+    """Mais de EVENTOS_MAX_CONEXOES clientes neste processo"""
+
+
+def _mensagem(evento, dados):
+    return f"event: {evento}\ndata: ".encode("utf-8") + serializacao.dumps_bytes(dados) + b"\n\n"
+
+
+class _Assinatura:
+    """Fila de um cliente; quem publica nunca espera por ele"""
+
+    def __init__(self):
+        self._fila = deque()
+        self._cond = threading.Condition()
+        self.atrasada = False
+
+    def entregar(self, mensagem):
+        with self._cond:
+            if len(self._fila) >= EVENTOS_FILA:
+                # cliente lento: descarta o acumulado e manda o estado completo depois
+                self._fila.clear()
+                self.atrasada = True
+            self._fila.append(mensagem)
+            self._cond.notify()
+
+    def proxima(self, timeout):
+        """Próxima mensagem, ou None se nada chegou em `timeout` segundos"""
+        with self._cond:
+            if not self._fila:
+                self._cond.wait(timeout)
+            return self._fila.popleft() if self._fila else None
+
+
+class Difusor:
+    def __init__(self):
+        self._assinaturas = set()
+        self._lock = threading.Lock()
+        self._mudou = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._estado = None      # último dashboard publicado
+        self._versao = None      # última database.versao_dashboard() vista
+
+    # ---------- clientes ----------
+    def assinar(self):
+        with self._lock:
+            if len(self._assinaturas) >= EVENTOS_MAX_CONEXOES:
+                raise LimiteDeConexoes()
+            assinatura = _Assinatura()
+            self._assinaturas.add(assinatura)
+        self._iniciar()
+        if self._estado is None:
+            self._mudou.set()  # primeiro cliente do processo: calcula já
+        else:
+            assinatura.entregar(self._completo())
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def conectados(self):
+        with self._lock:
+            return len(self._assinaturas)
+
+    def fluxo(self, assinatura):
+        """
+        Gerador do corpo text/event-stream de um cliente. Quem monta a resposta
+        libera a assinatura com Response.call_on_close (o gerador pode nem ser
+        iniciado, se o cliente desistir antes do primeiro byte).
+        """
+        yield f"retry: {RECONEXAO_MS}\n\n".encode("utf-8")
+        fim = time.monotonic() + EVENTOS_DURACAO_MAXIMA
+        while time.monotonic() < fim:
+            mensagem = assinatura.proxima(EVENTOS_HEARTBEAT)
+            if mensagem is None:
+                # mantém proxies acordados e descobre cliente que foi embora
+                yield b": ping\n\n"
+                continue
+            if assinatura.atrasada:
+                assinatura.atrasada = False
+                mensagem = self._completo()
+            yield mensagem
+
+    # ---------- publicação ----------
+    def notificar(self):
+        """Ouvinte de database.invalidar_dashboard: só acorda a thread"""
+        self._mudou.set()
+
+    def _completo(self):
+        return _mensagem("dashboard", self._estado or {})
+
+    def _publicar(self):
+        snapshot = database.get_dashboard_snapshot()
+        if not snapshot["etag"]:
+            return  # erro no banco: mantém o último estado em vez de mandar zeros
+        dados = snapshot["dados"]
+        anterior = self._estado or {}
+        delta = {k: v for k, v in dados.items() if anterior.get(k) != v}
+        if not delta:
+            return
+        mensagens = [_mensagem("dashboard", delta)]
+        if "cestasEstoque" in delta:
+            mensagens.append(_mensagem("saldo", {"cestasEstoque": dados["cestasEstoque"]}))
+        self._estado = dados
+        with self._lock:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            for mensagem in mensagens:
+                assinatura.entregar(mensagem)
+
+    def _laco(self):
+        while True:
+            acordou = self._mudou.wait(EVENTOS_INTERVALO)
+            if not self.conectados():
+                # ninguém ouvindo: nada de consultar o banco; o estado é refeito no próximo cliente
+                self._mudou.clear()
+                self._estado = None
+                self._versao = None
+                continue
+            try:
+                if not acordou:
+                    versao = database.versao_dashboard()
+                    if versao == self._versao:
+                        continue
+                    # outro processo gravou: invalidar lê do primário e limpa o cache daqui também
+                    database.invalidar_dashboard()
+                time.sleep(EVENTOS_AGRUPAR)
+                self._mudou.clear()
+                self._versao = database.versao_dashboard()
+                self._publicar()
+            except Exception as e:
+                logging.error(f"Erro ao publicar eventos do dashboard: {e}")
+                self._mudou.clear()
+                time.sleep(EVENTOS_INTERVALO)
+
+    def _iniciar(self):
+        """Sobe a thread neste processo (depois do fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._laco, name="eventos-dashboard", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+
+difusor = Difusor()
+database.ao_invalidar_dashboard(difusor.notificar)
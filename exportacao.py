@@ -0,0 +1,91 @@
+# exportacao.py
+"""
+Exportação em CSV (streaming) e XLSX (opcional, requer openpyxl).
+
+As linhas vêm de geradores do database.py (iter_export_*), lidas com cursor do
+lado do servidor; aqui elas são escritas e devolvidas em blocos, então a
+memória não cresce com o tamanho do período exportado.
+"""
+import csv
+import io
+import tempfile
+from datetime import date, datetime
+
+try:
+    import openpyxl
+except ImportError:  # XLSX é opcional
+    openpyxl = None
+
+FORMATOS = ("csv", "xlsx")
+TAMANHO_BLOCO = 64 * 1024
+
+MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class FormatoIndisponivel(Exception):
+    pass
+
+
+def _valor_csv(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def gerar_csv(colunas, linhas):
+    """
+    Gera o CSV em blocos de ~64 KB. Separador ";" e BOM UTF-8, para o Excel
+    abrir com acentos e sem juntar colunas (o importacao.py lê os dois separadores).
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    escritor.writerow(colunas)
+    for linha in linhas:
+        escritor.writerow([_valor_csv(v) for v in linha])
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gerar_xlsx(colunas, linhas, titulo="Dados"):
+    """
+    XLSX é um zip e só fica pronto no fim: a planilha é escrita em modo
+    write_only num arquivo temporário (memória constante) e depois enviada
+    em blocos.
+    """
+    if openpyxl is None:
+        raise FormatoIndisponivel("Exportação XLSX requer o pacote openpyxl (pip install openpyxl).")
+
+    def gerar():
+        with tempfile.TemporaryFile() as arquivo:
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet(titulo)
+            ws.append(colunas)
+            for linha in linhas:
+                ws.append(list(linha))
+            wb.save(arquivo)
+            arquivo.seek(0)
+            while True:
+                bloco = arquivo.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+
+    return gerar()
+
+
+def exportar(formato, colunas, linhas, titulo="Dados"):
+    """Gerador do corpo da resposta no formato pedido"""
+    if formato == "xlsx":
+        return gerar_xlsx(colunas, linhas, titulo)
+    if formato == "csv":
+        return gerar_csv(colunas, linhas)
+    raise ValueError(f"Formato não suportado: {formato}")
@@ -0,0 +1,29 @@
+# gunicorn.conf.py
+"""
+gunicorn -c gunicorn.conf.py wsgi:app
+
+Vários processos (WEB_CONCURRENCY), cada um com várias threads (GUNICORN_THREADS).
+Cada processo tem o seu pool de conexões: mantenha GUNICORN_THREADS <= DB_POOL_MAX
+e WEB_CONCURRENCY * DB_POOL_MAX abaixo do max_connections do MySQL.
+
+Os streams de /eventos (eventos.py) ficam parados numa thread cada, sem conexão
+de banco: o worker ganha EVENTOS_MAX_CONEXOES threads a mais só para eles, e o
+limite do difusor garante que as GUNICORN_THREADS continuam livres para o resto.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+worker_class = "gthread"
+# mesmo padrão de EVENTOS_MAX_CONEXOES em eventos.py
+threads = int(os.getenv("GUNICORN_THREADS", "4")) + int(os.getenv("EVENTOS_MAX_CONEXOES", "32"))
+
+# importa o app uma vez no mestre e faz fork: workers sobem sem reimportar nada
+# (create_app fecha o pool antes do fork, então nenhuma conexão é compartilhada)
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
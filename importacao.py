@@ -0,0 +1,129 @@
+# importacao.py
+"""
+Importação em massa de famílias (CSV ou JSON Lines).
+
+As colunas/chaves são as mesmas do POST /cadastrar-familia:
+responsavelNome, responsavelCPF, responsavelNascimento, responsavelGenero,
+responsavelEndereco, telefone, numeroPessoas, numeroFilhos. No JSON Lines,
+"membros" (lista) também é aceito e gravado junto com a família.
+
+O arquivo é lido linha a linha e gravado em lotes (executemany), cada lote
+na sua transação, então a memória não cresce com o tamanho do arquivo.
+"""
+import csv
+import io
+import json
+import logging
+
+from database import inserir_familias_lote, normalizar_cpf, validar_familia
+
+TAMANHO_LOTE_PADRAO = 500
+FORMATOS = ("csv", "jsonl")
+
+
+def detectar_formato(nome_arquivo=None, content_type=None):
+    nome = (nome_arquivo or "").lower()
+    tipo = (content_type or "").lower()
+    if nome.endswith((".jsonl", ".ndjson")) or "ndjson" in tipo or "jsonl" in tipo:
+        return "jsonl"
+    return "csv"
+
+
+def ler_registros(stream, formato="csv"):
+    """
+    Gera (linha, data, erro) a partir de um stream binário ou texto.
+    `linha` é o número da linha no arquivo (o cabeçalho do CSV é a linha 1).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato não suportado: {formato}")
+
+    if isinstance(stream, io.TextIOBase):
+        texto = stream
+    else:
+        texto = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    if formato == "csv":
+        amostra = texto.readline()
+        delimitador = ";" if amostra.count(";") > amostra.count(",") else ","
+        leitor = csv.DictReader(_encadear(amostra, texto), delimiter=delimitador)
+        for linha, row in enumerate(leitor, start=2):
+            yield linha, {k.strip(): (v or "").strip() for k, v in row.items() if k}, None
+        return
+
+    for linha, bruto in enumerate(texto, start=1):
+        bruto = bruto.strip()
+        if not bruto:
+            continue
+        try:
+            data = json.loads(bruto)
+        except ValueError as e:
+            yield linha, None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield linha, None, "Cada linha deve ser um objeto JSON"
+            continue
+        yield linha, data, None
+
+
+def _encadear(primeira, resto):
+    yield primeira
+    yield from resto
+
+
+def importar_familias(registros, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """
+    Valida (mesmas regras do cadastro individual), remove CPFs repetidos dentro
+    do arquivo e grava em lotes. Retorna o resumo com uma entrada por linha
+    que não foi inserida.
+    """
+    resumo = {"inseridas": 0, "duplicadas": 0, "invalidas": 0, "erros": 0, "falhas": []}
+    vistos = set()
+    lote = []
+
+    def falha(linha, contador, status, erro, data=None):
+        resumo[contador] += 1
+        resumo["falhas"].append({
+            "linha": linha,
+            "status": status,
+            "cpf": (data or {}).get("responsavelCPF"),
+            "erro": erro,
+        })
+
+    def gravar():
+        try:
+            resultados = inserir_familias_lote(lote)
+        except Exception as e:
+            logging.error(f"Erro ao importar lote de famílias: {e}")
+            resultados = [(linha, "erro", str(e)) for linha, _ in lote]
+
+        dados = dict(lote)
+        for linha, status, erro in resultados:
+            if status == "inserida":
+                resumo["inseridas"] += 1
+            elif status == "duplicada":
+                falha(linha, "duplicadas", "duplicada", erro, dados[linha])
+            else:
+                falha(linha, "erros", "erro", erro, dados[linha])
+        lote.clear()
+
+    for linha, data, erro in registros:
+        if erro is None:
+            erro = validar_familia(data)
+        if erro:
+            falha(linha, "invalidas", "invalida", erro, data)
+            continue
+
+        cpf = normalizar_cpf(data.get("responsavelCPF"))
+        if cpf and cpf in vistos:
+            falha(linha, "duplicadas", "duplicada", "CPF repetido no arquivo", data)
+            continue
+        vistos.add(cpf)
+
+        lote.append((linha, data))
+        if len(lote) >= tamanho_lote:
+            gravar()
+
+    if lote:
+        gravar()
+
+    return resumo
@@ -7,6 +7,30 @@ function byId(id) { return document.getElementById(id); }
 function qs(sel) { return document.querySelector(sel); }
 function qsa(sel) { return document.querySelectorAll(sel); }
 
+// ============================
+// Paginação (keyset): listas retornam { items, next_cursor }
+// ============================
+async function buscarPagina(url, after) {
+  const sep = url.includes('?') ? '&' : '?';
+  const full = after ? `${url}${sep}after=${encodeURIComponent(after)}` : url;
+  const response = await fetch(full);
+  if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
+  return response.json();
+}
+
+function debounce(fn, ms) {
+  let t = null;
+  return (...args) => {
+    clearTimeout(t);
+    t = setTimeout(() => fn(...args), ms);
+  };
+}
+
+function toggleCarregarMais(id, cursor) {
+  const btn = byId(id);
+  if (btn) btn.classList.toggle('hidden', !cursor);
+}
+
 // ============================
 // Função para mostrar/ocultar seções
 // ============================
@@ -22,7 +46,10 @@ function showSection(sectionId) {
 
   // Carregar dados específicos ao abrir a seção
   if (sectionId === 'dashboard') carregarDashboard();
-  if (sectionId === 'entregas') carregarFamiliasSelect();
+  if (sectionId === 'entregas') {
+    carregarFamiliasSelect();
+    carregarKitsEntrega();
+  }
   if (sectionId === 'consulta') buscarFamilias();
   if (sectionId === 'historico') {
     carregarFamiliasFiltro();
@@ -62,9 +89,64 @@ function limparFormulario() {
   const form = byId('familiaForm');
   if (form && confirm('Tem certeza que deseja limpar o formulário?')) {
     form.reset();
+    limparMembros();
   }
 }
 
+// ============================
+// Membros da família
+// ============================
+// os campos não têm "name": ficam fora do FormData e vão em data.membros
+const PARENTESCOS = ['cônjuge', 'filho', 'pai', 'mãe', 'avo', 'outro'];
+
+function adicionarMembro() {
+  const lista = byId('membrosFamilia');
+  if (!lista) return;
+  const linha = document.createElement('div');
+  linha.className = 'form-row membro-linha';
+  linha.innerHTML = `
+    <div class="form-group">
+      <label>Nome completo *</label>
+      <input type="text" class="membro-nome" required>
+    </div>
+    <div class="form-group">
+      <label>Idade</label>
+      <input type="number" class="membro-idade" min="0" max="130">
+    </div>
+    <div class="form-group">
+      <label>Parentesco</label>
+      <select class="membro-parentesco">
+        <option value="">Selecione</option>
+        ${PARENTESCOS.map(p => `<option value="${p}">${p}</option>`).join('')}
+      </select>
+    </div>
+    <div class="form-group">
+      <label>Escolaridade</label>
+      <input type="text" class="membro-escolaridade">
+    </div>
+    <div class="form-group">
+      <label><input type="checkbox" class="membro-estuda"> Estuda</label>
+      <button type="button" class="btn-secondary" onclick="this.closest('.membro-linha').remove()">Remover</button>
+    </div>
+  `;
+  lista.appendChild(linha);
+}
+
+function lerMembros() {
+  return Array.from(document.querySelectorAll('#membrosFamilia .membro-linha')).map(linha => ({
+    nome: linha.querySelector('.membro-nome').value.trim(),
+    idade: linha.querySelector('.membro-idade').value || null,
+    parentesco: linha.querySelector('.membro-parentesco').value || null,
+    escolaridade: linha.querySelector('.membro-escolaridade').value.trim() || null,
+    estuda: linha.querySelector('.membro-estuda').checked
+  }));
+}
+
+function limparMembros() {
+  const lista = byId('membrosFamilia');
+  if (lista) lista.innerHTML = '';
+}
+
 // Data atual para entrega
 const dataEntregaEl = byId('dataEntrega');
 if (dataEntregaEl) dataEntregaEl.valueAsDate = new Date();
@@ -78,6 +160,7 @@ if (familiaForm) {
     e.preventDefault();
     const formData = new FormData(this);
     const data = Object.fromEntries(formData);
+    data.membros = lerMembros();
 
     try {
       const response = await fetch('/cadastrar-familia', {
@@ -91,6 +174,7 @@ if (familiaForm) {
       if (response.ok) {
         alert('Cadastro salvo com sucesso!');
         this.reset();
+        limparMembros();
         showSection('dashboard');
       } else {
         alert(`Erro: ${result.error || 'Não foi possível salvar.'}`);
@@ -111,84 +195,257 @@ if (entregaForm) {
     e.preventDefault();
     const formData = new FormData(this);
     const data = Object.fromEntries(formData);
+    // mesma chave no reenvio e na fila: o servidor não grava duas vezes
+    data.chave = novaChaveEntrega();
+
+    const limparForm = () => {
+      this.reset();
+      const d = byId('dataEntrega');
+      if (d) d.valueAsDate = new Date();
+    };
+
+    // Sem rede: guarda na fila local e segue atendendo
+    if (!navigator.onLine) {
+      enfileirarEntrega(data);
+      showToast('Sem conexão: entrega guardada no aparelho.', 'Será enviada quando a rede voltar.');
+      limparForm();
+      return;
+    }
 
     try {
-      const response = await fetch('/registrar-entrega', {
+      const enviar = () => fetch('/registrar-entrega', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(data)
       });
+      let response = await enviar();
+
+      // Família já atendida no mês: só registra de novo se o voluntário confirmar
+      if (response.status === 409) {
+        const result = await response.clone().json();
+        if (result.duplicada && confirm(`${result.error}\nRegistrar mesmo assim?`)) {
+          data.forcar = true;
+          response = await enviar();
+        }
+      }
 
-      if (response.ok) {
+      if (response.status === 202) {
+        // banco fora do ar: o servidor guardou no diário local e grava depois
+        showToast('Entrega recebida pelo servidor.', 'Será gravada assim que o banco responder.');
+        limparForm();
+        showSection('dashboard');
+      } else if (response.ok) {
         alert('Entrega registrada com sucesso!');
-        this.reset();
-        const d = byId('dataEntrega');
-        if (d) d.valueAsDate = new Date();
+        limparForm();
         showSection('dashboard');
       } else {
         const result = await response.json();
         alert(`Erro: ${result.error}`);
       }
     } catch (err) {
-      alert('Erro de conexão com o servidor.');
+      // Falha de rede no meio do envio: não perde a entrega
       console.error(err);
+      enfileirarEntrega(data);
+      showToast('Falha de conexão: entrega guardada no aparelho.', 'Será enviada automaticamente.');
+      limparForm();
     }
   });
 }
 
+// ============================
+// FILA OFFLINE DE ENTREGAS
+// ============================
+const FILA_ENTREGAS_KEY = 'filaEntregas';
+const FILA_ENTREGAS_LOTE = 50;
+let enviandoFilaEntregas = false;
+
+function lerFilaEntregas() {
+  try {
+    return JSON.parse(localStorage.getItem(FILA_ENTREGAS_KEY)) || [];
+  } catch (err) {
+    return [];
+  }
+}
+
+function salvarFilaEntregas(fila) {
+  localStorage.setItem(FILA_ENTREGAS_KEY, JSON.stringify(fila));
+  atualizarInfoFilaEntregas();
+}
+
+function novaChaveEntrega() {
+  return `${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+function enfileirarEntrega(data) {
+  const fila = lerFilaEntregas();
+  // "chave" é a chave de idempotência do lote (entradas antigas da fila só têm o id)
+  const chave = data.chave || novaChaveEntrega();
+  fila.push({ ...data, id: chave, chave });
+  salvarFilaEntregas(fila);
+}
+
+function atualizarInfoFilaEntregas() {
+  const el = byId('filaEntregasInfo');
+  if (!el) return;
+  const pendentes = lerFilaEntregas().length;
+  el.classList.toggle('hidden', pendentes === 0);
+  const texto = byId('filaEntregasTexto');
+  if (texto) texto.textContent = `${pendentes} entrega(s) aguardando envio.`;
+}
+
+async function enviarFilaEntregas() {
+  if (enviandoFilaEntregas || !navigator.onLine) return;
+  enviandoFilaEntregas = true;
+
+  let registradas = 0;
+  const rejeitadas = [];
+
+  try {
+    let fila = lerFilaEntregas();
+    while (fila.length) {
+      const lote = fila.slice(0, FILA_ENTREGAS_LOTE);
+      const res = await fetch('/registrar-entregas-lote', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ entregas: lote })
+      });
+      if (!res.ok) break; // sessão expirada / servidor fora: tenta de novo depois
+
+      const { resultados } = await res.json();
+      const reenviar = new Set();
+      (resultados || []).forEach(r => {
+        if (r.status === 'ok') registradas++;
+        else if (r.status === 'falha') reenviar.add(r.id);
+        else rejeitadas.push({ ...lote[r.indice], erro: r.erro });
+      });
+
+      const enviados = new Set(lote.map(e => e.id).filter(id => !reenviar.has(id)));
+      fila = lerFilaEntregas().filter(e => !enviados.has(e.id));
+      salvarFilaEntregas(fila);
+      if (reenviar.size) break;
+    }
+  } catch (err) {
+    console.warn('Falha ao enviar fila de entregas. Nova tentativa mais tarde.', err);
+  } finally {
+    enviandoFilaEntregas = false;
+  }
+
+  if (registradas) {
+    showToast(`${registradas} entrega(s) pendente(s) enviada(s).`);
+    if (!byId('dashboard')?.classList.contains('hidden')) carregarDashboard();
+  }
+  if (rejeitadas.length) {
+    console.error('Entregas recusadas pelo servidor:', rejeitadas);
+    alert('Algumas entregas guardadas foram recusadas:\n\n' +
+      rejeitadas.map(e => `Família ${e.familiaEntrega} em ${e.dataEntrega}: ${e.erro}`).join('\n'));
+  }
+}
+
+window.addEventListener('online', enviarFilaEntregas);
+setInterval(() => { if (lerFilaEntregas().length) enviarFilaEntregas(); }, 30 * 1000);
+document.addEventListener('DOMContentLoaded', () => {
+  atualizarInfoFilaEntregas();
+  enviarFilaEntregas();
+});
+
 // ============================
 // CARREGAR DASHBOARD
 // ============================
 async function carregarDashboard() {
+  // com o stream de eventos aberto, o servidor já manda cada mudança
+  if (eventosDashboard && eventosDashboard.readyState === EventSource.OPEN) return;
   try {
     const response = await fetch('/dashboard-data');
     if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
-    const data = await response.json();
-
-    if (byId('totalFamilias')) byId('totalFamilias').textContent = data.totalFamilias;
-    if (byId('cestasMes')) byId('cestasMes').textContent = data.cestasMes;
-    if (byId('totalPessoas')) byId('totalPessoas').textContent = data.totalPessoas;
-    if (byId('cestasEstoque')) byId('cestasEstoque').textContent = data.cestasEstoque;
-
-    const tbody = qs('#ultimasEntregas tbody');
-    if (!tbody) return;
-
-    tbody.innerHTML = '';
-    (data.ultimasEntregas || []).forEach(e => {
-      const tr = document.createElement('tr');
-      tr.innerHTML = `
-        <td>${e.data}</td>
-        <td>${e.familia}</td>
-        <td>${e.responsavel}</td>
-        <td>${e.quantidade}</td>
-      `;
-      tbody.appendChild(tr);
-    });
+    aplicarDashboard(await response.json());
   } catch (err) {
     console.error('Erro ao carregar dashboard:', err);
     alert('Erro ao carregar dados do dashboard.');
   }
 }
 
+// data pode ser parcial (evento "dashboard" traz só os campos que mudaram)
+function aplicarDashboard(data) {
+  ['totalFamilias', 'cestasMes', 'totalPessoas', 'cestasEstoque'].forEach(campo => {
+    if (campo in data && byId(campo)) byId(campo).textContent = data[campo];
+  });
+
+  const tbody = qs('#ultimasEntregas tbody');
+  if (!tbody || !('ultimasEntregas' in data)) return;
+
+  tbody.innerHTML = '';
+  (data.ultimasEntregas || []).forEach(e => {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+      <td>${e.data}</td>
+      <td>${e.familia}</td>
+      <td>${e.responsavel}</td>
+      <td>${e.quantidade}</td>
+    `;
+    tbody.appendChild(tr);
+  });
+}
+
+// ============================
+// EVENTOS DO SERVIDOR (dashboard ao vivo)
+// ============================
+let eventosDashboard = null;
+let consultaDashboard = null;
+const CONSULTA_DASHBOARD_MS = 30 * 1000;
+
+function conectarEventos() {
+  if (!window.EventSource) {
+    consultarDashboardPeriodicamente();
+    return;
+  }
+  if (eventosDashboard) return;
+  eventosDashboard = new EventSource('/eventos');
+  eventosDashboard.addEventListener('open', () => {
+    clearInterval(consultaDashboard);
+    consultaDashboard = null;
+  });
+  eventosDashboard.addEventListener('dashboard', e => aplicarDashboard(JSON.parse(e.data)));
+  eventosDashboard.onerror = () => {
+    // queda de rede: o EventSource reconecta sozinho. Fechado (503 com o
+    // limite de streams do servidor, sessão expirada): consulta
+    // /dashboard-data (ETag/304) e tenta o stream mais tarde
+    if (eventosDashboard.readyState === EventSource.CLOSED) {
+      eventosDashboard = null;
+      consultarDashboardPeriodicamente();
+      setTimeout(conectarEventos, 5 * 60 * 1000);
+    }
+  };
+}
+
+function consultarDashboardPeriodicamente() {
+  if (consultaDashboard) return;
+  consultaDashboard = setInterval(() => {
+    if (!byId('dashboard')?.classList.contains('hidden')) carregarDashboard();
+  }, CONSULTA_DASHBOARD_MS);
+}
+
 // ============================
 // BUSCAR FAMÍLIAS
 // ============================
-async function buscarFamilias() {
+let familiasCursor = null;
+
+async function buscarFamilias(append = false) {
   const buscaEl = byId('buscaFamilia');
   const query = buscaEl ? buscaEl.value.trim() : '';
   const url = `/buscar-familias${query ? `?q=${encodeURIComponent(query)}` : ''}`;
 
   try {
-    const response = await fetch(url);
-    if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
-    const familias = await response.json();
+    const pagina = await buscarPagina(url, append ? familiasCursor : null);
+    const familias = pagina.items || [];
+    familiasCursor = pagina.next_cursor;
+    toggleCarregarMais('maisFamilias', familiasCursor);
 
     const tbody = qs('#tabelaFamilias tbody');
     if (!tbody) return;
 
-    tbody.innerHTML = '';
+    if (!append) tbody.innerHTML = '';
 
-    if (!familias || familias.length === 0) {
+    if (!append && familias.length === 0) {
       tbody.innerHTML = '<tr><td colspan="6">Nenhuma família encontrada.</td></tr>';
       return;
     }
@@ -200,7 +457,7 @@ async function buscarFamilias() {
         <td>${f.cpf}</td>
         <td>${f.telefone || '—'}</td>
         <td>${f.numero_pessoas}</td>
-        <td>—</td>
+        <td>${f.ultimaEntrega || '—'}</td>
         <td>
           <button class="btn-primary" onclick="editarFamilia(${f.id})">Editar</button>
           <button class="btn-secondary" onclick="detalhesFamilia(${f.id})">Detalhes</button>
@@ -222,19 +479,31 @@ function editarFamilia(id) {
 }
 
 function detalhesFamilia(id) {
-  fetch(`/buscar-familias?q=${id}`)
-    .then(r => r.json())
-    .then(familias => {
-      const f = familias[0];
-      if (f) {
-        let mensagem = `Detalhes da Família\n\n`;
-        mensagem += `Responsável: ${f.responsavel_nome}\n`;
-        mensagem += `CPF: ${f.cpf}\n`;
-        mensagem += `Telefone: ${f.telefone}\n`;
-        mensagem += `Membros na casa: ${f.numero_pessoas}\n`;
-        mensagem += `Filhos: ${f.numero_filhos || 0}\n`;
-        alert(mensagem);
+  fetch(`/familias/${id}`)
+    .then(r => {
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      return r.json();
+    })
+    .then(f => {
+      let mensagem = `Detalhes da Família\n\n`;
+      mensagem += `Responsável: ${f.responsavel_nome}\n`;
+      mensagem += `CPF: ${f.cpf}\n`;
+      mensagem += `Telefone: ${f.telefone}\n`;
+      mensagem += `Endereço: ${f.endereco || '—'}\n`;
+      mensagem += `Cadastrada em: ${f.dataCadastro || '—'}\n`;
+      mensagem += `Membros na casa: ${f.numero_pessoas}\n`;
+      mensagem += `Filhos: ${f.numero_filhos || 0}\n`;
+      mensagem += `Última entrega: ${f.ultimaEntrega || '—'}\n`;
+      mensagem += `Cestas recebidas: ${f.totalCestas || 0}\n`;
+      if ((f.membros || []).length) {
+        mensagem += `\nMembros:\n`;
+        f.membros.forEach(m => {
+          const extras = [m.parentesco, m.idade != null ? `${m.idade} anos` : null,
+            m.escolaridade, m.estuda ? 'estuda' : null].filter(Boolean).join(', ');
+          mensagem += `- ${m.nome}${extras ? ` (${extras})` : ''}\n`;
+        });
       }
+      alert(mensagem);
     })
     .catch(err => {
       alert("Erro ao carregar detalhes da família.");
@@ -243,34 +512,84 @@ function detalhesFamilia(id) {
 }
 
 // ============================
-// POPULAR SELECT DE ENTREGA
+// SELECTS DE FAMÍLIA (entrega e filtro do histórico)
+// Nunca a lista inteira: sem busca, uma página; digitando, o type-ahead
 // ============================
-async function carregarFamiliasSelect() {
-  try {
-    const response = await fetch('/buscar-familias');
-    if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
-    const familias = await response.json();
-
-    const select = byId('familiaEntrega');
-    if (!select) return;
+const FAMILIAS_POR_PAGINA_SELECT = 50;
+
+function preencherSelectFamilias(select, familias, primeira) {
+  select.innerHTML = primeira;
+  (familias || []).forEach(f => {
+    const option = document.createElement('option');
+    option.value = f.id;
+    option.textContent = `${f.responsavel_nome} (${f.cpf})`;
+    select.appendChild(option);
+  });
+}
 
-    select.innerHTML = '<option value="">Selecione uma família</option>';
+async function buscarFamiliasSelect(q) {
+  if (!q) {
+    const pagina = await buscarPagina(`/buscar-familias?limit=${FAMILIAS_POR_PAGINA_SELECT}`);
+    return pagina.items || [];
+  }
+  const res = await fetch(`/familias/sugestoes?q=${encodeURIComponent(q)}`);
+  if (!res.ok) throw new Error(`Erro HTTP: ${res.status}`);
+  return res.json();
+}
 
-    (familias || []).forEach(f => {
-      const option = document.createElement('option');
-      option.value = f.id;
-      option.textContent = `${f.responsavel_nome} (${f.cpf})`;
-      select.appendChild(option);
-    });
+async function carregarFamiliasSelect() {
+  const select = byId('familiaEntrega');
+  if (!select) return;
+  const q = byId('buscaFamiliaEntrega')?.value.trim() || '';
+  try {
+    const familias = await buscarFamiliasSelect(q);
+    preencherSelectFamilias(select, familias, familias.length
+      ? (q ? '' : '<option value="">Selecione uma família (ou busque acima)</option>')
+      : '<option value="">Nenhuma família encontrada</option>');
   } catch (err) {
     console.error('Erro ao carregar famílias para select:', err);
   }
 }
 
+async function carregarFamiliasFiltro() {
+  const select = byId('familiaFiltro');
+  if (!select) return;
+  const q = byId('buscaFamiliaFiltro')?.value.trim() || '';
+  try {
+    const familias = await buscarFamiliasSelect(q);
+    preencherSelectFamilias(select, familias, '<option value="">Todas as famílias</option>');
+  } catch (err) {
+    console.error('Erro ao carregar famílias no filtro:', err);
+  }
+}
+
+// ============================
+// BUSCA ENQUANTO DIGITA (type-ahead)
+// ============================
+const buscaFamiliaEl = byId('buscaFamilia');
+if (buscaFamiliaEl) {
+  buscaFamiliaEl.addEventListener('input', debounce(() => buscarFamilias(), 250));
+}
+
+byId('buscaFamiliaEntrega')?.addEventListener('input', debounce(carregarFamiliasSelect, 200));
+byId('buscaFamiliaFiltro')?.addEventListener('input', debounce(carregarFamiliasFiltro, 200));
+
 // ============================
 // FILTRAR ENTREGAS
 // ============================
-async function filtrarEntregas() {
+let entregasCursor = null;
+
+// Exportação: o navegador baixa direto (o servidor envia o arquivo em streaming)
+function exportarEntregas(formato) {
+  const params = new URLSearchParams({ formato });
+  const dataInicio = byId('dataInicio')?.value;
+  const dataFim = byId('dataFim')?.value;
+  if (dataInicio) params.set('dataInicio', dataInicio);
+  if (dataFim) params.set('dataFim', dataFim);
+  window.location.href = `/exportar/entregas?${params}`;
+}
+
+async function filtrarEntregas(append = false) {
   const dataInicio = byId('dataInicio')?.value || '';
   const dataFim = byId('dataFim')?.value || '';
   const familia = byId('familiaFiltro')?.value || '';
@@ -282,16 +601,17 @@ async function filtrarEntregas() {
   url = url.endsWith('?') ? '/listar-entregas' : url.slice(0, -1);
 
   try {
-    const response = await fetch(url);
-    if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
-    const entregas = await response.json();
+    const pagina = await buscarPagina(url, append ? entregasCursor : null);
+    const entregas = pagina.items || [];
+    entregasCursor = pagina.next_cursor;
+    toggleCarregarMais('maisEntregas', entregasCursor);
 
     const tbody = qs('#tabelaEntregas tbody');
     if (!tbody) return;
 
-    tbody.innerHTML = '';
+    if (!append) tbody.innerHTML = '';
 
-    (entregas || []).forEach(e => {
+    entregas.forEach(e => {
       const tr = document.createElement('tr');
       tr.innerHTML = `
         <td>${e.data_entrega}</td>
@@ -307,31 +627,6 @@ async function filtrarEntregas() {
   }
 }
 
-// ============================
-// POPULAR FILTRO DE FAMÍLIAS NO HISTÓRICO
-// ============================
-async function carregarFamiliasFiltro() {
-  try {
-    const response = await fetch('/buscar-familias');
-    if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
-    const familias = await response.json();
-
-    const select = byId('familiaFiltro');
-    if (!select) return;
-
-    select.innerHTML = '<option value="">Todas as famílias</option>';
-
-    (familias || []).forEach(f => {
-      const option = document.createElement('option');
-      option.value = f.id;
-      option.textContent = f.responsavel_nome;
-      select.appendChild(option);
-    });
-  } catch (err) {
-    console.error('Erro ao carregar famílias no filtro:', err);
-  }
-}
-
 // ============================
 // LIMPAR BUSCA
 // ============================
@@ -346,7 +641,7 @@ function limparBusca() {
 // =====================================================
 async function carregarInsumos() {
   try {
-    const res = await fetch('/insumos');
+    const res = await fetch('/insumos/estoque');
     if (!res.ok) throw new Error(`Erro HTTP: ${res.status}`);
     const data = await res.json();
 
@@ -360,15 +655,18 @@ async function carregarInsumos() {
           <td>${i.id}</td>
           <td>${i.nome}</td>
           <td>${i.unidade}</td>
+          <td>${i.saldo}</td>
           <td>${i.ativo ? 'Sim' : 'Não'}</td>
         `;
         tbody.appendChild(tr);
       });
     }
 
-    // select insumos na aba kits
-    const sel = byId('insumoSelect');
-    if (sel) {
+    // selects de insumo (aba kits e entrada de estoque)
+    ['insumoSelect', 'insumoEntradaSelect'].forEach(id => {
+      const sel = byId(id);
+      if (!sel) return;
+      const current = sel.value;
       sel.innerHTML = `<option value="">Selecione...</option>`;
       (data || []).forEach(i => {
         const opt = document.createElement('option');
@@ -376,7 +674,8 @@ async function carregarInsumos() {
         opt.textContent = `${i.nome} (${i.unidade})`;
         sel.appendChild(opt);
       });
-    }
+      if (current) sel.value = current;
+    });
   } catch (err) {
     console.error('Erro ao carregar insumos:', err);
   }
@@ -418,14 +717,56 @@ if (insumoForm) {
   });
 }
 
+const insumoEntradaForm = byId('insumoEntradaForm');
+if (insumoEntradaForm) {
+  insumoEntradaForm.addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    const insumoId = byId('insumoEntradaSelect')?.value;
+    const quantidade = Number(byId('insumoEntradaQtd')?.value);
+    const observacoes = byId('insumoEntradaObs')?.value?.trim() || '';
+
+    if (!insumoId) { alert('Selecione um insumo.'); return; }
+    if (!quantidade || quantidade <= 0) { alert('Quantidade deve ser maior que 0.'); return; }
+
+    try {
+      const res = await fetch(`/insumos/${insumoId}/entrada`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ quantidade, observacoes })
+      });
+
+      if (!res.ok) {
+        const err = await res.json().catch(() => ({}));
+        alert(err.error || 'Erro ao registrar entrada.');
+        return;
+      }
+
+      alert('Entrada registrada!');
+      insumoEntradaForm.reset();
+      await carregarInsumos();
+    } catch (err) {
+      console.error(err);
+      alert('Erro de conexão ao registrar entrada.');
+    }
+  });
+}
+
 // =====================================================
 // ✅ KITS
 // =====================================================
+// kits com os itens já embutidos (GET /kits/completos): uma requisição para a aba inteira
+let kitsCompletos = new Map();
+
 async function carregarKits() {
   try {
-    const res = await fetch('/kits');
+    const [res, resDisp] = await Promise.all([fetch('/kits/completos'), fetch('/kits/disponibilidade')]);
     if (!res.ok) throw new Error(`Erro HTTP: ${res.status}`);
     const data = await res.json();
+    kitsCompletos = new Map((data || []).map(k => [String(k.id), k]));
+    const disponiveis = new Map(
+      (resDisp.ok ? await resDisp.json() : []).map(d => [d.id, d.disponiveis])
+    );
 
     // tabela kits
     const tbody = qs('#tabelaKits tbody');
@@ -433,10 +774,13 @@ async function carregarKits() {
       tbody.innerHTML = '';
       (data || []).forEach(k => {
         const tr = document.createElement('tr');
+        const itens = (k.itens || []).map(it => `${it.insumo_nome} × ${it.quantidade}`).join(', ');
         tr.innerHTML = `
           <td>${k.id}</td>
           <td>${k.nome}</td>
           <td>${k.descricao || ''}</td>
+          <td>${itens || '—'}</td>
+          <td>${disponiveis.get(k.id) ?? '—'}</td>
           <td>${k.ativo ? 'Sim' : 'Não'}</td>
         `;
         tbody.appendChild(tr);
@@ -457,6 +801,8 @@ async function carregarKits() {
       if (current) sel.value = current;
     }
 
+    if (sel?.value) renderizarItensDoKit(sel.value);
+
   } catch (err) {
     console.error('Erro ao carregar kits:', err);
   }
@@ -498,6 +844,47 @@ if (kitForm) {
   });
 }
 
+async function carregarKitsEntrega() {
+  const sel = byId('kitEntrega');
+  if (!sel) return;
+  try {
+    const res = await fetch('/kits/disponibilidade');
+    if (!res.ok) throw new Error(`Erro HTTP: ${res.status}`);
+    const kits = await res.json();
+    const current = sel.value;
+    sel.innerHTML = '<option value="">Sem kit</option>';
+    (kits || []).forEach(k => {
+      const opt = document.createElement('option');
+      opt.value = k.id;
+      opt.textContent = `${k.nome} (${k.disponiveis} montáveis)`;
+      sel.appendChild(opt);
+    });
+    if (current) sel.value = current;
+  } catch (err) {
+    console.error('Erro ao carregar kits para entrega:', err);
+  }
+}
+
+function renderizarItensDoKit(kitId) {
+  const tbody = qs('#tabelaKitItens tbody');
+  if (!tbody) return;
+
+  tbody.innerHTML = '';
+  (kitsCompletos.get(String(kitId))?.itens || []).forEach(it => {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+      <td>${it.item_id}</td>
+      <td>${it.insumo_nome}</td>
+      <td>${it.quantidade}</td>
+      <td>${it.unidade}</td>
+      <td>
+        <button class="btn-secondary" onclick="removerItemKit(${it.item_id})">Remover</button>
+      </td>
+    `;
+    tbody.appendChild(tr);
+  });
+}
+
 async function carregarItensDoKit() {
   const kitId = byId('kitSelect')?.value;
   if (!kitId) {
@@ -505,33 +892,8 @@ async function carregarItensDoKit() {
     return;
   }
 
-  try {
-    const res = await fetch(`/kits/${kitId}/itens`);
-    if (!res.ok) throw new Error(`Erro HTTP: ${res.status}`);
-    const data = await res.json();
-
-    const tbody = qs('#tabelaKitItens tbody');
-    if (!tbody) return;
-
-    tbody.innerHTML = '';
-    (data || []).forEach(it => {
-      const tr = document.createElement('tr');
-      tr.innerHTML = `
-        <td>${it.item_id}</td>
-        <td>${it.insumo_nome}</td>
-        <td>${it.quantidade}</td>
-        <td>${it.unidade}</td>
-        <td>
-          <button class="btn-secondary" onclick="removerItemKit(${it.item_id})">Remover</button>
-        </td>
-      `;
-      tbody.appendChild(tr);
-    });
-
-  } catch (err) {
-    console.error('Erro ao carregar itens do kit:', err);
-    alert('Erro ao carregar itens do kit.');
-  }
+  // os itens vêm junto com os kits; recarregar os kits já redesenha os itens
+  await carregarKits();
 }
 
 async function removerItemKit(itemId) {
@@ -595,7 +957,7 @@ if (kitSelect) {
   kitSelect.addEventListener('change', () => {
     const tbody = qs('#tabelaKitItens tbody');
     if (tbody) tbody.innerHTML = '';
-    if (kitSelect.value) carregarItensDoKit();
+    if (kitSelect.value) renderizarItensDoKit(kitSelect.value);
   });
 }
 
@@ -604,6 +966,7 @@ if (kitSelect) {
 // ============================
 document.addEventListener('DOMContentLoaded', () => {
   carregarDashboard();
+  conectarEventos();
 });
 
 // =========================
@@ -0,0 +1,176 @@
+# manage.py
+"""
+Comandos de manutenção (rodar fora do servidor web).
+
+    python manage.py migrar [--dry-run] [--ate N] [--status]
+    python manage.py reconciliar-estoque [--corrigir]
+    python manage.py importar-familias ARQUIVO [--formato csv|jsonl] [--lote N]
+    python manage.py reconstruir-estatisticas [--de AAAA-MM] [--ate AAAA-MM]
+    python manage.py otimizar-imagens [--lado N]
+    python manage.py diario [--drenar]
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+import database
+import diario
+import estaticos
+import importacao
+import migrador
+
+
+def cmd_migrar(args):
+    if args.status:
+        aplicadas = migrador.versoes_aplicadas()
+        for versao, nome in migrador.migracoes_disponiveis():
+            print(f"{'✓' if versao in aplicadas else ' '} {nome}")
+        return 1 if migrador.pendentes() else 0
+
+    if not migrador.pendentes():
+        print("✅ Nenhuma migração pendente.")
+        return 0
+    aplicadas = migrador.migrar(dry_run=args.dry_run, ate=args.ate)
+    if args.dry_run:
+        print("(dry-run: nada foi gravado)")
+    else:
+        print(f"✅ {len(aplicadas)} migração(ões) aplicada(s).")
+    return 0
+
+
+def cmd_reconciliar_estoque(args):
+    r = database.reconciliar_saldo_estoque(corrigir=args.corrigir)
+    print(f"Entradas:            {r['total_entradas']}")
+    print(f"Saídas:              {r['total_saidas']}")
+    print(f"Saldo calculado:     {r['saldo_calculado']}")
+    print(f"Saldo materializado: {r['saldo_materializado']}")
+
+    if r["divergencia"] == 0:
+        print("✅ Sem divergência.")
+        return 0
+
+    if r["saldo_materializado"] is None:
+        print("⚠️  Saldo materializado inexistente.")
+    else:
+        print(f"⚠️  Divergência: {r['divergencia']:+d}")
+    if r["corrigido"]:
+        print("✅ Saldo materializado corrigido.")
+        return 0
+    print("Use --corrigir para gravar o saldo calculado.")
+    return 1
+
+
+def cmd_importar_familias(args):
+    formato = args.formato or importacao.detectar_formato(args.arquivo)
+    with open(args.arquivo, "rb") as f:
+        resumo = importacao.importar_familias(
+            importacao.ler_registros(f, formato),
+            tamanho_lote=args.lote
+        )
+
+    for falha in resumo["falhas"]:
+        print(f"linha {falha['linha']}: {falha['status']} - {falha['erro']}"
+              + (f" (CPF {falha['cpf']})" if falha["cpf"] else ""))
+    print(f"Inseridas: {resumo['inseridas']}  Duplicadas: {resumo['duplicadas']}  "
+          f"Inválidas: {resumo['invalidas']}  Erros: {resumo['erros']}")
+    return 1 if resumo["erros"] else 0
+
+
+def _mes(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"mês inválido: {valor} (use AAAA-MM)")
+
+
+def cmd_reconstruir_estatisticas(args):
+    meses = database.reconstruir_estatisticas(args.de, args.ate, saida=print)
+    print(f"✅ {meses} mês(es) recalculado(s).")
+    return 0
+
+
+def cmd_otimizar_imagens(args):
+    try:
+        gravados = estaticos.gerar_variantes(args.lado)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {gravados} variante(s) gravada(s) em static/imagens/{estaticos.VARIANTES}/.")
+    return 0
+
+
+def cmd_diario(args):
+    d = diario.diario
+    if args.drenar:
+        total = 0
+        while True:
+            processadas, falhou = d.drenar()
+            total += processadas
+            if falhou:
+                print(f"⚠️  {total} escrita(s) drenada(s); o banco falhou, o resto fica pendente.")
+                break
+            if not processadas:
+                print(f"✅ {total} escrita(s) drenada(s).")
+                break
+
+    s = d.status()
+    print(f"Modo: {s['modo']}  ({d.caminho})")
+    print(f"Pendentes: {s['pendente']}  Aplicadas: {s['aplicada']}  Rejeitadas: {s['rejeitada']}")
+    if s["pendente_mais_antiga"] is not None:
+        print(f"Pendente mais antiga: há {s['pendente_mais_antiga']:.0f}s")
+    for r in s["rejeitadas"]:
+        print(f"  {r['criado_em']} {r['tipo']} {r['chave']}: {r['erro']}  {r['dados']}")
+    return 1 if s["pendente"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do sistema de cestas básicas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("migrar", help="Aplica as migrações pendentes (migrations/)")
+    p.add_argument("--dry-run", action="store_true",
+                   help="Mostra o que seria executado sem alterar o banco")
+    p.add_argument("--ate", type=int, metavar="N", help="Para na versão N")
+    p.add_argument("--status", action="store_true", help="Lista migrações aplicadas/pendentes")
+    p.set_defaults(func=cmd_migrar)
+
+    p = sub.add_parser("reconciliar-estoque",
+                       help="Recalcula o saldo de estoque do zero e aponta divergências")
+    p.add_argument("--corrigir", action="store_true",
+                   help="Grava o saldo recalculado quando houver divergência")
+    p.set_defaults(func=cmd_reconciliar_estoque)
+
+    p = sub.add_parser("importar-familias",
+                       help="Importa famílias de um CSV ou JSON Lines em lotes")
+    p.add_argument("arquivo")
+    p.add_argument("--formato", choices=importacao.FORMATOS)
+    p.add_argument("--lote", type=int, default=importacao.TAMANHO_LOTE_PADRAO,
+                   help="Famílias por transação (padrão: %(default)s)")
+    p.set_defaults(func=cmd_importar_familias)
+
+    p = sub.add_parser("reconstruir-estatisticas",
+                       help="Recalcula os rollups de entregas por dia/mês a partir do histórico")
+    p.add_argument("--de", type=_mes, metavar="AAAA-MM", help="Primeiro mês (padrão: o mais antigo)")
+    p.add_argument("--ate", type=_mes, metavar="AAAA-MM", help="Último mês (padrão: o mais recente)")
+    p.set_defaults(func=cmd_reconstruir_estatisticas)
+
+    p = sub.add_parser("otimizar-imagens",
+                       help="Gera versões reduzidas e WebP das imagens de static/imagens (Pillow)")
+    p.add_argument("--lado", type=int, default=256,
+                   help="Maior lado das versões reduzidas, em pixels (padrão: %(default)s)")
+    p.set_defaults(func=cmd_otimizar_imagens)
+
+    p = sub.add_parser("diario",
+                       help="Mostra as escritas do diário local (banco fora do ar) e as rejeitadas")
+    p.add_argument("--drenar", action="store_true",
+                   help="Leva as pendentes ao MySQL agora")
+    p.set_defaults(func=cmd_diario)
+
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
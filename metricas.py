@@ -0,0 +1,192 @@
+# metricas.py
+"""
+Métricas por endpoint (latência, consultas, tempo de banco, linhas lidas,
+espera por conexão) no formato texto do Prometheus, e log de consultas lentas.
+
+get_db_cursor chama registrar_checkout/registrar_consulta/registrar_linhas;
+o app chama iniciar_requisicao/finalizar_requisicao em before/after_request.
+Fora de uma requisição (CLI, threads de fundo) só os totais globais contam.
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_requisicao = contextvars.ContextVar("metricas_requisicao", default=None)
+_lock = threading.Lock()
+
+
+class _Histograma:
+    __slots__ = ("buckets", "contagens", "soma", "total")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+_http_total = defaultdict(int)  # (endpoint, metodo, status) -> n
+_latencia = defaultdict(lambda: _Histograma(BUCKETS_LATENCIA))
+_consultas_por_req = defaultdict(lambda: _Histograma(BUCKETS_CONSULTAS))
+_db = defaultdict(lambda: {"consultas": 0, "tempo": 0.0, "linhas": 0, "checkout": 0.0})
+_consultas_lentas = [0]
+
+
+# =========================
+# FINGERPRINT DE SQL
+# =========================
+def fingerprint(sql):
+    """SQL normalizado: literais e marcadores viram ?, listas IN (...) colapsam"""
+    sql = re.sub(r"--[^\n]*|/\*.*?\*/", " ", sql, flags=re.S)
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"%s|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?+)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+# =========================
+# COLETA
+# =========================
+def iniciar_requisicao():
+    _requisicao.set({"inicio": time.perf_counter(), "consultas": 0, "tempo": 0.0,
+                     "linhas": 0, "checkout": 0.0})
+
+
+def requisicao_atual():
+    return _requisicao.get()
+
+
+def registrar_checkout(duracao):
+    req = _requisicao.get()
+    if req is not None:
+        req["checkout"] += duracao
+
+
+def registrar_consulta(sql, duracao):
+    req = _requisicao.get()
+    if req is not None:
+        req["consultas"] += 1
+        req["tempo"] += duracao
+
+    if duracao * 1000 >= SLOW_QUERY_MS:
+        fp = fingerprint(sql if isinstance(sql, str) else sql.decode("utf-8", "replace"))
+        digest = hashlib.md5(fp.encode("utf-8")).hexdigest()[:12]
+        with _lock:
+            _consultas_lentas[0] += 1
+        logging.warning(f"🐢 Consulta lenta ({duracao * 1000:.0f} ms) [{digest}] {fp}")
+
+
+def registrar_linhas(n):
+    req = _requisicao.get()
+    if req is not None:
+        req["linhas"] += n
+
+
+def finalizar_requisicao(endpoint, metodo, status):
+    """Fecha a contagem da requisição e devolve o resumo (para o header Server-Timing)"""
+    req = _requisicao.get()
+    if req is None:
+        return None
+    _requisicao.set(None)
+    duracao = time.perf_counter() - req["inicio"]
+    endpoint = endpoint or "desconhecido"
+
+    with _lock:
+        _http_total[(endpoint, metodo, str(status))] += 1
+        _latencia[endpoint].observar(duracao)
+        _consultas_por_req[endpoint].observar(req["consultas"])
+        db = _db[endpoint]
+        db["consultas"] += req["consultas"]
+        db["tempo"] += req["tempo"]
+        db["linhas"] += req["linhas"]
+        db["checkout"] += req["checkout"]
+
+    return {**req, "duracao": duracao}
+
+
+# =========================
+# EXPOSIÇÃO (Prometheus)
+# =========================
+def _rotulos(**kw):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in kw.items()) + "}"
+
+
+def _histograma_linhas(nome, endpoint, h):
+    acumulado = 0
+    for limite, n in zip(h.buckets, h.contagens):
+        acumulado += n
+        yield f"{nome}_bucket{_rotulos(endpoint=endpoint, le=limite)} {acumulado}"
+    yield f"{nome}_bucket{_rotulos(endpoint=endpoint, le='+Inf')} {h.total}"
+    yield f"{nome}_sum{_rotulos(endpoint=endpoint)} {h.soma}"
+    yield f"{nome}_count{_rotulos(endpoint=endpoint)} {h.total}"
+
+
+def render_prometheus(pool_stats=None, diario=None):
+    linhas = []
+    with _lock:
+        linhas.append("# TYPE cestas_http_requests_total counter")
+        for (endpoint, metodo, status), n in sorted(_http_total.items()):
+            linhas.append(f"cestas_http_requests_total"
+                          f"{_rotulos(endpoint=endpoint, method=metodo, status=status)} {n}")
+
+        linhas.append("# TYPE cestas_http_request_duration_seconds histogram")
+        for endpoint, h in sorted(_latencia.items()):
+            linhas.extend(_histograma_linhas("cestas_http_request_duration_seconds", endpoint, h))
+
+        linhas.append("# TYPE cestas_db_queries_per_request histogram")
+        for endpoint, h in sorted(_consultas_por_req.items()):
+            linhas.extend(_histograma_linhas("cestas_db_queries_per_request", endpoint, h))
+
+        for chave, nome, tipo in (
+            ("consultas", "cestas_db_queries_total", "counter"),
+            ("tempo", "cestas_db_query_seconds_total", "counter"),
+            ("linhas", "cestas_db_rows_fetched_total", "counter"),
+            ("checkout", "cestas_db_connection_acquire_seconds_total", "counter"),
+        ):
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for endpoint, db in sorted(_db.items()):
+                linhas.append(f"{nome}{_rotulos(endpoint=endpoint)} {db[chave]}")
+
+        linhas.append("# TYPE cestas_db_slow_queries_total counter")
+        linhas.append(f"cestas_db_slow_queries_total {_consultas_lentas[0]}")
+
+    if pool_stats:
+        for chave in ("checkouts", "waits", "created", "discarded"):
+            linhas.append(f"# TYPE cestas_db_pool_{chave}_total counter")
+            linhas.append(f"cestas_db_pool_{chave}_total {pool_stats[chave]}")
+        for chave in ("open", "idle", "in_use", "max_size"):
+            linhas.append(f"# TYPE cestas_db_pool_{chave} gauge")
+            linhas.append(f"cestas_db_pool_{chave} {pool_stats[chave]}")
+        replicas = pool_stats.get("replicas") or []
+        if replicas:
+            linhas.append("# TYPE cestas_db_replica_healthy gauge")
+            linhas.extend(f"cestas_db_replica_healthy{_rotulos(replica=r['nome'])} {int(r['saudavel'])}"
+                          for r in replicas)
+            linhas.append("# TYPE cestas_db_replica_lag_seconds gauge")
+            linhas.extend(f"cestas_db_replica_lag_seconds{_rotulos(replica=r['nome'])} {r['lag']}"
+                          for r in replicas if r["lag"] is not None)
+
+    if diario:
+        linhas.append("# TYPE cestas_diario_escritas gauge")
+        linhas.extend(f"cestas_diario_escritas{_rotulos(status=status)} {diario[status]}"
+                      for status in ("pendente", "rejeitada"))
+        linhas.append("# TYPE cestas_diario_pendente_idade_seconds gauge")
+        linhas.append(f"cestas_diario_pendente_idade_seconds {diario['pendente_mais_antiga'] or 0}")
+
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,271 @@
+# migrador.py
+"""
+Migrações versionadas do schema (arquivos em migrations/NNNN_nome.py).
+
+Cada arquivo define DESCRICAO e aplicar(m), onde m é o Migrador abaixo. As
+migrações são aplicadas em ordem e cada versão aplicada fica registrada em
+schema_version. O DDL do MySQL não é transacional: se uma migração cair no
+meio, ela roda de novo por inteiro na próxima vez, então use os helpers
+idempotentes (garantir_coluna, garantir_indice, CREATE ... IF NOT EXISTS).
+
+Para não travar tabelas grandes (movimento_cestas, familias_cestas):
+- ALTERs pedem LOCK=NONE (DDL online; leituras e escritas continuam)
+- lock_wait_timeout curto: um ALTER que não consegue o metadata lock desiste
+  em vez de enfileirar todas as consultas da aplicação atrás dele
+- backfills rodam em lotes por faixa de id, cada lote na sua transação
+
+    python manage.py migrar [--dry-run] [--ate N]
+    python manage.py migrar --status
+"""
+import importlib
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+import pymysql
+
+import database
+
+PASTA = Path(__file__).resolve().parent / "migrations"
+_ARQUIVO_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+MIGRACAO_LOCK_WAIT = int(os.getenv("MIGRACAO_LOCK_WAIT", "5"))        # segundos
+MIGRACAO_LOTE = int(os.getenv("MIGRACAO_LOTE", "5000"))               # linhas por lote
+MIGRACAO_PAUSA_LOTE = float(os.getenv("MIGRACAO_PAUSA_LOTE", "0"))   # segundos entre lotes
+
+# erros do MySQL quando o ALTER não pode ser feito online com LOCK=NONE
+_ERROS_SEM_DDL_ONLINE = {1845, 1846}
+
+
+class SchemaDesatualizado(RuntimeError):
+    pass
+
+
+class MigracaoEmAndamento(RuntimeError):
+    pass
+
+
+# =========================
+# DESCOBERTA / VERSÃO
+# =========================
+def migracoes_disponiveis():
+    """[(versao, nome_do_modulo)] em ordem, sem importar os arquivos"""
+    encontradas = []
+    for arquivo in PASTA.iterdir():
+        m = _ARQUIVO_RE.match(arquivo.name)
+        if m:
+            encontradas.append((int(m.group(1)), arquivo.stem))
+    encontradas.sort()
+    versoes = [v for v, _ in encontradas]
+    if len(versoes) != len(set(versoes)):
+        raise RuntimeError(f"Versões de migração repetidas em {PASTA}")
+    return encontradas
+
+
+def versoes_aplicadas():
+    try:
+        with database.get_db_cursor() as cursor:
+            cursor.execute("SELECT versao FROM schema_version")
+            return {row["versao"] for row in cursor.fetchall()}
+    except pymysql.err.ProgrammingError as e:
+        if e.args and e.args[0] == 1146:  # tabela não existe
+            return set()
+        raise
+
+
+def pendentes():
+    aplicadas = versoes_aplicadas()
+    return [(v, nome) for v, nome in migracoes_disponiveis() if v not in aplicadas]
+
+
+def verificar_schema():
+    """
+    Checagem barata para a subida do servidor (uma consulta, sem DDL).
+    Levanta SchemaDesatualizado se houver migração pendente.
+    """
+    faltando = pendentes()
+    if faltando:
+        raise SchemaDesatualizado(
+            f"Migrações pendentes: {', '.join(nome for _, nome in faltando)}. "
+            f"Rode: python manage.py migrar"
+        )
+    disponiveis = migracoes_disponiveis()
+    return disponiveis[-1][0] if disponiveis else 0
+
+
+# =========================
+# MIGRADOR
+# =========================
+class Migrador:
+    """
+    Conexão dedicada (autocommit) usada pelas migrações. Em dry-run, as
+    consultas de leitura rodam normalmente e os comandos só são impressos.
+    """
+
+    def __init__(self, dry_run=False, saida=print):
+        self.dry_run = dry_run
+        self.saida = saida
+        self.conn = None
+
+    # ---------- conexão ----------
+    def __enter__(self):
+        self.conn = database.get_db_connection()
+        self.conn.autocommit(True)
+        with self.conn.cursor() as cursor:
+            cursor.execute("SET SESSION lock_wait_timeout = %s", [MIGRACAO_LOCK_WAIT])
+            # um migrador por vez (dois deploys simultâneos, por exemplo)
+            cursor.execute("SELECT GET_LOCK('cestas_migracoes', 0) AS ok")
+            if not cursor.fetchone()["ok"]:
+                self.conn.close()
+                raise MigracaoEmAndamento("Outra migração está rodando neste banco.")
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK('cestas_migracoes')")
+        finally:
+            self.conn.close()
+
+    # ---------- API para os arquivos de migração ----------
+    def consultar(self, sql, params=None):
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def executar(self, sql, params=None):
+        """Executa (ou, em dry-run, só imprime) um comando. Retorna as linhas afetadas."""
+        resumo = " ".join(sql.split())
+        if len(resumo) > 120:
+            resumo = resumo[:117] + "..."
+        if self.dry_run:
+            self.saida(f"    [dry-run] {resumo}")
+            return 0
+        inicio = time.perf_counter()
+        with self.conn.cursor() as cursor:
+            afetadas = cursor.execute(sql, params)
+        self.saida(f"    {(time.perf_counter() - inicio) * 1000:9.1f} ms  {resumo}")
+        return afetadas
+
+    def tabela_existe(self, tabela):
+        return bool(self.consultar("""
+            SELECT 1 FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, [tabela]))
+
+    def coluna_existe(self, tabela, coluna):
+        return bool(self.consultar("""
+            SELECT 1 FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, [tabela, coluna]))
+
+    def indice_existe(self, tabela, indice):
+        return bool(self.consultar("""
+            SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+            LIMIT 1
+        """, [tabela, indice]))
+
+    def alterar_online(self, tabela, alteracao):
+        """
+        ALTER TABLE com LOCK=NONE. Se o servidor não suportar essa alteração
+        online, avisa e faz o ALTER comum (que bloqueia escritas enquanto roda).
+        """
+        try:
+            return self.executar(f"ALTER TABLE {tabela} {alteracao}, LOCK=NONE")
+        except pymysql.MySQLError as e:
+            if not (e.args and e.args[0] in _ERROS_SEM_DDL_ONLINE):
+                raise
+            self.saida(f"    ⚠️  {tabela}: alteração não suportada online ({e.args[1]}); "
+                       f"rodando com bloqueio")
+            return self.executar(f"ALTER TABLE {tabela} {alteracao}")
+
+    def garantir_coluna(self, tabela, coluna, definicao):
+        if not self.coluna_existe(tabela, coluna):
+            self.alterar_online(tabela, f"ADD COLUMN {coluna} {definicao}")
+
+    def garantir_indice(self, tabela, indice, definicao):
+        """definicao ex.: 'UNIQUE KEY uk_x (col)' ou 'INDEX idx_x (col)'"""
+        if not self.indice_existe(tabela, indice):
+            self.alterar_online(tabela, f"ADD {definicao}")
+
+    def atualizar_em_lotes(self, tabela, set_sql, where_sql="1=1", params=(), lote=None,
+                           pausa=None):
+        """
+        UPDATE {tabela} SET {set_sql} WHERE {where_sql}, em faixas de id de
+        `lote` linhas, cada faixa na sua transação (autocommit). Os locks de
+        linha duram só um lote, então a aplicação continua escrevendo.
+        """
+        lote = lote or MIGRACAO_LOTE
+        pausa = MIGRACAO_PAUSA_LOTE if pausa is None else pausa
+        if self.dry_run and not self.tabela_existe(tabela):
+            # criada por uma migração anterior que, em dry-run, só foi impressa
+            self.saida(f"    [dry-run] UPDATE {tabela} SET {' '.join(set_sql.split())} "
+                       f"WHERE {where_sql}  (todas as linhas; {tabela} ainda não existe)")
+            return 0
+        faixa = self.consultar(f"SELECT MIN(id) AS a, MAX(id) AS b FROM {tabela}")[0]
+        if faixa["a"] is None:
+            return 0
+        sql = f"UPDATE {tabela} SET {set_sql} WHERE id BETWEEN %s AND %s AND ({where_sql})"
+        total_lotes = (faixa["b"] - faixa["a"]) // lote + 1
+        if self.dry_run:
+            self.saida(f"    [dry-run] {' '.join(sql.split())}  ({total_lotes} lotes de {lote})")
+            return 0
+
+        inicio = time.perf_counter()
+        afetadas = 0
+        with self.conn.cursor() as cursor:
+            for n, de in enumerate(range(faixa["a"], faixa["b"] + 1, lote), start=1):
+                afetadas += cursor.execute(sql, [*params, de, de + lote - 1])
+                if n % 50 == 0 or n == total_lotes:
+                    self.saida(f"    {tabela}: lote {n}/{total_lotes}, {afetadas} linhas, "
+                               f"{time.perf_counter() - inicio:.1f}s")
+                if pausa:
+                    time.sleep(pausa)
+        return afetadas
+
+    # ---------- motor ----------
+    def _garantir_tabela_versao(self):
+        if self.tabela_existe("schema_version"):
+            self.garantir_coluna("schema_version", "nome", "VARCHAR(255) NULL")
+            self.garantir_coluna("schema_version", "duracao_ms", "INT NULL")
+            return
+        self.executar("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                versao INT PRIMARY KEY,
+                nome VARCHAR(255) NULL,
+                duracao_ms INT NULL,
+                aplicada_em DATETIME DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+
+    def migrar(self, ate=None):
+        """Aplica as migrações pendentes (até a versão `ate`). Retorna as versões aplicadas."""
+        self._garantir_tabela_versao()
+        aplicadas = []
+        for versao, nome in pendentes():
+            if ate is not None and versao > ate:
+                break
+            modulo = importlib.import_module(f"migrations.{nome}")
+            self.saida(f"→ {nome}: {modulo.DESCRICAO}")
+            inicio = time.perf_counter()
+            modulo.aplicar(self)
+            duracao_ms = int((time.perf_counter() - inicio) * 1000)
+            if not self.dry_run:
+                self.executar(
+                    "INSERT INTO schema_version (versao, nome, duracao_ms) VALUES (%s, %s, %s)",
+                    [versao, nome, duracao_ms]
+                )
+            self.saida(f"  ✓ {nome} em {duracao_ms / 1000:.1f}s")
+            aplicadas.append(versao)
+        return aplicadas
+
+
+def migrar(dry_run=False, ate=None, saida=print):
+    with Migrador(dry_run=dry_run, saida=saida) as m:
+        aplicadas = m.migrar(ate=ate)
+    if aplicadas:
+        logging.info(f"✅ Migrações aplicadas: {aplicadas}")
+    return aplicadas
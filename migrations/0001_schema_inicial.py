@@ -0,0 +1,166 @@
+# migrations/0001_schema_inicial.py
+"""
+Schema até a criação das migrações versionadas (o que o antigo init_db fazia).
+Bancos que já passaram pelo init_db têm a versão 1 registrada e pulam esta.
+"""
+import pymysql
+
+DESCRICAO = "Tabelas base, colunas estruturadas da família, índices e saldo de estoque"
+
+CREATE_FAMILIAS = """
+CREATE TABLE IF NOT EXISTS familias_cestas (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    numero_pessoas INT NOT NULL DEFAULT 1,
+    numero_filhos INT NOT NULL DEFAULT 0,
+    renda_mensal_familia DECIMAL(10,2) NULL,
+    beneficios_sociais TEXT NULL,
+    condicao_moradia ENUM('própria', 'alugada', 'cedida', 'invasão') NULL,
+    tipo_moradia ENUM('casa', 'apartamento', 'barraco', 'outro') NULL,
+    observacoes TEXT NULL,
+    necessidades_especificas TEXT NULL,
+    responsavel_nome VARCHAR(255) NULL,
+    responsavel_cpf VARCHAR(14) NULL,
+    responsavel_nascimento DATE NULL,
+    responsavel_genero VARCHAR(20) NULL,
+    endereco TEXT NULL,
+    telefone VARCHAR(30) NULL,
+    data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ativo BOOLEAN DEFAULT TRUE,
+    INDEX idx_data_cadastro (data_cadastro),
+    UNIQUE KEY uk_familia_cpf (responsavel_cpf),
+    INDEX idx_familia_nome (responsavel_nome)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_MEMBROS = """
+CREATE TABLE IF NOT EXISTS familia_membros (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    id_familia INT NOT NULL,
+    nome_completo VARCHAR(255) NOT NULL,
+    idade INT NULL,
+    escolaridade VARCHAR(100) NULL,
+    estuda BOOLEAN DEFAULT FALSE,
+    parentesco ENUM('cônjuge', 'filho', 'pai', 'mãe', 'avo', 'outro') NULL,
+    FOREIGN KEY (id_familia) REFERENCES familias_cestas(id),
+    INDEX idx_familia (id_familia)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_MOVIMENTO = """
+CREATE TABLE IF NOT EXISTS movimento_cestas (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    id_familia INT NOT NULL,
+    id_membro_entregue INT NULL,
+    id_visitante_entregue INT NULL,
+    data_entrega DATE NOT NULL,
+    quantidade_cestas INT DEFAULT 1,
+    observacoes_entrega TEXT NULL,
+    id_usuario_registro INT NOT NULL,
+    data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (id_familia) REFERENCES familias_cestas(id),
+    INDEX idx_familia_data (id_familia, data_entrega),
+    INDEX idx_data_entrega (data_entrega)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_ESTOQUE = """
+CREATE TABLE IF NOT EXISTS estoque_cestas (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    data_entrada DATE NOT NULL,
+    quantidade_entrada INT NOT NULL,
+    fornecedor VARCHAR(255) NULL,
+    observacoes TEXT NULL,
+    data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_data_entrada (data_entrada)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# saldo materializado (linha única, id = 1), atualizado na mesma transação
+# de cada entrada/entrega; ver reconciliar_saldo_estoque()
+CREATE_SALDO = """
+CREATE TABLE IF NOT EXISTS estoque_saldo (
+    id TINYINT PRIMARY KEY,
+    saldo INT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# =========================
+# INSUMOS / KITS
+# =========================
+CREATE_INSUMOS = """
+CREATE TABLE IF NOT EXISTS cesta_insumos (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    nome VARCHAR(255) NOT NULL,
+    unidade VARCHAR(20) NOT NULL DEFAULT 'un',
+    ativo TINYINT(1) NOT NULL DEFAULT 1,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_insumo_nome (nome)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_KITS = """
+CREATE TABLE IF NOT EXISTS cesta_kits (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    nome VARCHAR(255) NOT NULL,
+    descricao VARCHAR(255) NULL,
+    ativo TINYINT(1) NOT NULL DEFAULT 1,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_kit_nome (nome)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+CREATE_KIT_ITENS = """
+CREATE TABLE IF NOT EXISTS cesta_kit_itens (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    kit_id INT NOT NULL,
+    insumo_id INT NOT NULL,
+    quantidade DECIMAL(10,2) NOT NULL DEFAULT 1,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_kit_insumo (kit_id, insumo_id),
+    CONSTRAINT fk_kit_itens_kit FOREIGN KEY (kit_id) REFERENCES cesta_kits(id)
+        ON DELETE CASCADE,
+    CONSTRAINT fk_kit_itens_insumo FOREIGN KEY (insumo_id) REFERENCES cesta_insumos(id)
+        ON DELETE RESTRICT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+def aplicar(m):
+    for ddl in (CREATE_FAMILIAS, CREATE_MEMBROS, CREATE_MOVIMENTO, CREATE_ESTOQUE, CREATE_SALDO,
+                CREATE_INSUMOS, CREATE_KITS, CREATE_KIT_ITENS):
+        m.executar(ddl)
+
+    # bancos criados antes das colunas estruturadas do responsável
+    m.garantir_coluna("familias_cestas", "responsavel_nome", "VARCHAR(255) NULL")
+    m.garantir_coluna("familias_cestas", "responsavel_cpf", "VARCHAR(14) NULL")
+    m.garantir_coluna("familias_cestas", "responsavel_nascimento", "DATE NULL")
+    m.garantir_coluna("familias_cestas", "responsavel_genero", "VARCHAR(20) NULL")
+    m.garantir_coluna("familias_cestas", "endereco", "TEXT NULL")
+    m.garantir_coluna("familias_cestas", "telefone", "VARCHAR(30) NULL")
+    m.garantir_indice("familias_cestas", "uk_familia_cpf",
+                      "UNIQUE KEY uk_familia_cpf (responsavel_cpf)")
+    m.garantir_indice("familias_cestas", "idx_familia_nome",
+                      "INDEX idx_familia_nome (responsavel_nome)")
+    m.garantir_indice("movimento_cestas", "idx_data_entrega",
+                      "INDEX idx_data_entrega (data_entrega)")
+    m.garantir_indice("estoque_cestas", "idx_data_entrada",
+                      "INDEX idx_data_entrada (data_entrada)")
+
+    # índices do login (auth.login busca por nome OU email). A tabela usuarios
+    # é criada fora daqui; se não existir, ou se o tipo da coluna não aceitar
+    # índice, só avisa e segue
+    if m.tabela_existe("usuarios"):
+        for indice, coluna in (("idx_usuarios_nome", "nome"), ("idx_usuarios_email", "email")):
+            try:
+                m.garantir_indice("usuarios", indice, f"INDEX {indice} ({coluna})")
+            except pymysql.MySQLError as e:
+                m.saida(f"    ⚠️  Não foi possível criar o índice usuarios.{indice}: {e}")
+
+    # primeira vez: saldo inicial calculado a partir do histórico
+    m.executar("""
+        INSERT IGNORE INTO estoque_saldo (id, saldo)
+        SELECT 1,
+            (SELECT COALESCE(SUM(quantidade_entrada), 0) FROM estoque_cestas)
+          - (SELECT COALESCE(SUM(quantidade_cestas), 0) FROM movimento_cestas)
+    """)
@@ -0,0 +1,28 @@
+# migrations/0002_backfill_familias_estruturadas.py
+"""
+Termina de copiar os dados do formato antigo (observacoes) para as colunas
+estruturadas. Antes isso rodava aos poucos a cada subida do servidor; aqui vai
+até o fim, em lotes pequenos, cada um na sua transação.
+"""
+import database
+
+DESCRICAO = "Backfill das colunas estruturadas do responsável (famílias antigas)"
+
+
+def aplicar(m):
+    if not m.tabela_existe("familias_cestas"):
+        return
+    if m.coluna_existe("familias_cestas", "responsavel_nome"):
+        faltando = m.consultar(
+            "SELECT COUNT(*) AS n FROM familias_cestas WHERE responsavel_nome IS NULL"
+        )[0]["n"]
+    else:
+        # só em dry-run: a 0001 apenas imprimiu o ADD COLUMN, então todas seriam preenchidas
+        faltando = m.consultar("SELECT COUNT(*) AS n FROM familias_cestas")[0]["n"]
+    if m.dry_run:
+        m.saida(f"    [dry-run] {faltando} famílias a preencher em lotes de "
+                f"{database.FAMILIAS_BACKFILL_LOTE}")
+        return
+    if faltando:
+        total = database.backfill_familias_estruturadas()
+        m.saida(f"    {total} famílias preenchidas")
@@ -0,0 +1,41 @@
+# migrations/0003_estoque_insumos.py
+"""
+Estoque por insumo: saldo materializado (insumo_estoque) + histórico de
+movimentos (insumo_movimentos). Entregas passam a poder indicar o kit
+(movimento_cestas.kit_id), cuja composição é baixada do estoque de insumos.
+"""
+DESCRICAO = "Estoque e movimentos por insumo; kit da entrega"
+
+CREATE_INSUMO_ESTOQUE = """
+CREATE TABLE IF NOT EXISTS insumo_estoque (
+    insumo_id INT PRIMARY KEY,
+    saldo DECIMAL(12,2) NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT fk_insumo_estoque_insumo FOREIGN KEY (insumo_id) REFERENCES cesta_insumos(id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# quantidade com sinal: positiva na entrada, negativa na saída
+CREATE_INSUMO_MOVIMENTOS = """
+CREATE TABLE IF NOT EXISTS insumo_movimentos (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    insumo_id INT NOT NULL,
+    tipo ENUM('entrada', 'saida') NOT NULL,
+    quantidade DECIMAL(12,2) NOT NULL,
+    kit_id INT NULL,
+    id_movimento_cesta INT NULL,
+    observacoes VARCHAR(255) NULL,
+    data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_insumo_mov_insumo FOREIGN KEY (insumo_id) REFERENCES cesta_insumos(id),
+    INDEX idx_insumo_mov (insumo_id, id),
+    INDEX idx_insumo_mov_entrega (id_movimento_cesta)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+def aplicar(m):
+    m.executar(CREATE_INSUMO_ESTOQUE)
+    m.executar(CREATE_INSUMO_MOVIMENTOS)
+    # todo insumo tem a sua linha de saldo (criar_insumo já cria junto)
+    m.executar("INSERT IGNORE INTO insumo_estoque (insumo_id) SELECT id FROM cesta_insumos")
+    m.garantir_coluna("movimento_cestas", "kit_id", "INT NULL")
@@ -0,0 +1,48 @@
+# migrations/0004_estatisticas_entregas.py
+"""
+Rollups de entregas por dia e por mês (cestas, entregas, famílias e pessoas
+atendidas). Mantidos por salvar_entrega/salvar_entregas_lote na mesma
+transação da entrega; aqui são criados e preenchidos com o histórico.
+"""
+import database
+
+DESCRICAO = "Estatísticas pré-agregadas de entregas por dia e por mês"
+
+_COLUNAS = """
+    cestas INT NOT NULL DEFAULT 0,
+    entregas INT NOT NULL DEFAULT 0,
+    familias INT NOT NULL DEFAULT 0,
+    pessoas INT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+"""
+
+CREATE_DIA = f"""
+CREATE TABLE IF NOT EXISTS estatisticas_entregas_dia (
+    dia DATE PRIMARY KEY,{_COLUNAS}
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# mes = primeiro dia do mês
+CREATE_MES = f"""
+CREATE TABLE IF NOT EXISTS estatisticas_entregas_mes (
+    mes DATE PRIMARY KEY,{_COLUNAS}
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+def aplicar(m):
+    m.executar(CREATE_DIA)
+    m.executar(CREATE_MES)
+    if m.dry_run and not m.tabela_existe("movimento_cestas"):
+        # banco vazio: a 0001 apenas imprimiu o CREATE TABLE
+        m.saida("    [dry-run] 0 meses de histórico a agregar (movimento_cestas ainda não existe)")
+        return
+    meses = m.consultar("""
+        SELECT COUNT(DISTINCT DATE_FORMAT(data_entrega, '%Y-%m')) AS n FROM movimento_cestas
+    """)[0]["n"]
+    if m.dry_run:
+        m.saida(f"    [dry-run] {meses} meses de histórico a agregar (um por transação)")
+        return
+    if meses:
+        total = database.reconstruir_estatisticas(saida=m.saida)
+        m.saida(f"    {total} meses agregados")
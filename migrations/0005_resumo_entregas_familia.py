@@ -0,0 +1,16 @@
+# migrations/0005_resumo_entregas_familia.py
+"""
+Última entrega e total de cestas por família, mantidos em familias_cestas pela
+transação de cada entrega: a listagem mostra os dois sem consultar
+movimento_cestas e o registro de entrega checa "já recebeu neste mês" sem
+varrer o histórico. O backfill usa idx_familia_data, em lotes por faixa de id.
+"""
+import database
+
+DESCRICAO = "familias_cestas.ultima_entrega / total_cestas"
+
+
+def aplicar(m):
+    m.garantir_coluna("familias_cestas", "ultima_entrega", "DATE NULL")
+    m.garantir_coluna("familias_cestas", "total_cestas", "INT NOT NULL DEFAULT 0")
+    m.atualizar_em_lotes("familias_cestas", database.SQL_RESUMO_ENTREGAS)
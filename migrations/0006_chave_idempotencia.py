@@ -0,0 +1,15 @@
+# migrations/0006_chave_idempotencia.py
+"""
+Chave de idempotência nas escritas que podem ser reenviadas (diário local,
+fila offline do navegador, retentativa depois de timeout): a chave única faz
+o reenvio de uma entrega ou entrada de estoque já gravada não gravar de novo.
+NULL nas linhas antigas (o índice único aceita vários NULL).
+"""
+DESCRICAO = "movimento_cestas / estoque_cestas.chave_idempotencia"
+
+
+def aplicar(m):
+    for tabela in ("movimento_cestas", "estoque_cestas"):
+        m.garantir_coluna(tabela, "chave_idempotencia", "VARCHAR(64) NULL")
+        m.garantir_indice(tabela, f"uk_{tabela}_chave",
+                          f"UNIQUE KEY uk_{tabela}_chave (chave_idempotencia)")
@@ -0,0 +1,15 @@
+# migrations/0007_familias_atualizado_em.py
+"""
+familias_cestas.atualizado_em, que o MySQL renova a cada alteração da linha:
+o índice de busca em memória (busca.py) de cada worker relê só as famílias
+alteradas desde a última sincronização, então nome, CPF, telefone e
+desativação chegam à busca mesmo quando mudam por outro processo.
+"""
+DESCRICAO = "familias_cestas.atualizado_em (sincronização do índice de busca)"
+
+
+def aplicar(m):
+    m.garantir_coluna("familias_cestas", "atualizado_em",
+                      "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    m.garantir_indice("familias_cestas", "idx_familia_atualizado_em",
+                      "INDEX idx_familia_atualizado_em (atualizado_em, id)")
@@ -0,0 +1,7 @@
+# migrations/__init__.py
+"""
+Migrações versionadas, aplicadas em ordem pelo migrador.py.
+
+Cada arquivo NNNN_nome.py define DESCRICAO e aplicar(m). Nunca altere uma
+migração já aplicada em produção: crie a próxima versão.
+"""
@@ -1,7 +1,13 @@
 # routes.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, abort, request, jsonify, send_from_directory, session
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import date, datetime, timedelta
+import hmac
 import logging
 import os
+import uuid
+
+import metricas
 
 # ==============================
 # CONFIG LOG
@@ -15,24 +21,60 @@ logger = logging.getLogger(__name__)
 print("✅ 1. Iniciando importação do banco...")
 
 from database import (
-    init_db,
-    get_dashboard_data,
+    fechar_pool,
+    get_dashboard_snapshot,
     salvar_familia,
     listar_familias,
+    listar_familias_por_ids,
+    detalhar_familias,
+    PAGINA_MAXIMA,
+    CPFDuplicado,
+    validar_familia,
+    CursorInvalido,
     salvar_entrega,
+    BancoIndisponivel,
+    chave_idempotencia,
+    KitIndisponivel,
+    EntregaDuplicada,
+    EntregaInvalida,
+    salvar_entregas_lote,
+    validar_entrega,
+    LOTE_ENTREGAS_MAXIMO,
     listar_entregas,
     registrar_entrada_estoque,
     get_saldo_estoque,
-    listar_movimentacoes_estoque,   # ✅ vírgula aqui é essencial
+    iter_movimentacoes_estoque,   # ✅ vírgula aqui é essencial
+
+    # ✅ EXPORTAÇÃO
+    COLUNAS_EXPORT_ENTREGAS, iter_export_entregas,
+    COLUNAS_EXPORT_FAMILIAS, iter_export_familias,
+    COLUNAS_EXPORT_MOVIMENTACOES, iter_export_movimentacoes,
 
     # ✅ INSUMOS / KITS
     criar_insumo, listar_insumos,
-    criar_kit, listar_kits,
-    adicionar_item_kit, listar_itens_do_kit, remover_item_kit
+    registrar_entrada_insumo, listar_estoque_insumos, listar_movimentos_insumo,
+    criar_kit, listar_kits, listar_kits_completos, kits_disponiveis,
+    adicionar_item_kit, listar_itens_do_kit, remover_item_kit,
+
+    # ✅ ESTATÍSTICAS
+    estatisticas_entregas, GRANULARIDADES_ESTATISTICAS,
+
+    # ✅ POOL / RÉPLICAS
+    get_pool_stats, marcar_ultima_escrita, ultima_escrita
 )
 
 print("✅ Banco importado!")
 
+from migrador import migrar, verificar_schema
+
+from importacao import detectar_formato, importar_familias, ler_registros
+import exportacao
+from estaticos import comprimir_resposta, estaticos
+from diario import diario
+from eventos import LimiteDeConexoes, difusor
+import serializacao
+from busca import indice_familias
+
 # ==============================
 # AUTENTICAÇÃO
 # ==============================
@@ -44,15 +86,84 @@ from utils_auth import login_required
 # ==============================
 app = Flask(__name__, template_folder='.')
 app.secret_key = os.getenv("SECRET_KEY", "segredo_muito_importante")
+# jsonify com orjson quando instalado (mesma saída do json da stdlib)
+app.json = serializacao.ProvedorJSON(app)
+# atrás do proxy do Render (ou nginx), remote_addr seria o do proxy para todos os
+# voluntários e o limite de login por IP bloquearia a organização inteira.
+# PROXY_SALTOS = quantos proxies confiáveis na frente. Padrão 0 (exposto direto):
+# confiar no X-Forwarded-For sem proxy deixaria qualquer um trocar de "IP" a cada
+# tentativa. No Render/nginx, defina PROXY_SALTOS=1 (ver README, Produção).
+PROXY_SALTOS = int(os.getenv("PROXY_SALTOS", "0"))
+if PROXY_SALTOS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_SALTOS, x_proto=PROXY_SALTOS)
 print("✅ App criado / secret_key OK")
 
 # ==============================
-# INICIALIZAÇÃO DO BANCO
+# MÉTRICAS POR REQUISIÇÃO
+# ==============================
+@app.before_request
+def _metricas_inicio():
+    metricas.iniciar_requisicao()
+
+# ==============================
+# LER AS PRÓPRIAS ESCRITAS (réplicas)
+# ==============================
+# quem escreveu há pouco lê do primário (database.LER_ESCRITAS_JANELA);
+# o momento da última escrita vai na sessão, então vale entre workers
+# estáticos não leem a sessão: acessá-la põe Vary: Cookie no asset imutável
+# (nenhum cache compartilha) e eles nunca leem do banco
+_ENDPOINTS_ESTATICOS = {'static', 'css_files', 'js_files', 'imagens_files', 'static_files_legacy'}
+
+@app.before_request
+def _escrita_da_sessao():
+    if request.endpoint in _ENDPOINTS_ESTATICOS:
+        # zera o que ficou de outra requisição nesta thread: o after_request não toca a sessão
+        marcar_ultima_escrita(None)
+        return
+    marcar_ultima_escrita(session.get('ultima_escrita'))
+
+# ==============================
+# DIÁRIO LOCAL DAS ESCRITAS (diario.py)
 # ==============================
-print("🔧 Inicializando tabelas...")
-with app.app_context():
-    init_db()
-print("✅ Banco pronto!")
+# a drenagem sobe no primeiro request de cada worker (depois do fork) e leva
+# ao MySQL o que ficou no diário, inclusive de antes de um restart
+@app.before_request
+def _drenagem_do_diario():
+    diario.iniciar()
+
+def _chave_da_requisicao(data):
+    """Idempotency-Key (ou "chave" no corpo) do cliente; sem ela, uma nova"""
+    return (chave_idempotencia(request.headers.get('Idempotency-Key') or data.get('chave'))
+            or uuid.uuid4().hex)
+
+def _gravar_no_diario(tipo, chave, dados, mensagem):
+    try:
+        diario.registrar(tipo, chave, dados)
+    except Exception as e:
+        logger.error(f"Erro ao gravar no diário local: {e}")
+        return jsonify({"error": "Banco de dados indisponível; tente novamente."}), 503
+    return jsonify({"message": mensagem, "pendente": True, "chave": chave}), 202
+
+@app.after_request
+def _guardar_escrita_na_sessao(response):
+    momento = ultima_escrita()
+    if momento and momento != session.get('ultima_escrita'):
+        session['ultima_escrita'] = momento
+    return response
+
+@app.after_request
+def _metricas_fim(response):
+    resumo = metricas.finalizar_requisicao(request.endpoint, request.method, response.status_code)
+    if resumo:
+        response.headers["Server-Timing"] = (
+            f"app;dur={resumo['duracao'] * 1000:.1f}, "
+            f"db;dur={resumo['tempo'] * 1000:.1f};desc=\"{resumo['consultas']} consultas\", "
+            f"pool;dur={resumo['checkout'] * 1000:.1f}"
+        )
+    return response
+
+# gzip/brotli das respostas dinâmicas (os estáticos já saem pré-comprimidos)
+app.after_request(comprimir_resposta)
 
 # ==============================
 # BLUEPRINT AUTH
@@ -65,7 +176,7 @@ app.register_blueprint(auth_bp, url_prefix="/api")
 # ==============================
 @app.route('/')
 def login_page():
-    return send_from_directory('.', 'login.html')
+    return estaticos.pagina('login.html')
 
 # ==============================
 # ÁREA PROTEGIDA DO APP
@@ -73,22 +184,29 @@ def login_page():
 @app.route('/app')
 @login_required
 def app_index():
-    return send_from_directory('.', 'index.html')
+    return estaticos.pagina('index.html', privada=True)
 
 # ==============================
 # ESTÁTICOS
 # ==============================
+# servidos da memória (estaticos.py): nome com hash = cache imutável
+def _estatico(pasta, filename):
+    resposta = estaticos.arquivo(pasta, filename)
+    if resposta is None:
+        abort(404)
+    return resposta
+
 @app.route('/css/<path:filename>')
 def css_files(filename):
-    return send_from_directory('css', filename)
+    return _estatico('css', filename)
 
 @app.route('/js/<path:filename>')
 def js_files(filename):
-    return send_from_directory('js', filename)
+    return _estatico('js', filename)
 
 @app.route('/static/imagens/<path:filename>')
 def imagens_files(filename):
-    return send_from_directory('static/imagens', filename)
+    return _estatico('static/imagens', filename)
 
 @app.route('/static/<path:filename>')
 def static_files_legacy(filename):
@@ -100,67 +218,224 @@ def static_files_legacy(filename):
 @app.route('/dashboard-data', methods=['GET'])
 @login_required
 def dashboard_data():
-    return jsonify(get_dashboard_data()), 200
+    snapshot = get_dashboard_snapshot()
+    response = jsonify(snapshot["dados"])
+    if not snapshot["etag"]:
+        return response, 200
+
+    # permite 304 em recargas: o navegador revalida com If-None-Match / If-Modified-Since
+    response.set_etag(snapshot["etag"])
+    response.last_modified = snapshot["last_modified"]
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+@app.route('/eventos', methods=['GET'])
+@login_required
+def eventos_route():
+    """Server-Sent Events: "dashboard" (campos que mudaram) e "saldo" (ver eventos.py)"""
+    try:
+        assinatura = difusor.assinar()
+    except LimiteDeConexoes:
+        return jsonify({"error": "Muitas telas conectadas; usando atualização manual."}), 503
+    response = Response(difusor.fluxo(assinatura), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",   # nginx: não segurar os eventos no buffer
+    })
+    # o servidor WSGI sempre chama close(), mesmo se o corpo nunca for lido (HEAD, cliente que desistiu)
+    response.call_on_close(lambda: difusor.cancelar(assinatura))
+    return response
+
+def _paginacao():
+    """Lê ?limit= e ?after= da query string (after é o next_cursor da página anterior)"""
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after') or None
+    return limit, after
 
 @app.route('/buscar-familias', methods=['GET'])
 @login_required
 def buscar_familias_route():
     query = request.args.get('q', '').strip()
-    return jsonify(listar_familias(query)), 200
+    limit, after = _paginacao()
+
+    if query:
+        # busca com ranking pelo índice em memória; resultado numa página só
+        try:
+            ids = indice_familias.buscar(query, limite=min(max(limit or 50, 1), PAGINA_MAXIMA))
+            return jsonify({"items": listar_familias_por_ids(ids), "next_cursor": None}), 200
+        except Exception as e:
+            logger.error(f"Índice de busca indisponível, usando o banco: {e}")
+
+    try:
+        return jsonify(listar_familias(query, limit=limit, after=after)), 200
+    except CursorInvalido:
+        return jsonify({"error": "Cursor de paginação inválido."}), 400
+
+@app.route('/familias/sugestoes', methods=['GET'])
+@login_required
+def familias_sugestoes_route():
+    """Type-ahead: responde da memória, sem consultar o MySQL"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    if not query:
+        return jsonify([]), 200
+    try:
+        return jsonify(indice_familias.sugestoes(query, limite=limit)), 200
+    except Exception as e:
+        logger.error(f"Erro nas sugestões de famílias: {e}")
+        return jsonify([]), 200
+
+@app.route('/familias/<int:familia_id>', methods=['GET'])
+@login_required
+def familia_detalhe_route(familia_id):
+    """Cadastro completo da família com os membros"""
+    try:
+        familias = detalhar_familias([familia_id])
+    except Exception as e:
+        logger.error(f"Erro ao detalhar família {familia_id}: {e}")
+        return jsonify({"error": "Erro ao carregar a família."}), 500
+    if not familias:
+        return jsonify({"error": "Família não encontrada."}), 404
+    return jsonify(familias[0]), 200
+
+@app.route('/familias', methods=['GET'])
+@login_required
+def familias_por_ids_route():
+    """?ids=1,2,3: várias famílias com os membros, em duas consultas (na ordem pedida)"""
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids deve ser uma lista de números separados por vírgula."}), 400
+    if not ids:
+        return jsonify({"error": "Informe ?ids=1,2,3"}), 400
+    if len(ids) > PAGINA_MAXIMA:
+        return jsonify({"error": f"Máximo de {PAGINA_MAXIMA} ids por consulta."}), 413
+    try:
+        return jsonify({"items": detalhar_familias(ids)}), 200
+    except Exception as e:
+        logger.error(f"Erro ao detalhar famílias: {e}")
+        return jsonify({"error": "Erro ao carregar as famílias."}), 500
 
 @app.route('/listar-entregas', methods=['GET'])
 @login_required
 def listar_entregas_route():
-    return jsonify(
-        listar_entregas(
-            request.args.get('dataInicio'),
-            request.args.get('dataFim'),
-            request.args.get('familia')
-        )
-    ), 200
+    limit, after = _paginacao()
+    try:
+        return jsonify(
+            listar_entregas(
+                request.args.get('dataInicio'),
+                request.args.get('dataFim'),
+                request.args.get('familia'),
+                limit=limit,
+                after=after
+            )
+        ), 200
+    except CursorInvalido:
+        return jsonify({"error": "Cursor de paginação inválido."}), 400
 
 @app.route('/cadastrar-familia', methods=['POST'])
 @login_required
 def cadastrar_familia_route():
     data = request.get_json() or {}
 
-    required = [
-        'responsavelNome',
-        'responsavelCPF',
-        'responsavelNascimento',
-        'responsavelGenero',
-        'responsavelEndereco',
-        'numeroPessoas'
-    ]
+    erro = validar_familia(data)
+    if erro:
+        return jsonify({"error": erro}), 400
 
-    for field in required:
-        if not data.get(field):
-            return jsonify({"error": f"Campo obrigatório: {field}"}), 400
+    try:
+        familia_id = salvar_familia(data)
+    except CPFDuplicado:
+        return jsonify({"error": "Já existe uma família cadastrada com este CPF."}), 409
 
-    familia_id = salvar_familia(data)
     if not familia_id:
         return jsonify({"error": "Erro ao cadastrar família."}), 500
 
+    indice_familias.marcar_desatualizado()
+
     return jsonify({
         "message": "Família cadastrada com sucesso!",
         "id": familia_id
     }), 201
 
+@app.route('/importar-familias', methods=['POST'])
+@login_required
+def importar_familias_route():
+    """
+    Aceita multipart (campo 'arquivo') ou o corpo cru (text/csv, application/x-ndjson).
+    ?formato=csv|jsonl força o formato; senão é deduzido do nome/content-type.
+    """
+    arquivo = request.files.get('arquivo')
+    if arquivo:
+        stream = arquivo.stream
+        formato = request.args.get('formato') or detectar_formato(arquivo.filename, arquivo.mimetype)
+    else:
+        stream = request.stream
+        formato = request.args.get('formato') or detectar_formato(content_type=request.content_type)
+
+    try:
+        registros = ler_registros(stream, formato)
+        resumo = importar_familias(registros)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Arquivo inválido: {e}"}), 400
+
+    indice_familias.marcar_desatualizado()
+    return jsonify(resumo), 200
+
 @app.route('/registrar-entrega', methods=['POST'])
 @login_required
 def registrar_entrega_route():
     data = request.get_json() or {}
 
-    required = ['familiaEntrega', 'dataEntrega', 'quantidadeCestas', 'responsavelEntrega']
-    for field in required:
-        if not data.get(field):
-            return jsonify({"error": f"Campo obrigatório: {field}"}), 400
+    erro = validar_entrega(data)
+    if erro:
+        return jsonify({"error": erro}), 400
+
+    chave = _chave_da_requisicao(data)
+    pendente = "Entrega recebida; será gravada assim que o banco responder."
+    if diario.modo == "sempre":
+        return _gravar_no_diario("entrega", chave, data, pendente)
 
-    if salvar_entrega(data):
+    try:
+        ok = salvar_entrega(data, chave=chave)
+    except BancoIndisponivel:
+        if diario.modo == "desligado":
+            return jsonify({"error": "Banco de dados indisponível; tente novamente."}), 503
+        return _gravar_no_diario("entrega", chave, data, pendente)
+    except EntregaInvalida as e:
+        return jsonify({"error": str(e)}), 400
+    except KitIndisponivel as e:
+        return jsonify({"error": str(e), "faltas": e.faltas}), 409
+    except EntregaDuplicada as e:
+        # o voluntário confirma e reenvia com "forcar": true
+        return jsonify({
+            "error": str(e),
+            "duplicada": True,
+            "ultimaEntrega": e.ultima_entrega.isoformat() if e.ultima_entrega else None
+        }), 409
+    if ok:
         return jsonify({"message": "Entrega registrada com sucesso!"}), 201
 
     return jsonify({"error": "Erro ao registrar entrega"}), 500
 
+@app.route('/registrar-entregas-lote', methods=['POST'])
+@login_required
+def registrar_entregas_lote_route():
+    """Corpo: {"entregas": [...]} com os mesmos campos de /registrar-entrega (+ "id" opcional)"""
+    data = request.get_json(silent=True) or {}
+    entregas = data.get("entregas") if isinstance(data, dict) else data
+
+    if not isinstance(entregas, list) or not entregas:
+        return jsonify({"error": "Informe a lista de entregas."}), 400
+    if len(entregas) > LOTE_ENTREGAS_MAXIMO:
+        return jsonify({"error": f"Máximo de {LOTE_ENTREGAS_MAXIMO} entregas por lote."}), 413
+
+    resultados = salvar_entregas_lote(entregas)
+    registradas = sum(1 for r in resultados if r["status"] == "ok")
+    return jsonify({
+        "registradas": registradas,
+        "rejeitadas": len(resultados) - registradas,
+        "resultados": resultados
+    }), 200
+
 @app.route('/registrar-entrada-estoque', methods=['POST'])
 @login_required
 def registrar_entrada_estoque_route():
@@ -172,8 +447,24 @@ def registrar_entrada_estoque_route():
 
     if not quantidade or not fornecedor:
         return jsonify({"error": "Informe quantidade e fornecedor."}), 400
+    try:
+        quantidade = int(quantidade)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Quantidade inválida."}), 400
 
-    ok = registrar_entrada_estoque(quantidade, fornecedor, observacoes)
+    chave = _chave_da_requisicao(data)
+    dados = {"quantidade": quantidade, "fornecedor": fornecedor, "observacoes": observacoes,
+             "dataEntrada": date.today().isoformat()}
+    pendente = "Entrada recebida; será gravada assim que o banco responder."
+    if diario.modo == "sempre":
+        return _gravar_no_diario("entrada_estoque", chave, dados, pendente)
+
+    try:
+        ok = registrar_entrada_estoque(quantidade, fornecedor, observacoes, chave=chave)
+    except BancoIndisponivel:
+        if diario.modo == "desligado":
+            return jsonify({"error": "Banco de dados indisponível; tente novamente."}), 503
+        return _gravar_no_diario("entrada_estoque", chave, dados, pendente)
     if ok:
         return jsonify({"message": "Entrada registrada com sucesso!"}), 201
     return jsonify({"error": "Erro ao registrar entrada"}), 500
@@ -186,7 +477,123 @@ def saldo_estoque_route():
 @app.route('/movimentacoes-estoque', methods=['GET'])
 @login_required
 def movimentacoes_estoque_route():
-    return jsonify(listar_movimentacoes_estoque()), 200
+    limit, after = _paginacao()
+    try:
+        eventos = iter_movimentacoes_estoque(
+            limit=limit,
+            after=after,
+            data_inicio=request.args.get('dataInicio'),
+            data_fim=request.args.get('dataFim')
+        )
+    except CursorInvalido:
+        return jsonify({"error": "Cursor de paginação inválido."}), 400
+
+    def gerar():
+        # {"items": [...], "next_cursor": ...} escrito item a item
+        yield b'{"items": ['
+        next_cursor = None
+        separador = b''
+        for tipo, valor in eventos:
+            if tipo == "item":
+                yield separador + serializacao.dumps_bytes(valor)
+                separador = b','
+            else:
+                next_cursor = valor
+        yield b'], "next_cursor": ' + serializacao.dumps_bytes(next_cursor) + b'}'
+
+    return Response(gerar(), mimetype='application/json'), 200
+
+# ==============================
+# EXPORTAÇÃO (CSV / XLSX em streaming)
+# ==============================
+def _resposta_exportacao(nome, colunas, linhas):
+    formato = (request.args.get('formato') or 'csv').lower()
+    if formato not in exportacao.FORMATOS:
+        return jsonify({"error": f"Formato deve ser um de: {', '.join(exportacao.FORMATOS)}"}), 400
+    try:
+        corpo = exportacao.exportar(formato, colunas, linhas, titulo=nome)
+    except exportacao.FormatoIndisponivel as e:
+        return jsonify({"error": str(e)}), 501
+
+    resp = Response(corpo, mimetype=exportacao.MIMETYPES[formato])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{nome}.{formato}"'
+    return resp, 200
+
+def _data_valida(valor):
+    try:
+        datetime.strptime(valor, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+def _periodo_exportacao(*campos):
+    """(data_inicio, data_fim, erro) a partir de ?dataInicio=&dataFim= (AAAA-MM-DD)"""
+    datas = []
+    for campo in campos or ('dataInicio', 'dataFim'):
+        valor = request.args.get(campo) or None
+        if valor and not _data_valida(valor):
+            return None, None, f"{campo} deve estar no formato AAAA-MM-DD."
+        datas.append(valor)
+    return datas[0], datas[1], None
+
+@app.route('/exportar/entregas', methods=['GET'])
+@login_required
+def exportar_entregas():
+    inicio, fim, erro = _periodo_exportacao()
+    if erro:
+        return jsonify({"error": erro}), 400
+    return _resposta_exportacao(
+        f"entregas_{inicio or 'inicio'}_{fim or 'hoje'}",
+        COLUNAS_EXPORT_ENTREGAS, iter_export_entregas(inicio, fim)
+    )
+
+@app.route('/exportar/familias', methods=['GET'])
+@login_required
+def exportar_familias():
+    return _resposta_exportacao("familias", COLUNAS_EXPORT_FAMILIAS, iter_export_familias())
+
+@app.route('/exportar/movimentacoes-estoque', methods=['GET'])
+@login_required
+def exportar_movimentacoes():
+    inicio, fim, erro = _periodo_exportacao()
+    if erro:
+        return jsonify({"error": erro}), 400
+    return _resposta_exportacao(
+        f"movimentacoes_{inicio or 'inicio'}_{fim or 'hoje'}",
+        COLUNAS_EXPORT_MOVIMENTACOES, iter_export_movimentacoes(inicio, fim)
+    )
+
+# ==============================
+# ESTATÍSTICAS
+# ==============================
+@app.route('/estatisticas', methods=['GET'])
+@login_required
+def estatisticas():
+    """
+    ?granularidade=mes|dia&inicio=&fim= (AAAA-MM-DD; padrão: últimos 12 meses
+    ou últimos 30 dias). Lido dos rollups, sem varrer movimento_cestas.
+    "familias"/"pessoas" são distintas dentro de cada período: não somar entre períodos.
+    """
+    granularidade = request.args.get('granularidade', 'mes')
+    if granularidade not in GRANULARIDADES_ESTATISTICAS:
+        return jsonify({"error": "granularidade deve ser 'mes' ou 'dia'."}), 400
+    inicio, fim, erro = _periodo_exportacao('inicio', 'fim')
+    if erro:
+        return jsonify({"error": erro}), 400
+
+    fim = datetime.strptime(fim, "%Y-%m-%d").date() if fim else date.today()
+    if inicio:
+        inicio = datetime.strptime(inicio, "%Y-%m-%d").date()
+    elif granularidade == 'mes':
+        meses = fim.year * 12 + fim.month - 12  # 11 meses antes do mês de `fim`
+        inicio = date(meses // 12, meses % 12 + 1, 1)
+    else:
+        inicio = fim - timedelta(days=29)
+    try:
+        serie = estatisticas_entregas(granularidade, inicio, fim)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"granularidade": granularidade, "items": serie}), 200
 
 # ==============================
 # INSUMOS (API)
@@ -212,6 +619,35 @@ def insumos_criar():
 
     return jsonify({"message": "Insumo criado!", "id": new_id}), 201
 
+@app.route('/insumos/estoque', methods=['GET'])
+@login_required
+def insumos_estoque():
+    return jsonify(listar_estoque_insumos()), 200
+
+@app.route('/insumos/<int:insumo_id>/entrada', methods=['POST'])
+@login_required
+def insumos_entrada(insumo_id):
+    data = request.get_json() or {}
+    try:
+        quantidade = float(data.get("quantidade"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Quantidade inválida."}), 400
+    if quantidade <= 0:
+        return jsonify({"error": "Quantidade deve ser > 0."}), 400
+
+    if not registrar_entrada_insumo(insumo_id, quantidade, (data.get("observacoes") or None)):
+        return jsonify({"error": "Erro ao registrar entrada do insumo."}), 500
+    return jsonify({"message": "Entrada de insumo registrada!"}), 201
+
+@app.route('/insumos/<int:insumo_id>/movimentos', methods=['GET'])
+@login_required
+def insumos_movimentos(insumo_id):
+    limit, after = _paginacao()
+    try:
+        return jsonify(listar_movimentos_insumo(insumo_id, limit=limit, after=after)), 200
+    except CursorInvalido:
+        return jsonify({"error": "Cursor de paginação inválido."}), 400
+
 # ==============================
 # KITS (API)
 # ==============================
@@ -236,6 +672,17 @@ def kits_criar():
 
     return jsonify({"message": "Kit criado!", "id": new_id}), 201
 
+@app.route('/kits/disponibilidade', methods=['GET'])
+@login_required
+def kits_disponibilidade():
+    """Quantos kits completos o estoque de insumos permite montar agora"""
+    return jsonify(kits_disponiveis()), 200
+
+@app.route('/kits/completos', methods=['GET'])
+@login_required
+def kits_completos():
+    return jsonify(listar_kits_completos()), 200
+
 @app.route('/kits/<int:kit_id>/itens', methods=['GET'])
 @login_required
 def kit_itens_listar(kit_id):
@@ -279,9 +726,70 @@ def kit_itens_remover(item_id):
 def ping():
     return jsonify({"status": "ok"}), 200
 
+@app.route('/pool-stats')
+@login_required
+def pool_stats():
+    return jsonify(get_pool_stats()), 200
+
+@app.route('/diario')
+@login_required
+def diario_status():
+    """Escritas no diário local: pendentes, aplicadas e as últimas rejeitadas na drenagem"""
+    return jsonify(diario.status()), 200
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+@app.route('/metrics')
+def metrics():
+    """Formato Prometheus. Com METRICS_TOKEN definido, exige 'Authorization: Bearer <token>'"""
+    if METRICS_TOKEN:
+        enviado = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(enviado, METRICS_TOKEN):
+            return jsonify({"status": "erro", "msg": "Token inválido."}), 401
+    elif not (session.get("logado") or session.get("user_id")):
+        return jsonify({"status": "erro", "msg": "Usuário não autenticado."}), 401
+
+    try:
+        pool = get_pool_stats()
+    except Exception:
+        pool = None
+    try:
+        pendentes = diario.status(ultimas_rejeitadas=0)
+    except Exception:
+        pendentes = None
+    return Response(metricas.render_prometheus(pool, pendentes),
+                    mimetype="text/plain; version=0.0.4"), 200
+
+# ==============================
+# FÁBRICA (produção)
+# ==============================
+def create_app():
+    """
+    Ponto de entrada dos servidores WSGI (ver wsgi.py). Não roda DDL: só
+    confere se há migração pendente. Migrar é um passo separado: python manage.py migrar
+    """
+    versao = verificar_schema()
+    # índice de busca montado já na subida: a primeira busca não espera a carga
+    # (com preload, os workers herdam a cópia do mestre)
+    try:
+        indice_familias.sincronizar(forcar=True)
+    except Exception as e:
+        logger.error(f"Índice de busca não montado na subida, fica para a primeira busca: {e}")
+    # com preload (gunicorn), isto roda no processo mestre: nenhuma conexão
+    # aberta aqui pode ser herdada pelos workers depois do fork
+    fechar_pool()
+    # estáticos lidos e comprimidos uma vez, antes do fork
+    estaticos.carregar()
+    print(f"✅ Schema na versão {versao}")
+    return app
+
 # ==============================
-# MAIN
+# MAIN (desenvolvimento)
 # ==============================
 if __name__ == '__main__':
+    print("🔧 Aplicando migrações...")
+    migrar()
+    print("✅ Banco pronto!")
+    estaticos.recarregar = True  # edições em css/js/html aparecem sem reiniciar
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,81 @@
+# serializacao.py
+"""
+JSON das respostas: orjson quando instalado (opcional), json da stdlib senão.
+
+ProvedorJSON substitui o provedor padrão do Flask (app.json), então todo
+jsonify passa por aqui. As duas implementações geram o mesmo conteúdo:
+datas viram data HTTP e Decimal vira string, como no provedor padrão do
+Flask. As listagens grandes já trazem datas formatadas pelo SQL e linhas em
+tupla (get_db_cursor(tuplas=True) + linhas_para_dicts), para não montar dois
+dicts por linha.
+
+    python -m bench.serializacao_bench --linhas 10000   # CPU e memória por 10k linhas
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele, json da stdlib
+    orjson = None
+
+
+def _padrao(o):
+    """Tipos que o JSON não conhece (mesmas regras do provedor padrão do Flask)"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Objeto do tipo {type(o).__name__} não é serializável em JSON")
+
+
+if orjson is not None:
+    # datas passam pelo _padrao (orjson usaria ISO 8601); chaves int viram string, como no json
+    _OPCOES_ORJSON = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=_padrao, option=_OPCOES_ORJSON)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_padrao)
+
+    def dumps_bytes(obj):
+        return _encoder.encode(obj).encode("utf-8")
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def linhas_para_dicts(colunas, linhas):
+    """
+    Linhas em tupla -> dicts com as chaves de `colunas` (mapeadas uma vez só).
+    Colunas a mais no fim da linha (chave de paginação etc.) ficam de fora.
+    """
+    return [dict(zip(colunas, linha)) for linha in linhas]
+
+
+class ProvedorJSON(DefaultJSONProvider):
+    """Provedor do Flask que usa dumps_bytes; sem ordenar chaves nem escapar acentos"""
+
+    ensure_ascii = False
+    sort_keys = False
+    default = staticmethod(_padrao)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # opções específicas (indent etc.): caminho da stdlib
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
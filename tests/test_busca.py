@@ -0,0 +1,113 @@
+# tests/test_busca.py
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import routes
+from busca import IndiceFamilias
+from database import PAGINA_MAXIMA
+
+
+class BancoFalso:
+    """familias_cestas em memória: id -> (nome, cpf, telefone, ativo, atualizado_em)"""
+
+    def __init__(self):
+        self.relogio = datetime(2024, 3, 1, 8, 0, 0)
+        self.familias = {}
+
+    def gravar(self, familia_id, nome, cpf="", telefone="", ativo=True):
+        self.relogio += timedelta(seconds=1)
+        self.familias[familia_id] = (nome, cpf, telefone, ativo, self.relogio)
+
+    def carregar(self):
+        return [(i, nome, cpf, tel) for i, (nome, cpf, tel, ativo, _) in sorted(self.familias.items())
+                if ativo]
+
+    def alteradas(self, desde):
+        return sorted(((i, *f) for i, f in self.familias.items() if desde is None or f[4] >= desde),
+                      key=lambda f: (f[5], f[0]))
+
+    def marca(self):
+        return max((f[4] for f in self.familias.values()), default=None)
+
+
+class SincronizacaoDoIndiceTest(unittest.TestCase):
+    def setUp(self):
+        self.banco = BancoFalso()
+        self.banco.gravar(1, "Maria Souza", "11122233344")
+        self.banco.gravar(2, "João da Silva", "55566677788")
+        self.indice = IndiceFamilias(carregar=self.banco.carregar, alteradas=self.banco.alteradas,
+                                     marca=self.banco.marca, intervalo=0)
+
+    def _nomes(self, consulta):
+        return [s["responsavel_nome"] for s in self.indice.sugestoes(consulta)]
+
+    def test_renomeada_aparece_com_o_nome_novo(self):
+        self.assertEqual(self._nomes("maria"), ["Maria Souza"])
+
+        self.banco.gravar(1, "Mariana Costa", "99988877766")
+
+        self.assertEqual(self._nomes("costa"), ["Mariana Costa"])
+        self.assertEqual(self._nomes("souza"), [])
+        self.assertEqual(self.indice.buscar("99988877766"), [1])
+        self.assertEqual(self.indice.buscar("11122233344"), [])
+
+    def test_desativada_sai_da_busca(self):
+        self.assertEqual(self._nomes("joao"), ["João da Silva"])
+
+        self.banco.gravar(2, "João da Silva", "55566677788", ativo=False)
+
+        self.assertEqual(self._nomes("joao"), [])
+        self.assertEqual(self.indice.buscar("silva"), [])
+
+    def test_nova_familia_entra(self):
+        self.indice.buscar("maria")
+        self.banco.gravar(3, "Ana Lima")
+        self.assertEqual(self._nomes("ana"), ["Ana Lima"])
+
+    def test_busca_nao_espera_a_sincronizacao_de_outro_thread(self):
+        self.indice.buscar("maria")
+        lendo, liberar = threading.Event(), threading.Event()
+        alteradas = self.banco.alteradas
+
+        def alteradas_lenta(desde):
+            lendo.set()
+            liberar.wait(5)
+            return alteradas(desde)
+
+        self.indice._alteradas = alteradas_lenta
+        self.banco.gravar(3, "Ana Lima")
+        sincronizacao = threading.Thread(target=self.indice.sincronizar)
+        sincronizacao.start()
+        self.addCleanup(sincronizacao.join)
+        self.addCleanup(liberar.set)
+        self.assertTrue(lendo.wait(5))
+
+        # banco "lento" no meio da sincronização: a busca responde com o índice atual
+        resultado = []
+        busca = threading.Thread(target=lambda: resultado.append(self._nomes("maria")))
+        busca.start()
+        busca.join(1)
+        self.assertEqual(resultado, [["Maria Souza"]])
+
+        liberar.set()
+        sincronizacao.join(5)
+        self.assertEqual(self._nomes("ana"), ["Ana Lima"])
+
+
+class LimiteDaBuscaTest(unittest.TestCase):
+    def test_limit_fica_entre_1_e_a_pagina_maxima(self):
+        cliente = routes.app.test_client()
+        with cliente.session_transaction() as sessao:
+            sessao["logado"] = True
+        with mock.patch.object(routes.indice_familias, "buscar", return_value=[]) as buscar, \
+                mock.patch.object(routes, "listar_familias_por_ids", return_value=[]):
+            for limit, esperado in (("1000000", PAGINA_MAXIMA), ("-5", 1), ("", 50)):
+                with self.subTest(limit=limit):
+                    cliente.get(f"/buscar-familias?q=maria&limit={limit}")
+                    self.assertEqual(buscar.call_args.kwargs["limite"], esperado)
+
+
+if __name__ == "__main__":
+    unittest.main()
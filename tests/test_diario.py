@@ -0,0 +1,78 @@
+# tests/test_diario.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import database
+import diario
+
+
+def _lote_falso(itens, levantar_indisponivel=False):
+    """Como salvar_entregas_lote: um item que o MySQL recusa derruba a transação inteira"""
+    if any(item["familiaEntrega"] == "ruim" for item in itens):
+        return [{"indice": i, "id": None, "status": "falha", "erro": "Erro ao registrar entrega"}
+                for i, _ in enumerate(itens)]
+    return [{"indice": i, "id": None, "status": "ok", "erro": None} for i, _ in enumerate(itens)]
+
+
+class DrenagemDoDiarioTest(unittest.TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.diario = diario.Diario(os.path.join(pasta.name, "diario.sqlite3"))
+        self.diario.iniciar = lambda: None  # drena só quando o teste pede
+        self.addCleanup(lambda: self.diario._conexao().close())
+        lote = mock.patch.object(database, "salvar_entregas_lote", side_effect=_lote_falso)
+        self.lote = lote.start()
+        self.addCleanup(lote.stop)
+
+    def _entrega(self, chave, familia):
+        self.diario.registrar("entrega", chave, {"familiaEntrega": familia, "quantidadeCestas": 1})
+
+    def _status(self):
+        return {r["chave"]: r["status"] for r in self.diario._conexao().execute(
+            "SELECT chave, status FROM diario")}
+
+    def test_entrega_ruim_na_frente_nao_trava_as_validas(self):
+        self._entrega("a", "ruim")
+        self._entrega("b", "1")
+        self._entrega("c", "2")
+
+        processadas, falhou = self.diario.drenar()
+
+        self.assertTrue(falhou)
+        self.assertEqual(processadas, 2)
+        self.assertEqual(self._status(), {"a": "pendente", "b": "aplicada", "c": "aplicada"})
+
+        for _ in range(diario.DIARIO_TENTATIVAS_MAXIMAS - 1):
+            self.diario.drenar()
+        self.assertEqual(self._status()["a"], "rejeitada")
+        self.assertEqual(self.diario.drenar(), (0, False))
+
+    def test_payload_ilegivel_e_rejeitado_na_hora(self):
+        self.diario._conexao().execute(
+            "INSERT INTO diario (chave, tipo, dados, criado_em) VALUES ('x', 'entrega', '[1', 0)")
+        self._entrega("b", "1")
+
+        self.assertEqual(self.diario.drenar(), (2, False))
+        self.assertEqual(self._status(), {"x": "rejeitada", "b": "aplicada"})
+        self.assertEqual(self.diario.status()["rejeitadas"][0]["dados"], "[1")
+
+    def test_banco_fora_fica_pendente_sem_limite(self):
+        self.lote.side_effect = database.BancoIndisponivel("sem conexão")
+        self._entrega("a", "1")
+
+        for _ in range(diario.DIARIO_TENTATIVAS_MAXIMAS + 1):
+            self.assertEqual(self.diario.drenar(), (0, True))
+        self.assertEqual(self._status(), {"a": "pendente"})
+
+
+class ModoSempreTest(unittest.TestCase):
+    def test_exige_arquivo_fora_do_padrao(self):
+        with self.assertRaises(ValueError):
+            diario.Diario(diario.DIARIO_ARQUIVO_PADRAO, modo="sempre")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# tests/test_entrega.py
+import contextlib
+import unittest
+from unittest import mock
+
+import database
+from routes import app
+
+
+def _entrega(**campos):
+    return {"familiaEntrega": "7", "dataEntrega": "2024-03-05", "quantidadeCestas": "1",
+            "responsavelEntrega": "Ana", **campos}
+
+
+class BancoFalso:
+    """Cursor que responde ao saldo travado, à chave (nunca gravada) e à família travada (ou não)"""
+
+    def __init__(self, saldo=10, familias=()):
+        self.saldo = saldo
+        self.familias = familias
+        self._linhas = []
+
+    def execute(self, sql, params=None):
+        if "FROM estoque_saldo" in sql:
+            self._linhas = [{"saldo": self.saldo}]
+        elif sql.startswith(("SELECT chave_idempotencia", "UPDATE estoque_saldo")):
+            self._linhas = []  # a baixa do saldo volta com o rollback da exceção
+        elif "FROM familias_cestas" in sql:
+            self._linhas = [{"id": f, "ultima_entrega": None} for f in self.familias]
+        else:
+            raise AssertionError(f"gravaria algo: {sql}")
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def fetchall(self):
+        return self._linhas
+
+    @contextlib.contextmanager
+    def __call__(self, *args, **kwargs):
+        yield self
+
+
+class RegistrarEntregaTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = app.test_client()
+        with self.cliente.session_transaction() as sessao:
+            sessao["logado"] = True
+            sessao["user_id"] = 1
+
+    def _post(self, dados, banco):
+        with mock.patch.object(database, "get_db_cursor", banco):
+            return self.cliente.post("/registrar-entrega", json=dados)
+
+    def test_quantidade_negativa_nao_chega_ao_banco(self):
+        banco = mock.Mock(side_effect=AssertionError("consultou o banco"))
+        resposta = self._post(_entrega(quantidadeCestas="-3"), banco)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.get_json()["error"], "Quantidade deve ser > 0")
+
+    def test_data_invalida(self):
+        banco = mock.Mock(side_effect=AssertionError("consultou o banco"))
+        resposta = self._post(_entrega(dataEntrega="31/02/2024"), banco)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.get_json()["error"], "Data de entrega inválida")
+
+    def test_estoque_insuficiente_so_com_a_opcao_ligada(self):
+        # sem a opção, passa do estoque e segue para a família (aqui, inexistente)
+        resposta = self._post(_entrega(quantidadeCestas="3"), BancoFalso(saldo=2, familias=[]))
+        self.assertEqual(resposta.get_json()["error"], "Família não encontrada")
+
+        with mock.patch.object(database, "ENTREGA_EXIGIR_ESTOQUE", True):
+            resposta = self._post(_entrega(quantidadeCestas="3"), BancoFalso(saldo=2, familias=[7]))
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.get_json()["error"], "Estoque insuficiente")
+
+    def test_familia_nao_encontrada(self):
+        resposta = self._post(_entrega(), BancoFalso(saldo=10, familias=[]))
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.get_json()["error"], "Família não encontrada")
+
+    def test_lote_usa_a_mesma_validacao(self):
+        resultados = database.salvar_entregas_lote([_entrega(quantidadeCestas="0")])
+        self.assertEqual(resultados[0]["status"], "rejeitada")
+        self.assertEqual(resultados[0]["erro"], "Quantidade deve ser > 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
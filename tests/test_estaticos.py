@@ -0,0 +1,73 @@
+# tests/test_estaticos.py
+import tempfile
+import unittest
+from pathlib import Path
+
+from flask import Flask
+
+from estaticos import Estaticos
+from routes import app
+
+
+class VariantesDeImagemTest(unittest.TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        raiz = Path(pasta.name)
+        variantes = raiz / "static/imagens/variantes"
+        variantes.mkdir(parents=True)
+        (raiz / "static/imagens/logo.png").write_bytes(b"ORIGINAL")
+        (raiz / "static/imagens/foto.png").write_bytes(b"SEM VARIANTE")
+        (variantes / "logo.png").write_bytes(b"REDUZIDA")
+        (variantes / "logo.webp").write_bytes(b"WEBP")
+        (raiz / "index.html").write_text(
+            '<img src="/static/imagens/variantes/logo.png"><img src="/static/imagens/logo.png">',
+            encoding="utf-8")
+        self.estaticos = Estaticos(raiz)
+        self.app = Flask(__name__)
+
+    def _corpo(self, nome, accept="*/*"):
+        with self.app.test_request_context(headers={"Accept": accept}):
+            return self.estaticos.arquivo("static/imagens", nome).get_data()
+
+    def test_url_original_serve_o_original(self):
+        self.assertEqual(self._corpo("logo.png"), b"ORIGINAL")
+        self.assertEqual(self._corpo("logo.png", accept="image/webp,*/*"), b"ORIGINAL")
+        versionada = self.estaticos.url("/static/imagens/logo.png")
+        self.assertEqual(self._corpo(versionada[len("/static/imagens/"):]), b"ORIGINAL")
+
+    def test_reduzida_so_na_propria_url(self):
+        versionada = self.estaticos.url("/static/imagens/variantes/logo.png")
+        self.assertNotEqual(versionada, self.estaticos.url("/static/imagens/logo.png"))
+        nome = versionada[len("/static/imagens/"):]
+        self.assertEqual(self._corpo(nome), b"REDUZIDA")
+        self.assertEqual(self._corpo(nome, accept="image/webp,*/*"), b"WEBP")
+
+    def test_sem_variante_a_url_da_reduzida_serve_o_original(self):
+        self.assertEqual(self._corpo("variantes/foto.png"), b"SEM VARIANTE")
+
+    def test_pagina_aponta_para_as_duas_versoes(self):
+        with self.app.test_request_context():
+            html = self.estaticos.pagina("index.html").get_data(as_text=True)
+        self.assertIn(self.estaticos.url("/static/imagens/variantes/logo.png"), html)
+        self.assertIn(self.estaticos.url("/static/imagens/logo.png"), html)
+
+
+class EstaticosSemSessaoTest(unittest.TestCase):
+    """Asset imutável não pode sair com Vary: Cookie, nem para quem está logado"""
+
+    def test_sem_vary_cookie(self):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sessao:
+            sessao["logado"] = True
+            sessao["ultima_escrita"] = 1700000000.0
+        for url in ("/css/style.css", "/js/script.js",
+                    "/static/imagens/variantes/logo_maisdecristo_b2.jpg"):
+            with self.subTest(url=url):
+                resposta = cliente.get(url)
+                self.assertEqual(resposta.status_code, 200)
+                self.assertNotIn("cookie", resposta.vary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# tests/test_importacao.py
+import contextlib
+import unittest
+from unittest import mock
+
+import database
+from importacao import importar_familias
+
+
+def _familia(cpf, membros=None):
+    return {"responsavelNome": "Ana", "responsavelCPF": cpf, "responsavelNascimento": "1980-01-01",
+            "responsavelGenero": "F", "responsavelEndereco": "Rua A", "numeroPessoas": 2,
+            "membros": membros}
+
+
+class BancoFalso:
+    """Cursor que dá um id a cada família inserida e guarda os membros gravados"""
+
+    def __init__(self):
+        self.proximo_id = 100
+        self.lastrowid = None
+        self.membros = []
+
+    def execute(self, sql, params=None):
+        if "INSERT INTO familias_cestas" in sql:
+            self.lastrowid = self.proximo_id
+            self.proximo_id += 1
+        elif not sql.lstrip().startswith(("SELECT responsavel_cpf", "SAVEPOINT")):
+            raise AssertionError(f"consulta inesperada: {sql}")
+
+    def executemany(self, sql, lista):
+        if "INSERT INTO familia_membros" in sql:
+            self.membros.extend(lista)
+        else:
+            self.proximo_id += len(lista)
+
+    def fetchall(self):
+        return []
+
+    @contextlib.contextmanager
+    def __call__(self, *args, **kwargs):
+        yield self
+
+
+class ImportacaoComMembrosTest(unittest.TestCase):
+    def setUp(self):
+        self.banco = BancoFalso()
+        p = mock.patch.object(database, "get_db_cursor", self.banco)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_cpf_sem_digitos_e_invalido_e_nao_derruba_o_lote(self):
+        membro = [{"nome": "Bia", "parentesco": "filho"}]
+        resumo = importar_familias([
+            (2, _familia("N/A", membro), None),
+            (3, _familia("-"), None),
+            (4, _familia("111.222.333-44", membro), None),
+            (5, _familia("55566677788"), None),
+        ])
+
+        self.assertEqual((resumo["inseridas"], resumo["invalidas"], resumo["erros"]), (2, 2, 0))
+        self.assertEqual({f["linha"]: f["status"] for f in resumo["falhas"]},
+                         {2: "invalida", 3: "invalida"})
+        self.assertEqual([m[:2] for m in self.banco.membros], [[101, "Bia"]])
+
+    def test_membros_usam_o_id_do_insert_e_nao_o_cpf(self):
+        # mesmo sem passar pela validação, a família sem CPF leva os seus membros
+        resultados = database.inserir_familias_lote([(7, _familia("N/A", [{"nome": "Caio"}]))])
+        self.assertEqual(resultados, [(7, "inserida", None)])
+        self.assertEqual([m[:2] for m in self.banco.membros], [[100, "Caio"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
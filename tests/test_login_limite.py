@@ -0,0 +1,61 @@
+# tests/test_login_limite.py
+import unittest
+from unittest import mock
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import auth
+from routes import app
+
+
+class LimiteLoginTest(unittest.TestCase):
+    """Atrás do proxy (PROXY_SALTOS=1), cada cliente (X-Forwarded-For) tem o seu limite de falhas"""
+
+    def setUp(self):
+        self.cliente = app.test_client()
+        # sem MySQL: o login cai no fallback do admin de ambiente e falha
+        falha_banco = mock.patch.object(auth, "get_db_cursor", side_effect=RuntimeError("sem banco"))
+        limite_ip = mock.patch.object(auth, "_limite_ip", auth.LimiteTentativas(2, 300))
+        limite_usuario = mock.patch.object(auth, "_limite_usuario", auth.LimiteTentativas(2, 900))
+        proxy = mock.patch.object(app, "wsgi_app", ProxyFix(app.wsgi_app, x_for=1, x_proto=1))
+        for p in (falha_banco, limite_ip, limite_usuario, proxy):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _login(self, usuario, ip):
+        return self.cliente.post("/api/login", json={"username": usuario, "password": "errada"},
+                                 headers={"X-Forwarded-For": ip}, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+
+    def test_ips_diferentes_tem_limites_separados(self):
+        self.assertEqual(self._login("ana", "200.1.1.1").status_code, 401)
+        self.assertEqual(self._login("bia", "200.1.1.1").status_code, 401)
+        self.assertEqual(self._login("caio", "200.1.1.1").status_code, 429)
+
+        # mesmo proxy (REMOTE_ADDR), outro cliente: não herda o bloqueio
+        self.assertEqual(self._login("davi", "200.2.2.2").status_code, 401)
+
+    def test_senha_errada_de_outro_ip_nao_bloqueia_o_dono(self):
+        auth._limite_ip.maximo = 100
+        self.assertEqual(self._login("ana", "200.9.9.9").status_code, 401)
+        self.assertEqual(self._login("ana", "200.9.9.9").status_code, 401)
+        self.assertEqual(self._login("ana", "200.9.9.9").status_code, 429)
+
+        self.assertEqual(self._login("ana", "200.1.1.1").status_code, 401)
+
+
+class LimiteTentativasTest(unittest.TestCase):
+    def test_acima_do_maximo_de_chaves_esquece_as_mais_antigas(self):
+        limite = auth.LimiteTentativas(1, 300)
+        limite.MAX_CHAVES = 3
+        for chave in ("a", "b", "c"):
+            limite.registrar_falha(chave)
+        limite.registrar_falha("a")  # "a" volta para o fim; "b" passa a ser a mais antiga
+        limite.registrar_falha("d")
+
+        self.assertEqual(list(limite._falhas), ["c", "a", "d"])
+        self.assertEqual(limite.bloqueado_por("b"), 0)
+        self.assertGreater(limite.bloqueado_por("a"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
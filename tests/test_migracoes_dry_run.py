@@ -0,0 +1,67 @@
+# tests/test_migracoes_dry_run.py
+import importlib
+import sqlite3
+import unittest
+
+import migrador
+
+
+class MigradorSQLite(migrador.Migrador):
+    """Migrador em dry-run sobre um SQLite: leitura de verdade, tabela ou coluna faltando dá erro"""
+
+    def __init__(self, ddl):
+        self.linhas = []
+        super().__init__(dry_run=True, saida=self.linhas.append)
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("DATE_FORMAT", 2, lambda data, _formato: data and data[:7])
+        self.conn.executescript(ddl)
+
+    def consultar(self, sql, params=None):
+        return self.conn.execute(sql.replace("%s", "?"), params or []).fetchall()
+
+    def tabela_existe(self, tabela):
+        return bool(self.consultar("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                   [tabela]))
+
+    def coluna_existe(self, tabela, coluna):
+        return any(r["name"] == coluna for r in self.consultar(f"PRAGMA table_info({tabela})"))
+
+    def indice_existe(self, tabela, indice):
+        return False
+
+
+# banco de antes das colunas estruturadas do responsável (o que o antigo init_db deixava)
+BASE_ANTIGA = """
+CREATE TABLE familias_cestas (id INTEGER PRIMARY KEY, observacoes TEXT, ativo INTEGER DEFAULT 1);
+CREATE TABLE movimento_cestas (id INTEGER PRIMARY KEY, id_familia INT, data_entrega TEXT,
+                               quantidade_cestas INT);
+CREATE TABLE estoque_cestas (id INTEGER PRIMARY KEY, data_entrada TEXT, quantidade_entrada INT);
+INSERT INTO familias_cestas (id, observacoes) VALUES (1, 'Responsável: Ana'), (2, 'Responsável: Bia');
+INSERT INTO movimento_cestas (id_familia, data_entrega, quantidade_cestas)
+VALUES (1, '2024-01-10', 1), (2, '2024-02-03', 1);
+"""
+
+
+class DryRunTest(unittest.TestCase):
+    def _dry_run(self, ddl):
+        m = MigradorSQLite(ddl)
+        for _, nome in migrador.migracoes_disponiveis():
+            importlib.import_module(f"migrations.{nome}").aplicar(m)
+        return "\n".join(m.linhas)
+
+    def test_banco_antigo(self):
+        saida = self._dry_run(BASE_ANTIGA)
+        self.assertIn("ADD COLUMN responsavel_nome", saida)
+        self.assertIn("2 famílias a preencher", saida)
+        self.assertIn("2 meses de histórico a agregar", saida)
+
+    def test_banco_vazio(self):
+        saida = self._dry_run("")
+        self.assertIn("CREATE TABLE IF NOT EXISTS familias_cestas", saida)
+        self.assertIn("movimento_cestas ainda não existe", saida)
+        self.assertIn("familias_cestas ainda não existe", saida)
+
+
+if __name__ == "__main__":
+    unittest.main()
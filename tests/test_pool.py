@@ -0,0 +1,65 @@
+# tests/test_pool.py
+import threading
+import unittest
+
+from database import ConnectionPool
+
+
+class ConexaoFalsa:
+    def __init__(self, ping_ok=True):
+        self.ping_ok = ping_ok
+        self.pingando = threading.Event()
+        self.liberar_ping = threading.Event()
+        self.liberar_ping.set()
+        self.fechada = False
+
+    def ping(self, reconnect=False):
+        self.pingando.set()
+        self.liberar_ping.wait(5)
+        if not self.ping_ok:
+            raise ConnectionError("servidor foi embora")
+
+    def close(self):
+        self.fechada = True
+
+
+class PoolTest(unittest.TestCase):
+    def _pool(self, conexoes, **kwargs):
+        fila = list(conexoes)
+        return ConnectionPool(lambda: fila.pop(0), min_size=0, max_size=2, timeout=2,
+                              ping_interval=0, **kwargs)
+
+    def test_ping_nao_segura_o_lock(self):
+        lenta, outra = ConexaoFalsa(), ConexaoFalsa()
+        pool = self._pool([lenta, outra])
+        pool.checkin(pool.checkout())
+        lenta.liberar_ping.clear()
+
+        primeira = threading.Thread(target=pool.checkout)
+        primeira.start()
+        self.assertTrue(lenta.pingando.wait(2))
+
+        # com o ping da primeira travado na rede, o resto do pool segue andando
+        segunda = {}
+        t = threading.Thread(target=lambda: segunda.update(conn=pool.checkout()))
+        t.start()
+        t.join(1)
+        self.assertIs(segunda.get("conn"), outra)
+        self.assertEqual(pool.snapshot()["in_use"], 2)
+
+        lenta.liberar_ping.set()
+        primeira.join(2)
+
+    def test_ping_falho_descarta_e_abre_outra(self):
+        morta, nova = ConexaoFalsa(ping_ok=False), ConexaoFalsa()
+        pool = self._pool([morta, nova])
+        pool.checkin(pool.checkout())
+
+        self.assertIs(pool.checkout(), nova)
+        self.assertTrue(morta.fechada)
+        snapshot = pool.snapshot()
+        self.assertEqual((snapshot["open"], snapshot["discarded"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
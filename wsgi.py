@@ -0,0 +1,16 @@
+# wsgi.py
+"""
+Entrada de produção:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --port=5000 --threads=8 wsgi:app    # Windows / sem fork
+
+No waitress, some EVENTOS_MAX_CONEXOES às --threads (ou baixe o limite): ele
+não tem as threads extras dos streams que o gunicorn.conf.py reserva.
+
+O schema precisa estar migrado antes (python manage.py migrar); a subida só
+confere a versão e falha rápido se o banco estiver atrás do código.
+"""
+from routes import create_app
+
+app = create_app()